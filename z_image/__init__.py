@@ -0,0 +1,19 @@
+"""Headless Z-Image generation engine shared by the GUI and the command line."""
+
+from .embedding_cache import PromptEmbeddingCache
+from .engine import (
+    DEFAULT_GUIDANCE,
+    DEFAULT_MODEL,
+    DEFAULT_STEPS,
+    MODELS,
+    RESOLUTION_OPTIONS,
+    ZImageEngine,
+    adjust_dimensions_for_model,
+    describe_device,
+    parse_resolution,
+    read_prompts,
+    warm_imports,
+)
+from .manifest import BatchManifest
+from .placement import DEFAULT_PLACEMENT, PLACEMENTS
+from .writer import ImageWriter
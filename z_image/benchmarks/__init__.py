@@ -0,0 +1 @@
+"""Benchmarks for the Z-Image GUI and engine, runnable with ``python -m z_image.benchmarks.<name>``."""
@@ -0,0 +1,69 @@
+import json
+import os
+import platform
+import statistics
+import sys
+from datetime import datetime
+
+
+def environment():
+    """Describe the machine a benchmark ran on"""
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def summarize(samples):
+    """Median, min and max of a list of timings"""
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "runs": len(samples),
+    }
+
+
+def save_json(data, filepath):
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+def load_json(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def find_regressions(current, baseline, tolerance=0.2, higher_is_better=()):
+    """Compare two flat {metric: value} dicts
+
+    Returns a list of (metric, baseline, current) for every metric that got
+    worse by more than ``tolerance`` (a fraction). Metrics are assumed to be
+    costs (lower is better) unless listed in ``higher_is_better``.
+    """
+    regressions = []
+    for metric, old in baseline.items():
+        new = current.get(metric)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old <= 0:
+            continue
+        if metric in higher_is_better:
+            worse = new < old * (1 - tolerance)
+        else:
+            worse = new > old * (1 + tolerance)
+        if worse:
+            regressions.append((metric, old, new))
+    return regressions
+
+
+def report_regressions(regressions):
+    """Print regressions and return a process exit code"""
+    for metric, old, new in regressions:
+        print(f"REGRESSION {metric}: {old:.4g} -> {new:.4g}")
+    if not regressions:
+        print("No regressions against baseline")
+    return 1 if regressions else 0
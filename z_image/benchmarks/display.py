@@ -0,0 +1,177 @@
+"""Display benchmark: time from a finished image to its first pixels on screen.
+
+For each resolution a worker thread prepares the image for display
+(``z_image.display.prepare_display``: pyramid plus fitted render) the moment
+it is "ready", and posts it through ``UIUpdates`` to the main thread, which
+applies updates at the GUI's frame rate and hands the render to the canvas.
+Recorded are the median time to prepare a frame (work that used to block the
+Tk thread), the time the main thread spends on the handoff, and the time to
+first pixel from ready to handed over::
+
+    python -m z_image.benchmarks.display --json display.json
+    python -m z_image.benchmarks.display --baseline display.json
+    python -m z_image.benchmarks.display --tk --res 3840x2160,5120x2160 --canvas 1200x800
+
+Without ``--tk`` the handoff is a no-op, so the first pixel time covers
+preparing and queueing only; ``--tk`` converts the render to a ``PhotoImage``
+on a real canvas, which needs a display.
+
+With cv2 installed the same render is also made from a numpy array with
+``cv2.resize`` (``INTER_AREA``), including the conversion from the pipeline's
+PIL image, to check that PIL's pyramid is still the faster way here.
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+from PIL import Image
+
+from ..display import DEFAULT_CANVAS_SIZE, prepare_display
+from ..engine import RESOLUTION_OPTIONS, parse_resolution
+from ..ui_updates import DEFAULT_UPDATE_RATE, UIUpdates
+from ..viewport import visible_region
+from .common import environment, find_regressions, load_json, report_regressions, save_json, summarize
+from .encoders import test_image
+from .stages import parse_list
+from .ui_updates import drain_loop, tk_loop
+
+# The GUI's render margin around the visible part of the image
+RENDER_MARGIN = 128
+
+
+def show_once(image, canvas_size, rate, handoff, root=None):
+    """Prepare image in a worker and show it from the main loop; returns the shown frame"""
+    updates = UIUpdates(max_rate=rate)
+    state = {"finished": False, "frame": None}
+
+    def show(frame):
+        handoff(frame)
+        frame.shown()
+        state["frame"] = frame
+        state["finished"] = True
+
+    def prepare(ready_at):
+        updates.call(show, prepare_display(image, canvas_size, margin=RENDER_MARGIN, ready_at=ready_at))
+
+    worker = threading.Thread(target=prepare, name="z-image-benchmark-worker", args=(updates.clock(),))
+    worker.start()
+    if root is not None:
+        tk_loop(root, updates, state)
+    else:
+        drain_loop(updates, state)
+    worker.join()
+    state["frame"].pyramid.release()
+    return state["frame"]
+
+
+def cv2_render_times(image, frame, runs):
+    """Seconds to make frame's render with numpy and cv2 instead, per run; None without cv2"""
+    try:
+        import cv2
+        import numpy
+    except ImportError:
+        return None
+    region = visible_region(image.size, frame.zoom, frame.offset, frame.canvas_size, margin=RENDER_MARGIN)
+    if region is None:
+        return None
+    source_box, dest_box = region
+    left, top, right, bottom = (round(value) for value in source_box)
+    dest_size = (dest_box[2] - dest_box[0], dest_box[3] - dest_box[1])
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        pixels = numpy.asarray(image)[top:bottom, left:right]
+        Image.fromarray(cv2.resize(pixels, dest_size, interpolation=cv2.INTER_AREA))
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def run(resolutions, canvas_size, runs, rate=DEFAULT_UPDATE_RATE, use_tk=False):
+    results = {"environment": environment(), "loop": "tk" if use_tk else "plain",
+               "settings": {"canvas": list(canvas_size), "rate": rate}, "metrics": {}}
+    metrics = results["metrics"]
+    root = canvas = None
+    if use_tk:
+        import tkinter as tk
+        from PIL import ImageTk
+
+        root = tk.Tk()
+        root.title("Display benchmark")
+        canvas = tk.Canvas(root, width=canvas_size[0], height=canvas_size[1])
+        canvas.pack()
+
+        def handoff(frame, timings):
+            started = time.perf_counter()
+            canvas.delete("all")
+            if frame.image is not None:
+                canvas.image = ImageTk.PhotoImage(frame.image)
+                canvas.create_image(frame.dest_box[0], frame.dest_box[1], anchor=tk.NW, image=canvas.image)
+            canvas.update_idletasks()
+            timings.append(time.perf_counter() - started)
+    else:
+        def handoff(frame, timings):
+            timings.append(0.0)
+
+    for resolution in resolutions:
+        width, height = parse_resolution(resolution)
+        image = test_image(width, height)
+        prepare, tk_thread, first_pixel = [], [], []
+        # The first run warms up and is not recorded
+        for run_index in range(runs + 1):
+            timings = []
+            frame = show_once(image, canvas_size, rate, lambda frame: handoff(frame, timings), root)
+            if run_index:
+                prepare.append(frame.prepare_seconds)
+                tk_thread.extend(timings)
+                first_pixel.append(frame.first_pixel)
+        metrics[f"{resolution}/prepare_seconds"] = summarize(prepare)["median"]
+        metrics[f"{resolution}/first_pixel_seconds"] = summarize(first_pixel)["median"]
+        if use_tk:
+            metrics[f"{resolution}/handoff_seconds"] = summarize(tk_thread)["median"]
+        cv2_times = cv2_render_times(image, frame, runs)
+        if cv2_times:
+            metrics[f"{resolution}/cv2_render_seconds"] = summarize(cv2_times)["median"]
+        line = (f"{resolution}: prepare {metrics[f'{resolution}/prepare_seconds'] * 1000:.1f} ms (worker), "
+                f"first pixel {metrics[f'{resolution}/first_pixel_seconds'] * 1000:.1f} ms")
+        if use_tk:
+            line += f", Tk thread {metrics[f'{resolution}/handoff_seconds'] * 1000:.1f} ms"
+        if cv2_times:
+            line += f" (render with numpy and cv2: {metrics[f'{resolution}/cv2_render_seconds'] * 1000:.1f} ms)"
+        print(line)
+    if root is not None:
+        root.destroy()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the time from a finished image to its first pixels")
+    parser.add_argument("--res", default=",".join(RESOLUTION_OPTIONS),
+                        help="Comma separated resolutions (default: every GUI resolution option)")
+    parser.add_argument("--canvas", default="x".join(map(str, DEFAULT_CANVAS_SIZE)), help="Canvas size")
+    parser.add_argument("--runs", type=int, default=5, help="Recorded runs per resolution (after a warm-up)")
+    parser.add_argument("--rate", type=int, default=DEFAULT_UPDATE_RATE, help="Frames per second updates apply at")
+    parser.add_argument("--tk", action="store_true", help="Hand renders to a real Tk canvas (needs a display)")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown as a fraction")
+    parser.add_argument("--min-seconds", type=float, default=0.005,
+                        help="Ignore timings shorter than this in the baseline (timer noise)")
+    args = parser.parse_args(argv)
+
+    canvas_size = parse_resolution(args.canvas)
+    baseline = load_json(args.baseline) if args.baseline else None
+    results = run(parse_list(args.res), canvas_size, max(1, args.runs), max(1, args.rate), args.tk)
+    if args.json:
+        save_json(results, args.json)
+
+    exit_code = 0
+    if baseline is not None:
+        compared = {metric: value for metric, value in baseline["metrics"].items() if value >= args.min_seconds}
+        exit_code = report_regressions(find_regressions(results["metrics"], compared, args.tolerance))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
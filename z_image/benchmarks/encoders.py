@@ -0,0 +1,117 @@
+"""Output format benchmark: encode time and file size of each format at each resolution.
+
+Saves one image per resolution preset in every output format (see
+``z_image.encoders``) and records the median time to encode and write it
+and the size of the file::
+
+    python -m z_image.benchmarks.encoders --json encoders.json
+    python -m z_image.benchmarks.encoders --baseline encoders.json
+    python -m z_image.benchmarks.encoders --image outputs/zimage_1.png --formats png,png:1,jpeg:95
+
+The default test image is upsampled noise, smooth like a generated image,
+so it compresses about as well; ``--image`` resizes a real output to each
+resolution instead. ``npy`` needs numpy.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from ..encoders import FORMAT_PRESETS, OutputFormat
+from ..engine import RESOLUTION_OPTIONS, parse_resolution
+from ..placement import format_bytes
+from .common import environment, find_regressions, load_json, report_regressions, save_json, summarize
+from .stages import parse_list
+
+
+def test_image(width, height, source=None, seed=0):
+    """An RGB image of the given size: source resized, or smooth noise"""
+    if source is not None:
+        return source.resize((width, height), Image.Resampling.LANCZOS)
+    size = (max(1, width // 8), max(1, height // 8))
+    noise = random.Random(seed).randbytes(size[0] * size[1] * 3)
+    return Image.frombytes("RGB", size, noise).resize((width, height), Image.Resampling.BICUBIC)
+
+
+def run(resolutions, formats, runs, source=None, source_name="noise"):
+    results = {"environment": environment(), "source": source_name, "metrics": {}, "errors": {}}
+    metrics = results["metrics"]
+    formats = [OutputFormat.parse(spec) for spec in formats]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for resolution in resolutions:
+            width, height = parse_resolution(resolution)
+            image = test_image(width, height, source)
+            for output_format in formats:
+                key = f"{resolution}/{output_format.spec}"
+                path = os.path.join(directory, output_format.filename("image"))
+                samples = []
+                try:
+                    # The first run warms up the encoder and is not recorded
+                    for run_index in range(runs + 1):
+                        started = time.perf_counter()
+                        output_format.save(image, path)
+                        if run_index:
+                            samples.append(time.perf_counter() - started)
+                except Exception as e:
+                    results["errors"][key] = str(e)
+                    print(f"{key}: failed ({e})")
+                    continue
+                seconds = summarize(samples)["median"]
+                size = os.path.getsize(path)
+                metrics[f"{key}/encode_seconds"] = seconds
+                metrics[f"{key}/bytes"] = size
+                megapixels = width * height / 1e6
+                print(f"{key}: {seconds * 1000:.0f} ms ({megapixels / seconds:.0f} MP/s), {format_bytes(size)}")
+                os.remove(path)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and size each output format at each resolution")
+    parser.add_argument("--res", default=",".join(RESOLUTION_OPTIONS),
+                        help="Comma separated resolutions (default: every GUI resolution option)")
+    parser.add_argument("--formats", default=",".join(dict.fromkeys(FORMAT_PRESETS.values())),
+                        help="Comma separated output formats such as png,png:1,webp,webp:90,jpeg:95,npy")
+    parser.add_argument("--image", metavar="FILE", help="Encode this image (resized) instead of generated noise")
+    parser.add_argument("--runs", type=int, default=3, help="Recorded runs per configuration (after a warm-up)")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown or growth as a fraction")
+    parser.add_argument("--min-seconds", type=float, default=0.005,
+                        help="Ignore encode times shorter than this in the baseline (timer noise)")
+    args = parser.parse_args(argv)
+
+    formats = parse_list(args.formats)
+    for spec in formats:
+        try:
+            OutputFormat.parse(spec)
+        except ValueError as e:
+            parser.error(str(e))
+
+    source = None
+    if args.image:
+        with Image.open(args.image) as image:
+            source = image.convert("RGB")
+
+    baseline = load_json(args.baseline) if args.baseline else None
+    results = run(parse_list(args.res), formats, max(1, args.runs), source, args.image or "noise")
+    if args.json:
+        save_json(results, args.json)
+
+    exit_code = 1 if results["errors"] else 0
+    if baseline is not None:
+        compared = {metric: value for metric, value in baseline["metrics"].items()
+                    if not metric.endswith("_seconds") or value >= args.min_seconds}
+        exit_code = max(exit_code, report_regressions(
+            find_regressions(results["metrics"], compared, args.tolerance)))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
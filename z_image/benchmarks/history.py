@@ -0,0 +1,128 @@
+"""History benchmark: memory and latency of browsing many large results.
+
+Adds ``--results`` images to an ``ImageHistory`` (every ``--saved-every``-th
+one saved to a file first, like a batch output; the rest only in memory, like
+interactive generations), then views ``--views`` of them in random order.
+Recorded are the median and p95 time to add a result (thumbnail and any
+spill), to view one (a memory hit or a reload from disk) and the growth of
+the process's resident memory, which should level off near the history's
+memory cap however many results there are::
+
+    python -m z_image.benchmarks.history --json history.json
+    python -m z_image.benchmarks.history --baseline history.json
+    python -m z_image.benchmarks.history --res 3840x2160 --results 300 --memory-mb 256
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from ..encoders import save_image
+from ..engine import parse_resolution
+from ..history import DEFAULT_MAX_MEMORY_BYTES, ImageHistory
+from ..placement import format_bytes, host_resident_bytes
+from ..ui_updates import percentile
+from .common import environment, find_regressions, load_json, report_regressions, save_json, summarize
+from .encoders import test_image
+
+
+def run(width, height, count, views, max_memory_bytes, saved_every=2, seed=0):
+    rng = random.Random(seed)
+    add_times, view_times = [], []
+    rss_start = host_resident_bytes() or 0
+    rss_peak = rss_start
+
+    with tempfile.TemporaryDirectory(prefix="z_image_history_") as directory:
+        history = ImageHistory(os.path.join(directory, "history"), max_memory_bytes=max_memory_bytes,
+                               max_entries=count)
+        # A handful of distinct images, so making test images does not dominate
+        sources = [test_image(width, height, seed=index) for index in range(4)]
+        for index in range(count):
+            image = sources[index % len(sources)].copy()
+            path = None
+            if saved_every and index % saved_every == 0:
+                path = os.path.join(directory, f"output_{index:04d}.png")
+                save_image(image, path, "png:1")
+            started = time.perf_counter()
+            history.add(image, f"result {index}", path)
+            add_times.append(time.perf_counter() - started)
+            del image
+            rss_peak = max(rss_peak, host_resident_bytes() or 0)
+
+        entries = history.entries()
+        for _ in range(views):
+            entry = rng.choice(entries)
+            started = time.perf_counter()
+            # As the GUI does: the view is ready before older images are evicted for it
+            history.image(entry.id, trim=False)
+            view_times.append(time.perf_counter() - started)
+            history.trim()
+            rss_peak = max(rss_peak, host_resident_bytes() or 0)
+        describe = history.describe()
+        history.clear()
+
+    metrics = {
+        "add_median_seconds": summarize(add_times)["median"],
+        "add_p95_seconds": percentile(add_times, 0.95),
+        "view_median_seconds": summarize(view_times)["median"],
+        "view_p95_seconds": percentile(view_times, 0.95),
+        "rss_growth_bytes": max(0, rss_peak - rss_start),
+    }
+    return {
+        "environment": environment(),
+        "settings": {"width": width, "height": height, "results": count, "views": views,
+                     "max_memory_bytes": max_memory_bytes, "saved_every": saved_every},
+        "history": describe,
+        "metrics": metrics,
+    }
+
+
+def report(results):
+    metrics = results["metrics"]
+    settings = results["settings"]
+    print(f"{settings['results']} results at {settings['width']}x{settings['height']}, "
+          f"memory cap {format_bytes(settings['max_memory_bytes'])}: {results['history']}")
+    print(f"  add: median {metrics['add_median_seconds'] * 1000:.0f} ms, "
+          f"p95 {metrics['add_p95_seconds'] * 1000:.0f} ms")
+    print(f"  view: median {metrics['view_median_seconds'] * 1000:.0f} ms, "
+          f"p95 {metrics['view_p95_seconds'] * 1000:.0f} ms")
+    print(f"  resident memory grew by {format_bytes(metrics['rss_growth_bytes'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure memory and latency of a history of many large results")
+    parser.add_argument("--res", default="3840x2160", help="Resolution of every result")
+    parser.add_argument("--results", type=int, default=200, help="Results added to the history")
+    parser.add_argument("--views", type=int, default=100, help="Results viewed, in random order")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MAX_MEMORY_BYTES // (1024 * 1024),
+                        help="Memory cap for full images in MB")
+    parser.add_argument("--saved-every", type=int, default=2,
+                        help="Save every Nth result to a file first, like a batch output (0: none)")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown or growth as a fraction")
+    parser.add_argument("--min-seconds", type=float, default=0.005,
+                        help="Ignore timings shorter than this in the baseline (timer noise)")
+    args = parser.parse_args(argv)
+
+    width, height = parse_resolution(args.res)
+    baseline = load_json(args.baseline) if args.baseline else None
+    results = run(width, height, max(1, args.results), max(1, args.views), args.memory_mb * 1024 * 1024,
+                  max(0, args.saved_every))
+    report(results)
+    if args.json:
+        save_json(results, args.json)
+
+    exit_code = 0
+    if baseline is not None:
+        compared = {metric: value for metric, value in baseline["metrics"].items()
+                    if not metric.endswith("_seconds") or value >= args.min_seconds}
+        exit_code = report_regressions(find_regressions(results["metrics"], compared, args.tolerance))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""Stage benchmark: where the time goes between a prompt and a saved image.
+
+Every configuration of resolution, step count and batch size is timed per
+stage (text encoding, denoising loop, VAE decode, PIL conversion, display
+and save), together with peak memory and images per second::
+
+    python -m z_image.benchmarks.stages --json stages.json
+    python -m z_image.benchmarks.stages --baseline stages.json
+    python -m z_image.benchmarks.stages --pipeline model --res 1024x1024 --steps 4,8
+
+The default ``stub`` pipeline needs neither torch nor model weights. It does a
+small amount of real work that scales with resolution, steps and batch size,
+so the harness can be exercised on a CPU-only box. ``--pipeline model`` loads
+the real model through ``ZImageEngine``.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from ..display import prepare_display
+from ..engine import (
+    DEFAULT_GUIDANCE,
+    DEFAULT_MODEL,
+    MAX_SEQUENCE_LENGTH,
+    RESOLUTION_OPTIONS,
+    ZImageEngine,
+    adjust_dimensions_for_model,
+    make_generator,
+    parse_resolution,
+)
+from ..placement import DEFAULT_PLACEMENT, PLACEMENTS, host_resident_bytes
+from .common import environment, find_regressions, load_json, report_regressions, save_json, summarize
+
+STAGES = ["encode", "denoise", "decode", "to_pil", "display", "save"]
+
+PROMPT = "A peaceful forest with sunlight filtering through the trees"
+
+
+class StubStages:
+    """Torch-free stand-in for the pipeline stages
+
+    Latents are byte strings with the real latent layout (16 channels at 1/8
+    of the output resolution); each denoising step rewrites them, decoding
+    upsamples three channels to the output size.
+    """
+
+    name = "stub"
+    latent_channels = 16
+    embedding_bytes = 64 * 32
+
+    def encode(self, prompts):
+        return [hashlib.shake_256(prompt.encode("utf-8")).digest(self.embedding_bytes) for prompt in prompts]
+
+    def denoise(self, embeddings, width, height, steps, seed):
+        rng = random.Random(seed)
+        size = (width // 8) * (height // 8) * self.latent_channels
+        latents = [rng.randbytes(size) for _ in embeddings]
+        for step in range(steps):
+            table = bytes((value + step + 1) % 256 for value in range(256))
+            latents = [latent.translate(table) for latent in latents]
+        return latents, (width, height)
+
+    def decode(self, latents):
+        latents, (width, height) = latents
+        latent_size = (width // 8, height // 8)
+        plane = latent_size[0] * latent_size[1]
+        return [
+            Image.frombytes("RGB", latent_size, latent[:plane * 3]).resize((width, height), Image.Resampling.BILINEAR)
+            for latent in latents
+        ]
+
+    def to_pil(self, decoded):
+        return [image.convert("RGB") for image in decoded]
+
+    def sync(self):
+        pass
+
+
+class PipelineStages:
+    """The stages of a loaded ZImagePipeline, run one at a time"""
+
+    name = "model"
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.pipeline = engine.pipeline
+
+    def encode(self, prompts):
+        import torch
+
+        with torch.no_grad():
+            embeddings, _ = self.pipeline.encode_prompt(
+                prompt=list(prompts),
+                device=self.pipeline._execution_device,
+                do_classifier_free_guidance=False,
+                max_sequence_length=MAX_SEQUENCE_LENGTH,
+            )
+        return embeddings
+
+    def denoise(self, embeddings, width, height, steps, seed):
+        generator = [make_generator(seed + i) for i in range(len(embeddings))]
+        result = self.pipeline(
+            prompt_embeds=embeddings,
+            width=width,
+            height=height,
+            num_inference_steps=steps,
+            guidance_scale=DEFAULT_GUIDANCE,
+            generator=generator,
+            output_type="latent",
+        )
+        return result.images
+
+    def decode(self, latents):
+        import torch
+
+        vae = self.pipeline.vae
+        latents = latents.to(vae.dtype)
+        latents = (latents / vae.config.scaling_factor) + vae.config.shift_factor
+        with torch.no_grad():
+            return vae.decode(latents, return_dict=False)[0]
+
+    def to_pil(self, decoded):
+        return self.pipeline.image_processor.postprocess(decoded, output_type="pil")
+
+    def sync(self):
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+
+def display(image):
+    """The work done before Tk takes over a new image: pyramid plus fitted render"""
+    prepare_display(image).pyramid.release()
+
+
+def save(images, directory):
+    for i, image in enumerate(images):
+        image.save(os.path.join(directory, f"bench_{i:03d}.png"))
+
+
+def gpu_peak(reset=False):
+    """Peak GPU memory allocated since the last reset, or None without CUDA"""
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    if reset:
+        torch.cuda.reset_peak_memory_stats()
+    return torch.cuda.max_memory_allocated()
+
+
+def run_once(stages, width, height, steps, batch_size, seed, directory):
+    """Time every stage of one generation; returns ({stage: seconds}, peak host bytes)"""
+    times = {}
+    peak_host = 0
+
+    def timed(stage, func, *args):
+        nonlocal peak_host
+        started = time.perf_counter()
+        result = func(*args)
+        stages.sync()
+        times[stage] = time.perf_counter() - started
+        peak_host = max(peak_host, host_resident_bytes() or 0)
+        return result
+
+    embeddings = timed("encode", stages.encode, [PROMPT] * batch_size)
+    latents = timed("denoise", stages.denoise, embeddings, width, height, steps, seed)
+    decoded = timed("decode", stages.decode, latents)
+    images = timed("to_pil", stages.to_pil, decoded)
+    timed("display", display, images[0])
+    timed("save", save, images, directory)
+    return times, peak_host
+
+
+def run(stages, resolutions, step_counts, batch_sizes, runs, seed=0):
+    results = {"environment": environment(), "pipeline": stages.name, "metrics": {}, "errors": {}}
+    metrics = results["metrics"]
+
+    with tempfile.TemporaryDirectory(prefix="z_image_bench_") as directory:
+        for resolution in resolutions:
+            width, height = adjust_dimensions_for_model(*parse_resolution(resolution))
+            for steps in step_counts:
+                for batch_size in batch_sizes:
+                    key = f"{resolution}/steps{steps}/batch{batch_size}"
+                    samples = {stage: [] for stage in STAGES}
+                    peak_host = 0
+                    gpu_peak(reset=True)
+                    try:
+                        # The first run warms up caches and kernels and is not recorded
+                        for run_index in range(runs + 1):
+                            times, peak = run_once(stages, width, height, steps, batch_size, seed, directory)
+                            peak_host = max(peak_host, peak)
+                            if run_index:
+                                for stage in STAGES:
+                                    samples[stage].append(times[stage])
+                    except Exception as e:
+                        results["errors"][key] = str(e)
+                        print(f"{key}: failed ({e})")
+                        continue
+
+                    total = 0.0
+                    for stage in STAGES:
+                        seconds = summarize(samples[stage])["median"]
+                        metrics[f"{key}/{stage}_seconds"] = seconds
+                        total += seconds
+                    metrics[f"{key}/total_seconds"] = total
+                    metrics[f"{key}/images_per_second"] = batch_size / total if total else 0.0
+                    metrics[f"{key}/peak_host_bytes"] = peak_host
+                    peak_gpu = gpu_peak()
+                    if peak_gpu is not None:
+                        metrics[f"{key}/peak_gpu_bytes"] = peak_gpu
+
+                    breakdown = ", ".join(f"{stage} {metrics[f'{key}/{stage}_seconds'] * 1000:.0f}" for stage in STAGES)
+                    print(f"{key}: {metrics[f'{key}/images_per_second']:.2f} img/s ({breakdown} ms)")
+
+    return results
+
+
+def parse_list(value, convert=str):
+    return [convert(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of the generation path")
+    parser.add_argument("--pipeline", choices=["stub", "model"], default="stub",
+                        help="Stub pipeline (no torch or weights needed) or the real model")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Model for --pipeline model")
+    parser.add_argument("--placement", choices=list(PLACEMENTS), default=DEFAULT_PLACEMENT,
+                        help="Placement strategy for --pipeline model")
+    parser.add_argument("--res", default=",".join(RESOLUTION_OPTIONS),
+                        help="Comma separated resolutions (default: every GUI resolution option)")
+    parser.add_argument("--steps", default="4,8", help="Comma separated step counts")
+    parser.add_argument("--batch-sizes", default="1,2", help="Comma separated batch sizes")
+    parser.add_argument("--runs", type=int, default=1, help="Recorded runs per configuration (after a warm-up)")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown as a fraction")
+    parser.add_argument("--min-seconds", type=float, default=0.005,
+                        help="Ignore stage timings shorter than this in the baseline (timer noise)")
+    args = parser.parse_args(argv)
+
+    baseline = load_json(args.baseline) if args.baseline else None
+    if baseline is not None and baseline.get("pipeline") != args.pipeline:
+        parser.error(f"baseline was measured with the {baseline.get('pipeline')} pipeline, not {args.pipeline}")
+
+    if args.pipeline == "model":
+        engine = ZImageEngine(model_name=args.model, placement=args.placement, embedding_cache=False,
+                              status_callback=print)
+        engine.load_model()
+        stages = PipelineStages(engine)
+    else:
+        stages = StubStages()
+
+    results = run(stages, parse_list(args.res), parse_list(args.steps, int),
+                  parse_list(args.batch_sizes, int), max(1, args.runs))
+    if args.json:
+        save_json(results, args.json)
+
+    exit_code = 1 if results["errors"] else 0
+    if baseline is not None:
+        metrics = results["metrics"]
+        higher_is_better = [metric for metric in metrics if metric.endswith("images_per_second")]
+        compared = {
+            metric: value for metric, value in baseline["metrics"].items()
+            if not metric.endswith("_seconds") or value >= args.min_seconds
+        }
+        exit_code = max(exit_code, report_regressions(
+            find_regressions(metrics, compared, args.tolerance, higher_is_better)))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
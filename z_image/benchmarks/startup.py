@@ -0,0 +1,126 @@
+"""Startup benchmark: import cost of the GUI and time until its window is first drawn.
+
+Every measurement runs in a fresh interpreter so module caches do not hide
+import costs::
+
+    python -m z_image.benchmarks.startup --runs 5 --json startup.json
+    python -m z_image.benchmarks.startup --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from .common import environment, find_regressions, load_json, report_regressions, save_json, summarize
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules that must not be imported just to show the window
+HEAVY_MODULES = ["torch", "diffusers", "transformers", "cv2", "numpy"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy_modules": heavy}}))
+"""
+
+WINDOW_SCRIPT = """
+import json, sys, time
+import tkinter as tk
+import z_image_gui
+
+root = tk.Tk()
+app = z_image_gui.ZImageGUI(root)
+
+def first_frame():
+    print(json.dumps({"window_time": time.time()}), flush=True)
+    root.destroy()
+
+# Runs once the main loop has drawn the window for the first time
+root.after(0, first_frame)
+root.mainloop()
+"""
+
+
+def run_script(script):
+    """Run a snippet in a fresh interpreter and parse the JSON it prints"""
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT,
+                            capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_import(module, runs):
+    samples = []
+    heavy = []
+    for _ in range(runs):
+        data = run_script(IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES))
+        samples.append(data["seconds"])
+        heavy = data["heavy_modules"]
+    return samples, heavy
+
+
+def measure_first_window(runs):
+    samples = []
+    for _ in range(runs):
+        started = time.time()
+        data = run_script(WINDOW_SCRIPT)
+        samples.append(data["window_time"] - started)
+    return samples
+
+
+def run(runs):
+    results = {"environment": environment(), "metrics": {}, "heavy_modules_on_import": {}}
+    metrics = results["metrics"]
+
+    for module in ("z_image", "z_image_gui"):
+        samples, heavy = measure_import(module, runs)
+        metrics[f"import_{module}_seconds"] = summarize(samples)["median"]
+        results["heavy_modules_on_import"][module] = heavy
+        print(f"import {module}: {metrics[f'import_{module}_seconds'] * 1000:.0f} ms"
+              + (f" (pulls in {', '.join(heavy)})" if heavy else ""))
+
+    try:
+        samples = measure_first_window(runs)
+        metrics["time_to_first_window_seconds"] = summarize(samples)["median"]
+        print(f"time to first window: {metrics['time_to_first_window_seconds'] * 1000:.0f} ms")
+    except Exception as e:
+        # No display available (e.g. a headless CI box)
+        results["first_window_error"] = str(e)
+        print(f"time to first window: skipped ({e})")
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure GUI import and time-to-first-window")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown as a fraction")
+    args = parser.parse_args(argv)
+
+    results = run(args.runs)
+    if args.json:
+        save_json(results, args.json)
+
+    exit_code = 0
+    if any(results["heavy_modules_on_import"].values()):
+        print("REGRESSION heavy modules are imported before the window opens")
+        exit_code = 1
+    if args.baseline:
+        baseline = load_json(args.baseline)
+        exit_code = max(exit_code, report_regressions(
+            find_regressions(results["metrics"], baseline["metrics"], args.tolerance)))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
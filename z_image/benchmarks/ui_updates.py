@@ -0,0 +1,182 @@
+"""UI update benchmark: how far the status bar lags behind a fast batch.
+
+A batch runs through the stub pipeline in a worker thread, as the GUI's
+batch jobs do, and posts a status update per denoising step and per saved
+image through ``UIUpdates``. The main thread applies them at the GUI's
+frame rate, from a plain loop or (with ``--tk``) from a Tk main loop
+driving a label. Recorded are the latency of updates (posted to applied),
+the time spent applying them per frame, how late frames start, and how
+many updates were posted and applied per second::
+
+    python -m z_image.benchmarks.ui_updates --json ui.json
+    python -m z_image.benchmarks.ui_updates --baseline ui.json
+    python -m z_image.benchmarks.ui_updates --tk --rate 60 --seconds-per-step 0
+
+Needs neither torch nor model weights; ``--tk`` needs a display.
+"""
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+
+from ..engine import parse_resolution
+from ..progress import StepProgress, format_progress
+from ..stub import stub_engine
+from ..ui_updates import DEFAULT_UPDATE_RATE, UIUpdates, percentile
+from .common import environment, find_regressions, load_json, report_regressions, save_json
+
+PROMPT = "A peaceful forest with sunlight filtering through the trees"
+
+
+def run_batch(updates, set_status, state, count, width, height, steps, batch_size, seconds_per_step, directory):
+    """The worker side: generate a batch, posting every status change"""
+    def on_progress(step, total_steps, seconds, eta):
+        updates.latest("status", set_status, format_progress(step, total_steps, seconds, eta))
+
+    def on_saved(done, total, filename):
+        updates.latest("status", set_status, f"Batch: {done}/{total} images saved")
+
+    try:
+        engine = stub_engine(seconds_per_step=seconds_per_step)
+        engine.batch_generate([f"{PROMPT} {index}" for index in range(count)], width, height, steps,
+                              output_dir=directory, batch_size=batch_size, seed=0,
+                              step_callback=StepProgress(on_progress=on_progress), progress_callback=on_saved)
+    except Exception as e:
+        state["error"] = str(e)
+    finally:
+        # Posted last, so the run ends once everything before it has been applied
+        updates.call(state.__setitem__, "finished", True)
+
+
+def drain_loop(updates, state):
+    """Apply updates at the frame rate the way root.after would; returns how late each frame started"""
+    interval = updates.interval_ms / 1000
+    late = []
+    next_frame = time.perf_counter() + interval
+    while not state["finished"]:
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+        late.append(max(0.0, time.perf_counter() - next_frame))
+        updates.drain()
+        next_frame = time.perf_counter() + interval
+    return late
+
+
+def tk_loop(root, updates, state):
+    """Apply updates from a Tk main loop; returns how late each frame started"""
+    late = []
+
+    def frame(expected):
+        late.append(max(0.0, time.perf_counter() - expected))
+        updates.drain()
+        if state["finished"]:
+            root.quit()
+            return
+        root.after(updates.interval_ms, frame, time.perf_counter() + updates.interval_ms / 1000)
+
+    root.after(updates.interval_ms, frame, time.perf_counter() + updates.interval_ms / 1000)
+    root.mainloop()
+    return late
+
+
+def run(count, width, height, steps, batch_size, seconds_per_step, rate=DEFAULT_UPDATE_RATE, use_tk=False):
+    updates = UIUpdates(max_rate=rate)
+    state = {"finished": False, "error": None, "status": None}
+    root = None
+    if use_tk:
+        import tkinter as tk
+
+        root = tk.Tk()
+        root.title("UI update benchmark")
+        status = tk.StringVar(root, value="Ready")
+        tk.Label(root, textvariable=status, width=60, anchor=tk.W).pack(fill=tk.X)
+        set_status = status.set
+    else:
+        set_status = lambda message: state.__setitem__("status", message)
+
+    with tempfile.TemporaryDirectory() as directory:
+        worker = threading.Thread(target=run_batch, name="z-image-benchmark-worker",
+                                  args=(updates, set_status, state, count, width, height, steps, batch_size,
+                                        seconds_per_step, directory))
+        started = time.perf_counter()
+        worker.start()
+        late = tk_loop(root, updates, state) if root is not None else drain_loop(updates, state)
+        elapsed = time.perf_counter() - started
+        worker.join()
+    if root is not None:
+        root.destroy()
+
+    stats = updates.stats()
+    metrics = {
+        "latency_median_seconds": stats["latency"]["median"],
+        "latency_p95_seconds": stats["latency"]["p95"],
+        "latency_max_seconds": stats["latency"]["max"],
+        "drain_max_seconds": stats["drain"]["max"],
+        "frame_late_p95_seconds": percentile(late, 0.95),
+        "posted_per_second": stats["posted"] / elapsed,
+        "applied_per_second": stats["applied"] / elapsed,
+    }
+    return {
+        "environment": environment(),
+        "loop": "tk" if use_tk else "plain",
+        "settings": {"prompts": count, "width": width, "height": height, "steps": steps, "batch_size": batch_size,
+                     "seconds_per_step": seconds_per_step, "rate": rate},
+        "seconds": elapsed,
+        "counts": {key: stats[key] for key in ("posted", "coalesced", "applied", "failed")},
+        "metrics": metrics,
+        "error": state["error"],
+    }
+
+
+def report(results):
+    metrics = results["metrics"]
+    counts = results["counts"]
+    print(f"{results['loop']} loop at {results['settings']['rate']} frames/s, {results['seconds']:.2f} s")
+    print(f"  updates: {counts['posted']} posted ({metrics['posted_per_second']:.0f}/s), "
+          f"{counts['applied']} applied ({metrics['applied_per_second']:.0f}/s), {counts['coalesced']} coalesced")
+    print(f"  latency: median {metrics['latency_median_seconds'] * 1000:.1f} ms, "
+          f"p95 {metrics['latency_p95_seconds'] * 1000:.1f} ms, max {metrics['latency_max_seconds'] * 1000:.1f} ms")
+    print(f"  frames: longest drain {metrics['drain_max_seconds'] * 1000:.2f} ms, "
+          f"p95 late start {metrics['frame_late_p95_seconds'] * 1000:.1f} ms")
+    if results["error"]:
+        print(f"  batch failed: {results['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how far GUI updates lag behind a fast stub batch")
+    parser.add_argument("--prompts", type=int, default=64, help="Prompts in the batch")
+    parser.add_argument("--res", default="256x256", help="Image resolution")
+    parser.add_argument("--steps", type=int, default=8, help="Denoising steps per image")
+    parser.add_argument("--batch-size", type=int, default=4, help="Prompts per pipeline call")
+    parser.add_argument("--seconds-per-step", type=float, default=0.001,
+                        help="Time the stub pipeline sleeps per step (0: as fast as possible)")
+    parser.add_argument("--rate", type=int, default=DEFAULT_UPDATE_RATE, help="Frames per second updates apply at")
+    parser.add_argument("--tk", action="store_true", help="Apply updates from a Tk main loop (needs a display)")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown as a fraction")
+    parser.add_argument("--min-seconds", type=float, default=0.001,
+                        help="Ignore timings shorter than this in the baseline (timer noise)")
+    args = parser.parse_args(argv)
+
+    width, height = parse_resolution(args.res)
+    baseline = load_json(args.baseline) if args.baseline else None
+    results = run(args.prompts, width, height, args.steps, max(1, args.batch_size), args.seconds_per_step,
+                  max(1, args.rate), args.tk)
+    report(results)
+    if args.json:
+        save_json(results, args.json)
+
+    exit_code = 1 if results["error"] else 0
+    if baseline is not None:
+        # Only the latencies are costs; update counts follow the batch speed
+        compared = {metric: value for metric, value in baseline["metrics"].items()
+                    if metric.endswith("_seconds") and value >= args.min_seconds}
+        exit_code = max(exit_code, report_regressions(
+            find_regressions(results["metrics"], compared, args.tolerance)))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
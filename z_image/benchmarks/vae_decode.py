@@ -0,0 +1,233 @@
+"""VAE decode benchmark: whole-image decoding against tiled and sliced decoding.
+
+Decodes random latents at every GUI resolution preset in each decode mode
+and records time, peak GPU and host memory, and the largest pixel
+difference from the whole-image decode (a visible seam shows up there)::
+
+    python -m z_image.benchmarks.vae_decode --json vae.json
+    python -m z_image.benchmarks.vae_decode --baseline vae.json
+    python -m z_image.benchmarks.vae_decode --res 2048x2048,3840x2160,5120x2160 --batch-sizes 1,2
+
+Only the VAE is loaded. ``--weights random`` builds the Z-Image VAE
+architecture with random weights, which needs no download and has the same
+memory and time profile. Running out of memory is recorded as a result,
+not a failure: that is what tiling is for.
+"""
+
+import argparse
+import gc
+import sys
+import threading
+import time
+
+from ..engine import (
+    DEFAULT_MODEL,
+    DEFAULT_TILE_OVERLAP,
+    RESOLUTION_OPTIONS,
+    adjust_dimensions_for_model,
+    configure_vae_decode,
+    is_out_of_memory,
+    parse_resolution,
+)
+from ..placement import format_bytes, host_resident_bytes
+from .common import environment, find_regressions, load_json, report_regressions, save_json, summarize
+from .stages import gpu_peak, parse_list
+
+# Decode mode -> (tiled, sliced)
+MODES = {
+    "full": (False, False),
+    "tiled": (True, False),
+    "sliced": (False, True),
+    "tiled+sliced": (True, True),
+}
+
+# Architecture of the Z-Image VAE, for --weights random
+VAE_CONFIG = {
+    "in_channels": 3,
+    "out_channels": 3,
+    "latent_channels": 16,
+    "block_out_channels": [128, 256, 512, 512],
+    "down_block_types": ["DownEncoderBlock2D"] * 4,
+    "up_block_types": ["UpDecoderBlock2D"] * 4,
+    "layers_per_block": 2,
+    "norm_num_groups": 32,
+    "use_quant_conv": False,
+    "use_post_quant_conv": False,
+}
+
+
+def load_vae(model_name, weights, device):
+    import torch
+    from diffusers import AutoencoderKL
+
+    if weights == "random":
+        vae = AutoencoderKL(**VAE_CONFIG)
+    else:
+        vae = AutoencoderKL.from_pretrained(model_name, subfolder="vae")
+    # Half precision on the GPU as in the pipeline; bfloat16 convolutions are slow on most CPUs
+    dtype = torch.bfloat16 if device.startswith("cuda") else torch.float32
+    return vae.to(device=device, dtype=dtype).eval()
+
+
+class HostPeak:
+    """Samples the resident set size in a background thread to catch short-lived peaks"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="z-image-host-peak", daemon=True)
+
+    def _sample(self):
+        while True:
+            self.peak = max(self.peak, host_resident_bytes() or 0)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, host_resident_bytes() or 0)
+
+
+def sync():
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def release():
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def decode(vae, latents):
+    import torch
+
+    with torch.no_grad():
+        images = vae.decode(latents, return_dict=False)[0]
+    sync()
+    return images
+
+
+def run(vae, resolutions, modes, batch_sizes, runs, seed=0, tile_overlap=DEFAULT_TILE_OVERLAP):
+    import torch
+
+    results = {"environment": environment(), "device": str(vae.device), "metrics": {}, "errors": {},
+               "out_of_memory": []}
+    metrics = results["metrics"]
+    channels = vae.config.latent_channels
+
+    for resolution in resolutions:
+        width, height = adjust_dimensions_for_model(*parse_resolution(resolution))
+        for batch_size in batch_sizes:
+            generator = torch.Generator().manual_seed(seed)
+            latents = torch.randn((batch_size, channels, height // 8, width // 8), generator=generator)
+            latents = latents.to(device=vae.device, dtype=vae.dtype)
+            reference = None
+            for mode in modes:
+                key = f"{resolution}/batch{batch_size}/{mode}"
+                configure_vae_decode(vae, *MODES[mode], tile_overlap=tile_overlap)
+                release()
+                gpu_peak(reset=True)
+                samples = []
+                images = None
+                try:
+                    with HostPeak() as host:
+                        # The first run warms up kernels and is not recorded
+                        for run_index in range(runs + 1):
+                            images = None
+                            started = time.perf_counter()
+                            images = decode(vae, latents)
+                            if run_index:
+                                samples.append(time.perf_counter() - started)
+                except Exception as e:
+                    images = None
+                    release()
+                    if is_out_of_memory(e):
+                        results["out_of_memory"].append(key)
+                        print(f"{key}: out of memory")
+                    else:
+                        results["errors"][key] = str(e)
+                        print(f"{key}: failed ({e})")
+                    continue
+
+                seconds = summarize(samples)["median"]
+                metrics[f"{key}/seconds"] = seconds
+                metrics[f"{key}/peak_host_bytes"] = host.peak
+                peak_gpu = gpu_peak()
+                if peak_gpu is not None:
+                    metrics[f"{key}/peak_gpu_bytes"] = peak_gpu
+
+                images = images.float().cpu()
+                line = f"{key}: {seconds * 1000:.0f} ms, peak host {format_bytes(host.peak)}"
+                if peak_gpu is not None:
+                    line += f", peak GPU {format_bytes(peak_gpu)}"
+                if mode == "full":
+                    reference = images
+                elif reference is not None:
+                    # Decoder output is in [-1, 1]; tile seams show up as large local differences
+                    difference = (images - reference).abs().max().item()
+                    metrics[f"{key}/max_abs_diff"] = difference
+                    line += f", max difference from full {difference:.4f}"
+                print(line)
+            reference = None
+            del latents
+            release()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare whole-image, tiled and sliced VAE decoding")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Model whose VAE is loaded")
+    parser.add_argument("--weights", choices=["pretrained", "random"], default="pretrained",
+                        help="Load the model's VAE weights, or the same architecture with random weights")
+    parser.add_argument("--device", default=None, help="Device to decode on (default: cuda if available, else cpu)")
+    parser.add_argument("--res", default=",".join(RESOLUTION_OPTIONS),
+                        help="Comma separated resolutions (default: every GUI resolution option)")
+    parser.add_argument("--modes", default="full,tiled",
+                        help=f"Comma separated decode modes out of {', '.join(MODES)}")
+    parser.add_argument("--batch-sizes", default="1", help="Comma separated batch sizes")
+    parser.add_argument("--tile-overlap", type=float, default=DEFAULT_TILE_OVERLAP,
+                        help="Overlap between neighbouring tiles as a fraction of the tile size")
+    parser.add_argument("--runs", type=int, default=1, help="Recorded runs per configuration (after a warm-up)")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against a previous --json result")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown or growth as a fraction")
+    args = parser.parse_args(argv)
+
+    modes = parse_list(args.modes)
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown decode mode: {unknown[0]}")
+    # Differences are measured against the whole-image decode, so it runs first
+    modes.sort(key=lambda mode: mode != "full")
+
+    import torch
+
+    device = args.device or ("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Loading the VAE of {args.model} ({args.weights} weights) on {device}...")
+    vae = load_vae(args.model, args.weights, device)
+
+    baseline = load_json(args.baseline) if args.baseline else None
+    results = run(vae, parse_list(args.res), modes, parse_list(args.batch_sizes, int), max(1, args.runs),
+                  tile_overlap=args.tile_overlap)
+    if args.json:
+        save_json(results, args.json)
+
+    exit_code = 1 if results["errors"] else 0
+    if baseline is not None:
+        exit_code = max(exit_code, report_regressions(
+            find_regressions(results["metrics"], baseline["metrics"], args.tolerance)))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
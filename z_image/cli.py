@@ -0,0 +1,369 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from .compiled import COMPILE_MODES, CompileCache
+from .embedding_cache import PromptEmbeddingCache
+from .encoders import DEFAULT_OUTPUT_FORMAT, OutputFormat
+from .engine import (
+    DEFAULT_GUIDANCE,
+    DEFAULT_MODEL,
+    DEFAULT_STEPS,
+    DEFAULT_TILED_DECODE_PIXELS,
+    TILED_DECODE_MODES,
+    RESOLUTION_OPTIONS,
+    ZImageEngine,
+    adjust_dimensions_for_model,
+    parse_resolution,
+)
+from .manifest import BatchManifest
+from .memory import MemoryEstimator
+from .placement import DEFAULT_PLACEMENT, PLACEMENTS, format_bytes
+from .progress import StepProgress, format_progress
+from .prompts import PromptFile, open_prompts
+
+
+def output_format_spec(value):
+    try:
+        return OutputFormat.parse(value).spec
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def build_parser():
+    # No abbreviations: "--res" after the subcommand must not be taken for "--result-cache"
+    parser = argparse.ArgumentParser(prog="z_image", description="Headless Z-Image generation", allow_abbrev=False)
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Model name or path")
+    parser.add_argument("--quiet", action="store_true", help="Only print errors")
+    parser.add_argument("--placement", choices=list(PLACEMENTS), default=DEFAULT_PLACEMENT,
+                        help="Where to keep the weights: full GPU, model/sequential CPU offload, or CPU only")
+    parser.add_argument("--full-cpu-mem-load", action="store_true",
+                        help="Load weights without low_cpu_mem_usage (higher peak host RAM)")
+    parser.add_argument("--embedding-cache", metavar="DIR", default=None,
+                        help="Persist encoded prompt embeddings to DIR so they survive restarts")
+    parser.add_argument("--embedding-cache-mb", type=int, default=256,
+                        help="Memory budget for cached prompt embeddings (0 disables the cache)")
+    parser.add_argument("--result-cache", metavar="DIR", default=None,
+                        help="Reuse seeded images generated before with identical settings, stored in DIR")
+    parser.add_argument("--result-cache-mb", type=int, default=2048, help="Size cap of the result cache")
+    parser.add_argument("--tiled-decode", choices=TILED_DECODE_MODES, default="auto",
+                        help="Decode the VAE in overlapping tiles: above --tiled-decode-pixels (auto), always or never")
+    parser.add_argument("--tiled-decode-pixels", type=int, default=DEFAULT_TILED_DECODE_PIXELS,
+                        help="Pixel count above which --tiled-decode auto tiles")
+    parser.add_argument("--memory-profile", metavar="FILE", default=None,
+                        help="Keep the GPU memory model fitted by 'calibrate' and by every generation in FILE")
+    parser.add_argument("--no-memory-check", action="store_true",
+                        help="Do not check that a job fits in GPU memory before it runs")
+    parser.add_argument("--no-auto-offload", action="store_true",
+                        help="Reject a job that does not fit instead of switching to CPU offload")
+    parser.add_argument("--compile", choices=COMPILE_MODES, default="off",
+                        help="Compile the transformer with torch.compile in this mode (each new size compiles once)")
+    parser.add_argument("--compile-cache", metavar="DIR", default=None,
+                        help="Keep compiled graphs in DIR so later runs skip recompiling")
+    parser.add_argument("--format", dest="output_format", type=output_format_spec, default=DEFAULT_OUTPUT_FORMAT,
+                        metavar="FORMAT",
+                        help="Format of saved images: png, png:LEVEL (0-9, 1 is fast), webp (lossless), "
+                             "webp:QUALITY, jpeg:QUALITY or npy (raw NumPy array)")
+    parser.add_argument("--progress", action="store_true", help="Print time per step and ETA after every step")
+    parser.add_argument("--metrics-log", metavar="FILE", default=None,
+                        help="Append one JSON line per generation (parameters, stage timings, bytes) to FILE")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--stub-pipeline", action="store_true",
+                        help="Use a tiny stand-in pipeline instead of the model (for testing without weights)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Use the warm model of a running 'z_image serve' daemon when available")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_image_options(sub):
+        sub.add_argument("--res", default="1024x1024", help="Resolution as WIDTHxHEIGHT")
+        sub.add_argument("--steps", type=int, default=DEFAULT_STEPS, help="Number of inference steps")
+        sub.add_argument("--guidance", type=float, default=DEFAULT_GUIDANCE, help="Guidance scale")
+
+    def add_devices_option(sub):
+        sub.add_argument("--devices", nargs="+", metavar="DEVICE", default=None,
+                         help="Split the batch across one worker process per device: cuda:N, cpu or cpu:0-7")
+
+    generate_parser = subparsers.add_parser("generate", help="Generate a single image")
+    generate_parser.add_argument("prompt", help="Text prompt")
+    generate_parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    generate_parser.add_argument("--out", default=None,
+                                 help="Output file (default: outputs/zimage_<timestamp> with the --format extension)")
+    add_image_options(generate_parser)
+
+    batch_parser = subparsers.add_parser("batch", help="Generate one image per line of a prompts file")
+    batch_parser.add_argument("prompts_file",
+                              help="Text file with one prompt per line, or a .jsonl/.csv file whose lines may set "
+                                   "their own resolution, steps, guidance, seed and name")
+    batch_parser.add_argument("--out", default="outputs", help="Output directory")
+    batch_parser.add_argument("--batch-size", type=int, default=1,
+                              help="Prompts per pipeline call (halved automatically on out-of-memory)")
+    batch_parser.add_argument("--seed", type=int, default=None,
+                              help="Base seed; prompt i uses seed + i unless it sets its own")
+    batch_parser.add_argument("--no-manifest", action="store_true",
+                              help="Do not write a manifest (the batch cannot be resumed)")
+    add_devices_option(batch_parser)
+    add_image_options(batch_parser)
+
+    resume_parser = subparsers.add_parser("resume", help="Finish an interrupted batch from its manifest")
+    resume_parser.add_argument("manifest", help="The batch_<id>.manifest.jsonl file in the batch's output directory")
+    resume_parser.add_argument("--batch-size", type=int, default=1, help="Prompts per pipeline call")
+    add_devices_option(resume_parser)
+
+    subparsers.add_parser("calibrate", help="Measure GPU memory use to calibrate the pre-flight memory check")
+
+    warmup_parser = subparsers.add_parser("warmup", help="Compile the transformer for the given sizes and report timings")
+    warmup_parser.add_argument("resolutions", nargs="*", default=["1024x1024"], help="Sizes as WIDTHxHEIGHT")
+    warmup_parser.add_argument("--batch-size", type=int, default=1, help="Prompts per pipeline call to compile for")
+
+    serve_parser = subparsers.add_parser("serve", help="Keep models loaded and serve generation jobs on localhost")
+    serve_parser.add_argument("--host", default=None, help="Address to bind (default 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=None, help="Port to listen on (default 7861)")
+    serve_parser.add_argument("--no-preload", action="store_true", help="Load the model on the first request")
+
+    return parser
+
+
+def run_daemon(args, report):
+    from . import daemon
+
+    default_host, default_port = daemon.daemon_address()
+    metrics = make_metrics(args, report)
+    result_cache = make_result_cache(args)
+
+    def engine_factory(model_name, placement):
+        if args.stub_pipeline:
+            from .stub import stub_engine
+            return stub_engine(model_name, placement, status_callback=report)
+        engine = ZImageEngine(model_name=model_name, placement=placement, status_callback=report,
+                              embedding_cache=make_embedding_cache(args), metrics=metrics,
+                              result_cache=result_cache, **engine_options(args))
+        engine.load_model(low_cpu_mem_usage=not args.full_cpu_mem_load)
+        return engine
+
+    daemon.serve(args.host or default_host, args.port or default_port,
+                 preload=None if args.no_preload else args.model, placement=args.placement,
+                 status_callback=report, engine_factory=engine_factory)
+    return 0
+
+
+def engine_options(args):
+    """ZImageEngine arguments for VAE decoding, the memory check, compilation and the output format"""
+    options = {"tiled_decode": args.tiled_decode, "tiled_decode_pixels": args.tiled_decode_pixels,
+               "offload_on_low_memory": not args.no_auto_offload, "compile_mode": args.compile,
+               "output_format": args.output_format}
+    if args.compile_cache:
+        options["compile_cache"] = CompileCache(args.compile_cache)
+    if args.no_memory_check:
+        options["memory_estimator"] = False
+    elif args.memory_profile:
+        options["memory_estimator"] = MemoryEstimator(args.memory_profile)
+    return options
+
+
+def report_memory_estimates(engine, report):
+    """Print the predicted peak GPU memory of one image at each resolution option"""
+    for resolution in RESOLUTION_OPTIONS:
+        width, height = adjust_dimensions_for_model(*parse_resolution(resolution))
+        peak = engine.estimate_memory(width, height)
+        report(f"  {resolution}: {format_bytes(peak)}")
+
+
+def make_embedding_cache(args):
+    if args.embedding_cache_mb > 0:
+        return PromptEmbeddingCache(args.embedding_cache_mb * 1024 * 1024, disk_dir=args.embedding_cache)
+    return False
+
+
+def make_result_cache(args):
+    if not args.result_cache:
+        return None
+    from .result_cache import ResultCache
+    return ResultCache(args.result_cache, args.result_cache_mb * 1024 * 1024)
+
+
+def make_metrics(args, report):
+    """MetricsRecorder for --metrics-log/--metrics-port, or None when both are off"""
+    if not args.metrics_log and args.metrics_port is None:
+        return None
+    from .metrics import MetricsRecorder, MetricsRegistry, MetricsServer
+
+    registry = None
+    if args.metrics_port is not None:
+        registry = MetricsRegistry()
+        server = MetricsServer(registry, port=args.metrics_port).start()
+        report(f"Metrics available at {server.url}")
+    return MetricsRecorder(args.metrics_log, registry)
+
+
+def load_prompts(path, report):
+    """Read a prompts file, streaming it from disk when it is large"""
+    prompts = open_prompts(path)
+    if isinstance(prompts, PromptFile):
+        report(f"Streaming prompts from {prompts.describe()}")
+    return prompts
+
+
+def run_pool(args, report):
+    """Run a batch (or resume one) on a pool of worker processes"""
+    from .pool import WorkerPool, pool_engine_factory
+    from .stub import stub_engine
+
+    if args.command == "resume":
+        manifest = BatchManifest.load(args.manifest)
+        report(f"Resuming {args.manifest}: {manifest.describe()}")
+    else:
+        width, height = parse_resolution(args.res)
+        try:
+            prompts = load_prompts(args.prompts_file, report)
+        except (OSError, ValueError) as e:
+            print(f"Cannot read prompts: {e}", file=sys.stderr)
+            return 1
+        if not prompts:
+            print(f"No prompts found in {args.prompts_file}", file=sys.stderr)
+            return 1
+        manifest = BatchManifest.create(args.out, prompts, width, height, args.steps, args.guidance,
+                                        seed=args.seed, model=args.model, output_format=args.output_format)
+        report(f"Manifest: {manifest.path}")
+
+    if args.stub_pipeline:
+        engine_factory = stub_engine
+    else:
+        engine_factory = pool_engine_factory(not args.full_cpu_mem_load, **engine_options(args))
+    model_name = manifest.header.get("model") or args.model
+    try:
+        with WorkerPool(args.devices, model_name=model_name, placement=args.placement,
+                        engine_factory=engine_factory, status_callback=report) as pool:
+            pool.run(manifest, batch_size=args.batch_size)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        print(f"Resume with: python -m z_image resume {manifest.path}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    def report(message):
+        if not args.quiet:
+            print(message, flush=True)
+
+    if args.command == "serve":
+        return run_daemon(args, report)
+    if args.command in ("batch", "resume") and args.devices:
+        return run_pool(args, report)
+
+    engine = None
+    if args.daemon:
+        from .daemon import DaemonClient
+        client = DaemonClient(model_name=args.model, status_callback=report)
+        if client.is_available():
+            engine = client
+        else:
+            report(f"No daemon at {client.url}, loading the model in-process")
+    if engine is None and args.stub_pipeline:
+        from .stub import stub_engine
+        engine = stub_engine(args.model, status_callback=report)
+    if engine is None:
+        engine = ZImageEngine(model_name=args.model, status_callback=report,
+                              embedding_cache=make_embedding_cache(args), placement=args.placement,
+                              metrics=make_metrics(args, report), result_cache=make_result_cache(args),
+                              **engine_options(args))
+
+    model_name = None
+    if args.command in ("calibrate", "warmup"):
+        if not hasattr(engine, "calibrate_memory"):
+            print(f"Run {args.command} without --daemon, in the process that runs the model", file=sys.stderr)
+            return 1
+        if args.command == "warmup":
+            try:
+                sizes = [parse_resolution(resolution) for resolution in args.resolutions]
+            except ValueError:
+                print(f"Invalid resolution in: {' '.join(args.resolutions)}", file=sys.stderr)
+                return 2
+    elif args.command == "resume":
+        try:
+            manifest = BatchManifest.load(args.manifest)
+        except (OSError, ValueError) as e:
+            print(f"Cannot resume: {e}", file=sys.stderr)
+            return 1
+        model_name = manifest.header.get("model")
+        report(f"Resuming {args.manifest}: {manifest.describe()}")
+    else:
+        try:
+            width, height = parse_resolution(args.res)
+        except ValueError:
+            print(f"Invalid resolution: {args.res}", file=sys.stderr)
+            return 2
+
+    if args.command == "batch":
+        try:
+            prompts = load_prompts(args.prompts_file, report)
+        except (OSError, ValueError) as e:
+            print(f"Cannot read prompts: {e}", file=sys.stderr)
+            return 1
+        if not prompts:
+            print(f"No prompts found in {args.prompts_file}", file=sys.stderr)
+            return 1
+
+    manifest_path = None
+    try:
+        if engine.is_loaded:
+            device = engine.device_description
+        else:
+            device = engine.load_model(model_name, placement=args.placement,
+                                       low_cpu_mem_usage=not args.full_cpu_mem_load)
+        report(f"Device: {device} [{PLACEMENTS[engine.active_placement]}], {engine.memory_description}")
+
+        step_callback = None
+        if args.progress:
+            step_callback = StepProgress(on_progress=lambda *state: report(format_progress(*state)))
+
+        if args.command == "calibrate":
+            model = engine.calibrate_memory()
+            report(f"GPU memory model: {model.describe()}")
+            report("Predicted peak GPU memory of one image:")
+            report_memory_estimates(engine, report)
+            if not args.memory_profile:
+                report("Pass --memory-profile FILE to keep this calibration for later runs")
+        elif args.command == "warmup":
+            if engine.compile_stats is None:
+                report("The transformer is not compiled (pass --compile); timing eager steps instead")
+            for width, height in sizes:
+                engine.warm_up(width, height, batch_size=args.batch_size)
+        elif args.command == "generate":
+            image = engine.generate(args.prompt, width, height, args.steps, args.guidance, args.seed,
+                                    step_callback=step_callback)
+            out = args.out
+            if not out:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                name = OutputFormat.parse(args.output_format).filename(f"zimage_{timestamp}")
+                out = os.path.join(engine.output_dir, name)
+            engine.save_image(image, out, args.output_format)
+            report(f"Image saved: {out}")
+        elif args.command == "resume":
+            manifest_path = manifest.path
+            engine.resume_batch(manifest, batch_size=args.batch_size, step_callback=step_callback)
+        else:
+            manifest = None
+            if not args.no_manifest:
+                manifest = BatchManifest.create(args.out, prompts, width, height, args.steps, args.guidance,
+                                                seed=args.seed, model=engine.model_name,
+                                                output_format=args.output_format)
+                manifest_path = manifest.path
+                report(f"Manifest: {manifest_path}")
+            engine.batch_generate(prompts, width, height, args.steps, args.guidance, output_dir=args.out,
+                                  batch_size=args.batch_size, seed=args.seed, step_callback=step_callback,
+                                  manifest=manifest, output_format=args.output_format)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        if manifest_path:
+            print(f"Resume with: python -m z_image resume {manifest_path}", file=sys.stderr)
+        return 1
+
+    summary = getattr(engine, "describe_compile", lambda: None)()
+    if summary:
+        report(summary)
+    return 0
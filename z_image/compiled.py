@@ -0,0 +1,138 @@
+"""torch.compile support for the denoiser, with compiled graphs cached on disk.
+
+Compiling the transformer makes every denoising step faster, but each new
+input shape (resolution and batch size) compiles a new graph the first time
+it runs. ``ZImageEngine.warm_up`` pays that cost up front for the presets a
+session uses.
+
+Compiled code is cached on disk in two ways:
+
+- Inductor's FX graph cache lives under ``<directory>/inductor``; later
+  sessions reuse it for graphs whose shapes, dtype and code did not change.
+- On torch versions with ``torch.compiler.save_cache_artifacts``, a
+  portable bundle of everything compiled so far is written per warmed shape
+  under ``<directory>/<key>/``. It is loaded before the first compilation of
+  a later session.
+
+Dynamo's graph count shows how often the model was compiled; a count that
+keeps rising after warm-up means inputs are recompiling.
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+COMPILE_MODES = ("off", "default", "reduce-overhead", "max-autotune")
+# Graphs kept per compiled function before dynamo falls back to eager; one per warmed shape
+RECOMPILE_LIMIT = 64
+# Denoising steps of a warm-up run: the first compiles, the others time the compiled graph
+WARMUP_STEPS = 3
+
+
+def compiled_graphs():
+    """Number of graphs dynamo has compiled in this process"""
+    if "torch" not in sys.modules:
+        return 0
+    try:
+        from torch._dynamo.utils import counters
+    except ImportError:
+        return 0
+    return counters["stats"]["unique_graphs"]
+
+
+def raise_recompile_limit(limit=RECOMPILE_LIMIT):
+    """Let dynamo keep one graph per warmed shape instead of falling back to eager"""
+    import torch._dynamo
+
+    config = torch._dynamo.config
+    # Renamed from cache_size_limit in torch 2.6
+    for name in ("recompile_limit", "cache_size_limit"):
+        if hasattr(config, name):
+            setattr(config, name, max(getattr(config, name), limit))
+
+
+def compile_mode_for(mode, device):
+    """The torch.compile mode to use on device; CUDA graphs need a GPU"""
+    if mode == "reduce-overhead" and not device.startswith("cuda"):
+        return "default"
+    return mode
+
+
+def shape_name(width, height, batch_size=1):
+    return f"{width}x{height}x{batch_size}"
+
+
+def describe_warm_up(shape, stats):
+    """Short summary of one shape's warm-up timings (see ZImageEngine.warm_up)"""
+    if stats["step_seconds"] is None:
+        return f"{shape} warmed up in {stats['call_seconds']:.1f} s"
+    return f"{shape} {stats['compile_seconds']:.1f} s compile, {stats['step_seconds']:.2f} s/step"
+
+
+class CompileCache:
+    """Directory of compiled artefacts, one folder per model, device, dtype, mode and torch version"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def enable(self):
+        """Point inductor's on-disk graph cache into this directory; call before compiling"""
+        inductor_dir = os.path.join(self.directory, "inductor")
+        os.makedirs(inductor_dir, exist_ok=True)
+        # An explicit TORCHINDUCTOR_CACHE_DIR from the user wins
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.abspath(inductor_dir))
+        os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+
+    @staticmethod
+    def make_key(model_name, device, dtype, mode):
+        import torch
+
+        params = [model_name, device, str(dtype), mode, torch.__version__]
+        return hashlib.sha256(json.dumps(params).encode("utf-8")).hexdigest()[:16]
+
+    def _dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def shapes(self, key):
+        """Shapes with a saved bundle under key"""
+        directory = self._dir(key)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith(".bin"))
+
+    def load(self, key):
+        """Load every bundle saved under key; returns the shapes loaded"""
+        import torch
+
+        load_artifacts = getattr(torch.compiler, "load_cache_artifacts", None)
+        if load_artifacts is None:
+            return []
+        loaded = []
+        for shape in self.shapes(key):
+            try:
+                with open(os.path.join(self._dir(key), f"{shape}.bin"), "rb") as f:
+                    load_artifacts(f.read())
+            except Exception:
+                # A bundle from an incompatible build is recompiled and overwritten
+                continue
+            loaded.append(shape)
+        return loaded
+
+    def save(self, key, shape):
+        """Save what has been compiled so far as the bundle of shape; False if unsupported"""
+        import torch
+
+        save_artifacts = getattr(torch.compiler, "save_cache_artifacts", None)
+        result = save_artifacts() if save_artifacts is not None else None
+        if result is None:
+            return False
+        artifacts = result[0]
+        directory = self._dir(key)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{shape}.bin")
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(artifacts)
+        os.replace(temp_path, path)
+        return True
@@ -0,0 +1,389 @@
+"""Long-lived local server that keeps pipelines loaded for the GUI and scripts.
+
+The daemon speaks a small JSON-over-HTTP protocol on localhost:
+
+- ``GET /health`` reports the loaded models
+- ``POST /load`` loads a model (a no-op when it is already warm)
+- ``POST /generate`` returns one image as raw RGB bytes
+- ``POST /batch`` generates a prompt list and writes the files server-side
+- ``POST /finish_batch`` ends a batch sent as several non-final ``/batch`` requests
+
+Start it with ``python -m z_image serve``. ``DaemonClient`` mirrors the
+``ZImageEngine`` interface, so callers can use either interchangeably.
+"""
+
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .encoders import OutputFormat, save_image
+from .engine import DEFAULT_GUIDANCE, DEFAULT_MODEL, DEFAULT_STEPS, ZImageEngine
+from .manifest import BatchManifest
+from .placement import DEFAULT_PLACEMENT
+
+PROTOCOL_VERSION = 1
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7861
+# Override the daemon address with Z_IMAGE_DAEMON=host:port
+ADDRESS_ENV = "Z_IMAGE_DAEMON"
+# Manifests kept loaded between the chunks of streamed batches
+MANIFEST_CACHE_SIZE = 8
+
+
+def daemon_address():
+    """Return the (host, port) the daemon listens on, honouring Z_IMAGE_DAEMON"""
+    value = os.environ.get(ADDRESS_ENV, "")
+    if not value:
+        return DEFAULT_HOST, DEFAULT_PORT
+    host, _, port = value.rpartition(":")
+    return host or DEFAULT_HOST, int(port)
+
+
+def file_stamp(path):
+    """(size, mtime) of a file, which changes whenever anything appends to it"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_engine(model_name, placement, status_callback=None):
+    """Default engine factory: load a real pipeline in this process"""
+    engine = ZImageEngine(model_name=model_name, placement=placement, status_callback=status_callback)
+    engine.load_model()
+    return engine
+
+
+class ZImageDaemon:
+    """Loaded engines keyed by model name, shared by every client of the server
+
+    ``engine_factory(model_name, placement)`` must return a loaded engine;
+    pass a factory that wraps a stub pipeline to exercise the protocol
+    without a GPU or model weights.
+    """
+
+    def __init__(self, engine_factory=load_engine, status_callback=None):
+        self.engine_factory = engine_factory
+        self.status_callback = status_callback
+        self.engines = {}
+        # One pipeline call at a time; the pipelines are not thread-safe
+        self._lock = threading.Lock()
+        # manifest path -> ((size, mtime) of the file as the last batch left it, manifest)
+        self._manifests = OrderedDict()
+        self._manifests_lock = threading.Lock()
+
+    def set_status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def engine(self, model_name, placement=None):
+        """Return the warm engine for model_name, loading it on first use"""
+        with self._lock:
+            engine = self.engines.get(model_name)
+            if engine is None:
+                self.set_status(f"Loading {model_name}...")
+                engine = self.engine_factory(model_name, placement or DEFAULT_PLACEMENT)
+                self.engines[model_name] = engine
+                self.set_status(f"Loaded {model_name} on {engine.device_description}")
+            return engine
+
+    def health(self):
+        return {
+            "protocol": PROTOCOL_VERSION,
+            "pid": os.getpid(),
+            "models": {
+                name: {
+                    "device": engine.device_description,
+                    "placement": engine.active_placement,
+                    "memory": engine.memory_description,
+                }
+                for name, engine in self.engines.items()
+            },
+        }
+
+    def load(self, request):
+        engine = self.engine(request.get("model", DEFAULT_MODEL), request.get("placement"))
+        return {
+            "device": engine.device_description,
+            "placement": engine.active_placement,
+            "memory": engine.memory_description,
+        }
+
+    def generate(self, request):
+        engine = self.engine(request.get("model", DEFAULT_MODEL))
+        with self._lock:
+            image = engine.generate(
+                request["prompt"], request["width"], request["height"],
+                request.get("steps", DEFAULT_STEPS), request.get("guidance", DEFAULT_GUIDANCE),
+                request.get("seed"), queue_wait=request.get("queue_wait"),
+            )
+        return image.convert("RGB")
+
+    def manifest(self, path):
+        """The manifest at path, reused from an earlier request while the file is as that request left it
+
+        Loading a streamed batch's manifest reads and hashes its whole prompt
+        file, which a client sending a million prompts in chunks would
+        otherwise pay for every chunk.
+        """
+        stamp = file_stamp(path)
+        with self._manifests_lock:
+            cached = self._manifests.get(path)
+            if cached is not None and cached[0] == stamp:
+                self._manifests.move_to_end(path)
+                return cached[1]
+        return BatchManifest.load(path)
+
+    def _keep_manifest(self, path, manifest):
+        """Cache manifest with the file as it is now, after its entries were appended"""
+        with self._manifests_lock:
+            self._manifests[path] = (file_stamp(path), manifest)
+            self._manifests.move_to_end(path)
+            while len(self._manifests) > MANIFEST_CACHE_SIZE:
+                self._manifests.popitem(last=False)
+
+    def batch(self, request):
+        engine = self.engine(request.get("model", DEFAULT_MODEL))
+        # The manifest file is shared with the client, which runs on the same machine
+        manifest_path = request.get("manifest")
+        manifest = self.manifest(manifest_path) if manifest_path else None
+        with self._lock:
+            # A streamed or resumed batch sends no prompts; the daemon reads the ones at its indexes
+            # from the manifest (batch_generate pairs the two lists position by position)
+            prompts = request.get("prompts")
+            indexes = request.get("indexes")
+            if prompts is None:
+                prompts = manifest.prompts if indexes is None else [manifest.prompts[index] for index in indexes]
+            saved = engine.batch_generate(
+                prompts, request["width"], request["height"],
+                request.get("steps", DEFAULT_STEPS), request.get("guidance", DEFAULT_GUIDANCE),
+                output_dir=request.get("output_dir"), batch_size=request.get("batch_size", 1),
+                seed=request.get("seed"), start_index=request.get("start_index", 0), total=request.get("total"),
+                queue_wait=request.get("queue_wait"), manifest=manifest, indexes=indexes,
+                output_format=request.get("output_format"), final=request.get("final"),
+            )
+            # The batch's writer is flushed, so every entry it appended is in the file
+            if manifest is not None:
+                self._keep_manifest(manifest_path, manifest)
+        return {"saved": saved}
+
+    def finish_batch(self, request):
+        engine = self.engine(request.get("model", DEFAULT_MODEL))
+        with self._lock:
+            engine.finish_batch()
+        return {}
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ZImageDaemon/1"
+
+    def log_message(self, format, *args):
+        self.server.daemon.set_status(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.daemon.health())
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        daemon = self.server.daemon
+        try:
+            request = self._read_json()
+            if self.path == "/load":
+                self._send_json(200, daemon.load(request))
+            elif self.path == "/batch":
+                self._send_json(200, daemon.batch(request))
+            elif self.path == "/finish_batch":
+                self._send_json(200, daemon.finish_batch(request))
+            elif self.path == "/generate":
+                image = daemon.generate(request)
+                # Raw pixels avoid a PNG encode/decode round trip on the same machine
+                body = image.tobytes()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-Image-Width", str(image.size[0]))
+                self.send_header("X-Image-Height", str(image.size[1]))
+                self.send_header("X-Image-Mode", image.mode)
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+
+class DaemonServer(ThreadingHTTPServer):
+    """HTTP server bound to localhost that serves a ZImageDaemon"""
+
+    daemon_threads = True
+
+    def __init__(self, daemon, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.daemon = daemon
+        super().__init__((host, port), DaemonRequestHandler)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, preload=None, placement=None, status_callback=None,
+          engine_factory=load_engine):
+    """Run the daemon until interrupted"""
+    daemon = ZImageDaemon(engine_factory=engine_factory, status_callback=status_callback)
+    if preload:
+        daemon.engine(preload, placement)
+    server = DaemonServer(daemon, host, port)
+    daemon.set_status(f"Z-Image daemon listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class DaemonClient:
+    """Talks to a running daemon through the same interface as ZImageEngine"""
+
+    def __init__(self, host=None, port=None, model_name=DEFAULT_MODEL, status_callback=None):
+        default_host, default_port = daemon_address()
+        self.host = host or default_host
+        self.port = port or default_port
+        self.model_name = model_name
+        self.status_callback = status_callback
+        self.output_dir = "outputs"
+        self.device_description = "Unknown"
+        self.active_placement = None
+        self.memory_description = ""
+        self.embedding_cache = None
+        self._loaded = False
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    def set_status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def _request(self, path, payload=None, timeout=None):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            response = urllib.request.urlopen(request, timeout=timeout)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", str(e))
+            except ValueError:
+                message = str(e)
+            raise RuntimeError(f"Daemon error: {message}") from None
+        with response:
+            return response.headers, response.read()
+
+    def is_available(self, timeout=0.5):
+        """Return True if a compatible daemon answers on the configured address"""
+        try:
+            _, body = self._request("/health", timeout=timeout)
+            return json.loads(body).get("protocol") == PROTOCOL_VERSION
+        except (OSError, ValueError, RuntimeError):
+            return False
+
+    def load_model(self, model_name=None, placement=None, low_cpu_mem_usage=True):
+        if model_name:
+            self.model_name = model_name
+        self.set_status(f"Connecting to daemon at {self.url}...")
+        _, body = self._request("/load", {"model": self.model_name, "placement": placement})
+        info = json.loads(body)
+        self.device_description = f"{info['device']} via daemon"
+        self.active_placement = info["placement"]
+        self.memory_description = f"daemon {info['memory']}"
+        self._loaded = True
+        self.set_status(f"Using warm model from daemon at {self.url}")
+        return self.device_description
+
+    def generate(self, prompt, width, height, steps=DEFAULT_STEPS, guidance=DEFAULT_GUIDANCE, seed=None,
+                 step_callback=None, queue_wait=None):
+        # Steps run inside the daemon, so step_callback cannot interrupt a remote call
+        from PIL import Image
+
+        self.set_status("Generating image (daemon)...")
+        headers, body = self._request("/generate", {
+            "model": self.model_name, "prompt": prompt, "width": width, "height": height,
+            "steps": steps, "guidance": guidance, "seed": seed, "queue_wait": queue_wait,
+        })
+        size = (int(headers["X-Image-Width"]), int(headers["X-Image-Height"]))
+        return Image.frombytes(headers.get("X-Image-Mode", "RGB"), size, body)
+
+    def batch_generate(self, prompts, width, height, steps=DEFAULT_STEPS, guidance=DEFAULT_GUIDANCE,
+                       output_dir=None, progress_callback=None, batch_size=1, seed=None, writer=None,
+                       step_callback=None, start_index=0, total=None, queue_wait=None, manifest=None,
+                       indexes=None, output_format=None, final=None):
+        output_dir = os.path.abspath(output_dir or self.output_dir)
+        count = len(prompts)
+        prompts = None if manifest is not None and prompts is manifest.prompts else list(prompts)
+        self.set_status(f"Batch generating {len(indexes) if indexes is not None else count} prompts on daemon...")
+        _, body = self._request("/batch", {
+            "model": self.model_name, "prompts": prompts, "width": width, "height": height,
+            "steps": steps, "guidance": guidance, "output_dir": output_dir,
+            "batch_size": batch_size, "seed": seed, "start_index": start_index, "total": total,
+            "queue_wait": queue_wait, "manifest": os.path.abspath(manifest.path) if manifest else None,
+            "indexes": list(indexes) if indexes is not None else None,
+            "output_format": OutputFormat.parse(output_format).spec if output_format else None,
+            "final": final,
+        })
+        saved = json.loads(body)["saved"]
+        if indexes is None:
+            indexes = range(start_index, start_index + count)
+        last = indexes[-1] + 1 if len(indexes) else start_index
+        total = total or last
+        if final is None:
+            final = last >= total
+        if progress_callback:
+            for index, filename in zip(indexes, saved):
+                progress_callback(index + 1, total, filename)
+        if final:
+            self.set_status(f"Batch complete: {total} images saved")
+        return saved
+
+    def finish_batch(self):
+        self._request("/finish_batch", {"model": self.model_name})
+
+    def resume_batch(self, manifest, **kwargs):
+        """Generate the prompts of a manifest (or manifest path) that are not done yet, on the daemon
+
+        Accepts the keyword arguments of ``batch_generate``.
+        """
+        if not isinstance(manifest, BatchManifest):
+            manifest = BatchManifest.load(manifest)
+        header = manifest.header
+        pending = manifest.pending()
+        if not pending:
+            self.set_status("Nothing to resume: every prompt is done")
+            return []
+        kwargs.setdefault("total", len(manifest.prompts))
+        return self.batch_generate(manifest.prompts, header["width"], header["height"], header["steps"],
+                                   header["guidance"], manifest=manifest, indexes=pending, **kwargs)
+
+    def save_image(self, image, filepath, output_format=None):
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        save_image(image, filepath, output_format)
+        return filepath
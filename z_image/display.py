@@ -0,0 +1,100 @@
+"""Display frames prepared off the Tk thread: the pyramid and fitted render of a finished image.
+
+Building a new image's pyramid and resampling it to fit the canvas takes
+hundreds of milliseconds at 4K. Worker threads do that work with
+``prepare_display`` as soon as the pipeline returns, so all that is left for
+the Tk thread is to hand the finished render to a ``PhotoImage``::
+
+    frame = prepare_display(image, canvas_size)   # worker thread
+    ui.call(show_frame, frame)                    # Tk thread: PhotoImage + create_image, then frame.shown()
+
+``frame.first_pixel`` is then the time from the image being ready (the
+pipeline returning) until it was handed to the canvas.
+
+The render is resampled by PIL from the pyramid rather than by cv2 from a
+numpy array: converting a 4K result to an array alone takes about as long
+as the whole pyramid render, and ``z_image.benchmarks.display`` times both.
+"""
+
+import time
+
+from PIL import Image
+
+from .pyramid import ImagePyramid
+from .viewport import visible_region
+
+# The GUI falls back to this canvas size before the window is drawn
+DEFAULT_CANVAS_SIZE = (600, 600)
+
+
+def fit_zoom(image_size, canvas_size, max_zoom=1.0):
+    """Zoom that fits the whole image on the canvas, never above max_zoom"""
+    return min(canvas_size[0] / image_size[0], canvas_size[1] / image_size[1], max_zoom)
+
+
+def centered_offset(image_size, zoom, canvas_size):
+    """Canvas position of the top-left corner of the image centered at zoom"""
+    return ((canvas_size[0] - int(image_size[0] * zoom)) // 2,
+            (canvas_size[1] - int(image_size[1] * zoom)) // 2)
+
+
+class DisplayFrame:
+    """A new image ready to show: its pyramid, the fitted view and the render of that view"""
+
+    def __init__(self, pyramid, canvas_size, zoom, offset, dest_box, image, ready_at, prepared_at):
+        self.pyramid = pyramid
+        self.canvas_size = canvas_size
+        self.zoom = zoom
+        self.offset = offset
+        # Canvas rectangle the render is drawn into, None if nothing is visible
+        self.dest_box = dest_box
+        self.image = image
+        self.ready_at = ready_at
+        self.prepared_at = prepared_at
+        self.shown_at = None
+
+    @property
+    def prepare_seconds(self):
+        return self.prepared_at - self.ready_at
+
+    @property
+    def first_pixel(self):
+        """Seconds from the image being ready until it reached the canvas (None until shown)"""
+        return None if self.shown_at is None else self.shown_at - self.ready_at
+
+    def shown(self, clock=time.perf_counter):
+        """Note that the render was handed to the canvas; returns first_pixel"""
+        self.shown_at = clock()
+        return self.first_pixel
+
+
+def prepare_display(image, canvas_size=DEFAULT_CANVAS_SIZE, margin=0, resample=Image.Resampling.LANCZOS,
+                    ready_at=None, clock=time.perf_counter):
+    """Build image's pyramid and render it fitted and centered on the canvas; safe in any thread
+
+    ``margin`` matches the GUI's render margin, so the frame's render is the
+    one its own renders would produce. ``ready_at`` is when the image became
+    ready (default: now).
+    """
+    if ready_at is None:
+        ready_at = clock()
+    pyramid = ImagePyramid(image)
+    zoom = fit_zoom(image.size, canvas_size)
+    offset = centered_offset(image.size, zoom, canvas_size)
+    region = visible_region(image.size, zoom, offset, canvas_size, margin=margin)
+    dest_box = rendered = None
+    if region is not None:
+        source_box, dest_box = region
+        # Rendered through the pyramid, so it is cached there for the GUI's own re-renders
+        rendered = pyramid.render(zoom, source_box, (dest_box[2] - dest_box[0], dest_box[3] - dest_box[1]),
+                                  resample)
+        # Decode any lazy pixel data now rather than on the Tk thread
+        rendered.load()
+    return DisplayFrame(pyramid, tuple(canvas_size), zoom, offset, dest_box, rendered, ready_at, clock())
+
+
+def prepare_preview(image, canvas_size=DEFAULT_CANVAS_SIZE, resample=Image.Resampling.BILINEAR):
+    """A latent preview scaled to fit the canvas; safe in any thread"""
+    scale = min(canvas_size[0] / image.size[0], canvas_size[1] / image.size[1])
+    size = (max(1, int(image.size[0] * scale)), max(1, int(image.size[1] * scale)))
+    return image.resize(size, resample)
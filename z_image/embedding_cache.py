@@ -0,0 +1,127 @@
+import hashlib
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def tensor_nbytes(tensor):
+    """Size of a tensor's data in bytes"""
+    return tensor.numel() * tensor.element_size()
+
+
+class PromptEmbeddingCache:
+    """LRU cache of encoded prompt embeddings with an optional safetensors disk tier
+
+    Entries are keyed on (model name, prompt, encoder settings). The memory
+    tier is bounded by ``max_bytes``; least recently used entries are evicted
+    first. When ``disk_dir`` is set every entry is also written there, so the
+    cache survives restarts and evicted entries can be reloaded.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.set_disk_dir(disk_dir)
+
+    def set_disk_dir(self, disk_dir):
+        """Enable the disk tier in disk_dir, or disable it with None"""
+        # safetensors ships with diffusers, but keep the memory tier usable without it
+        if disk_dir and importlib.util.find_spec("safetensors") is None:
+            disk_dir = None
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self.disk_dir = disk_dir
+
+    @staticmethod
+    def make_key(model_name, prompt, **settings):
+        """Build a cache key from the model, the prompt and the encoder settings"""
+        return (model_name, prompt, tuple(sorted((k, str(v)) for k, v in settings.items())))
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.safetensors")
+
+    def get(self, key, device=None):
+        """Return the cached embedding for key, or None on a miss"""
+        with self._lock:
+            tensor = self._entries.get(key)
+            if tensor is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return tensor
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if os.path.exists(path):
+                try:
+                    from safetensors.torch import load_file
+                    tensor = load_file(path, device=str(device) if device is not None else "cpu")["embedding"]
+                except Exception:
+                    tensor = None
+                if tensor is not None:
+                    self._store(key, tensor)
+                    with self._lock:
+                        self.hits += 1
+                        self.disk_hits += 1
+                    return tensor
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, tensor):
+        """Add an embedding to the cache, persisting it when a disk tier is configured"""
+        self._store(key, tensor)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            if not os.path.exists(path):
+                from safetensors.torch import save_file
+                tmp_path = path + ".tmp"
+                save_file({"embedding": tensor.detach().contiguous().cpu()}, tmp_path)
+                os.replace(tmp_path, path)
+
+    def _store(self, key, tensor):
+        size = tensor_nbytes(tensor)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= tensor_nbytes(previous)
+            self._entries[key] = tensor
+            self._bytes += size
+
+            # Evict least recently used entries until we are back under budget
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= tensor_nbytes(evicted)
+
+    def clear(self):
+        """Drop every in-memory entry (the disk tier is kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def memory_bytes(self):
+        return self._bytes
+
+    def describe(self):
+        """Short human readable hit/miss summary"""
+        text = f"prompt cache {self.hits} hits / {self.misses} misses"
+        if self.disk_hits:
+            text += f" ({self.disk_hits} from disk)"
+        return text
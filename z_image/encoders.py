@@ -0,0 +1,164 @@
+"""Output formats for saved images: PNG compression level, WebP, JPEG and raw NumPy arrays.
+
+A format is a short spec string, so it fits in a manifest header, a daemon
+request and a command line option::
+
+    png       PNG at PIL's default compression level (6)
+    png:1     PNG at compression level 0-9; 1 encodes several times faster than 6 for somewhat larger files
+    webp      lossless WebP: the smallest lossless files, but by far the slowest to encode
+    webp:90   lossy WebP at quality 0-100
+    jpeg:95   JPEG at quality 0-100 (plain "jpeg" is quality 90)
+    npy       uncompressed NumPy array (height x width x 3, uint8)
+
+An ``.npy`` file needs no decoding: ``numpy.load(path, mmap_mode="r")``
+maps it straight into a downstream pipeline.
+
+A file whose name already has another extension (a prompt's own output
+name, or a file picked in the save dialog) is written in the format of that
+extension with its default settings.
+"""
+
+import os
+
+DEFAULT_OUTPUT_FORMAT = "png"
+OUTPUT_FORMATS = ("png", "webp", "jpeg", "npy")
+EXTENSIONS = {"png": ".png", "webp": ".webp", "jpeg": ".jpg", "npy": ".npy"}
+# Extensions of files written in a format, beyond its own
+EXTENSION_KINDS = {".png": "png", ".webp": "webp", ".jpg": "jpeg", ".jpeg": "jpeg", ".npy": "npy"}
+DEFAULT_JPEG_QUALITY = 90
+
+# Choices offered by the GUI: label -> spec
+FORMAT_PRESETS = {
+    "PNG": "png",
+    "PNG (fast)": "png:1",
+    "WebP (lossless, slow)": "webp",
+    "WebP (quality 90)": "webp:90",
+    "JPEG (quality 95)": "jpeg:95",
+    "NumPy array (.npy)": "npy",
+}
+
+
+class OutputFormat:
+    """Encoder and settings for saved images; create one from a spec with ``OutputFormat.parse``
+
+    ``level`` is the PNG compression level and ``quality`` the WebP or JPEG
+    quality; WebP without a quality is lossless.
+    """
+
+    def __init__(self, kind=DEFAULT_OUTPUT_FORMAT, level=None, quality=None):
+        if kind not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {kind!r} (use one of {', '.join(OUTPUT_FORMATS)})")
+        if level is not None and (kind != "png" or not 0 <= level <= 9):
+            raise ValueError("A compression level from 0 to 9 only applies to png")
+        if quality is not None and (kind not in ("webp", "jpeg") or not 0 <= quality <= 100):
+            raise ValueError("A quality from 0 to 100 only applies to webp and jpeg")
+        if kind == "jpeg" and quality is None:
+            quality = DEFAULT_JPEG_QUALITY
+        self.kind = kind
+        self.level = level
+        self.quality = quality
+
+    @classmethod
+    def parse(cls, spec):
+        """An OutputFormat from a spec such as "png:1" (None gives the default, a format is returned as is)"""
+        if isinstance(spec, cls):
+            return spec
+        kind, _, setting = (spec or DEFAULT_OUTPUT_FORMAT).strip().lower().partition(":")
+        kind = EXTENSION_KINDS.get("." + kind, kind)
+        if not setting:
+            return cls(kind)
+        try:
+            value = int(setting)
+        except ValueError:
+            raise ValueError(f"Invalid output format {spec!r}") from None
+        return cls(kind, level=value) if kind == "png" else cls(kind, quality=value)
+
+    @property
+    def spec(self):
+        setting = self.level if self.kind == "png" else self.quality
+        if setting is None or (self.kind == "jpeg" and setting == DEFAULT_JPEG_QUALITY):
+            return self.kind
+        return f"{self.kind}:{setting}"
+
+    def __str__(self):
+        return self.spec
+
+    def __eq__(self, other):
+        return isinstance(other, OutputFormat) and self.spec == other.spec
+
+    def __hash__(self):
+        return hash(self.spec)
+
+    @property
+    def extension(self):
+        return EXTENSIONS[self.kind]
+
+    def filename(self, name):
+        """name with this format's extension, unless it has an extension of its own"""
+        return name if os.path.splitext(name)[1] else name + self.extension
+
+    def for_path(self, filepath):
+        """The format to write filepath in (None: leave it to PIL)
+
+        That is this format, or the default format of the file's own extension.
+        """
+        extension = os.path.splitext(filepath)[1].lower()
+        kind = EXTENSION_KINDS.get(extension, self.kind if not extension else None)
+        if kind is None:
+            return None
+        return self if kind == self.kind else OutputFormat(kind)
+
+    def save_kwargs(self):
+        """Keyword arguments for PIL's Image.save"""
+        if self.kind == "png":
+            return {"format": "PNG"} if self.level is None else {"format": "PNG", "compress_level": self.level}
+        if self.kind == "webp":
+            if self.quality is None:
+                return {"format": "WEBP", "lossless": True}
+            # The fastest method; slower ones barely shrink generated images
+            return {"format": "WEBP", "quality": self.quality, "method": 0}
+        return {"format": "JPEG", "quality": self.quality}
+
+    def save(self, image, filepath, **save_kwargs):
+        """Encode image to filepath; save_kwargs override the format's PIL settings"""
+        if self.kind == "npy":
+            import numpy
+
+            # Opened here, so numpy cannot append a second .npy to the name
+            with open(filepath, "wb") as f:
+                numpy.save(f, numpy.asarray(image.convert("RGB")))
+            return
+        if self.kind == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(filepath, **dict(self.save_kwargs(), **save_kwargs))
+
+    def describe(self):
+        if self.kind == "png":
+            return "PNG" if self.level is None else f"PNG (compression level {self.level})"
+        if self.kind == "webp":
+            return "lossless WebP" if self.quality is None else f"WebP (quality {self.quality})"
+        if self.kind == "jpeg":
+            return f"JPEG (quality {self.quality})"
+        return "NumPy array"
+
+
+def save_image(image, filepath, output_format=None, **save_kwargs):
+    """Write image to filepath in output_format, or in the format its extension names"""
+    output_format = OutputFormat.parse(output_format).for_path(filepath)
+    if output_format is None:
+        image.save(filepath, **save_kwargs)
+    else:
+        output_format.save(image, filepath, **save_kwargs)
+
+
+def load_image(filepath):
+    """Read an image written by save_image, including .npy arrays, fully into memory"""
+    from PIL import Image
+
+    if os.path.splitext(filepath)[1].lower() == ".npy":
+        import numpy
+
+        return Image.fromarray(numpy.load(filepath))
+    with Image.open(filepath) as image:
+        image.load()
+        return image.copy()
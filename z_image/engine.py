@@ -0,0 +1,1075 @@
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+from .compiled import (
+    WARMUP_STEPS,
+    compile_mode_for,
+    compiled_graphs,
+    describe_warm_up,
+    raise_recompile_limit,
+    shape_name,
+)
+from .embedding_cache import PromptEmbeddingCache
+from .encoders import DEFAULT_OUTPUT_FORMAT, OutputFormat, save_image
+from .manifest import BatchManifest
+from .memory import InsufficientMemory, MemoryEstimator, PeakProbe, gpu_memory, largest_component_bytes
+from .metrics import NULL_TIMER
+from .placement import (
+    DEFAULT_PLACEMENT,
+    PLACEMENT_CPU,
+    PLACEMENT_FULL,
+    PLACEMENT_MODEL_OFFLOAD,
+    PLACEMENT_SEQUENTIAL_OFFLOAD,
+    PLACEMENTS,
+    apply_placement,
+    describe_memory,
+    format_bytes,
+)
+from .prompts import bucket_by, prompt_name, prompt_seed, prompt_settings, prompt_text, read_prompt_file, windows
+from .scheduler import JobCancelled
+from .writer import ImageWriter
+
+DEFAULT_MODEL = "Tongyi-MAI/Z-Image-Turbo"
+MODELS = [
+    DEFAULT_MODEL
+]
+
+DEFAULT_STEPS = 4
+DEFAULT_GUIDANCE = 0.0
+MAX_SEQUENCE_LENGTH = 512
+
+# VAE decode: "auto" decodes images above tiled_decode_pixels in overlapping tiles
+TILED_DECODE_MODES = ("auto", "on", "off")
+DEFAULT_TILED_DECODE_PIXELS = 1536 * 1536
+DEFAULT_TILE_OVERLAP = 0.25
+
+# Placement the memory check moves to when a call would not fit in the current one
+LIGHTER_PLACEMENT = {
+    PLACEMENT_FULL: PLACEMENT_MODEL_OFFLOAD,
+    PLACEMENT_MODEL_OFFLOAD: PLACEMENT_SEQUENTIAL_OFFLOAD,
+}
+# (width, height, batch size) of the one-step generations calibrate_memory measures
+CALIBRATION_RUNS = ((512, 512, 1), (1024, 1024, 1), (768, 768, 2))
+
+RESOLUTION_OPTIONS = [
+    # Square formats
+    "256x256",
+    "512x512",
+    "768x768",
+    "1024x1024",
+    "1536x1536",
+    "2048x2048",
+
+    # Standard (4:3)
+    "640x480",
+    "800x600",
+    "1024x768",
+    "1280x960",
+    "1600x1200",
+
+    # Wide (16:9)
+    "854x480",
+    "1280x720",
+    "1366x768",
+    "1600x900",
+    "1920x1080",
+    "2560x1440",
+    "3840x2160",
+
+    # Ultra-wide (21:9)
+    "2560x1080",
+    "3440x1440",
+    "5120x2160",
+
+    # Mobile formats
+    "1080x1920",
+    "750x1334",
+    "828x1792",
+    "1242x2688"
+]
+
+
+def adjust_dimensions_for_model(width, height):
+    """Adjust dimensions to be divisible by 16 while preserving aspect ratio"""
+    # Round down to nearest multiple of 16
+    adjusted_width = (width // 16) * 16
+    adjusted_height = (height // 16) * 16
+
+    # Ensure minimum dimensions
+    if adjusted_width < 256:
+        adjusted_width = 256
+    if adjusted_height < 256:
+        adjusted_height = 256
+
+    return adjusted_width, adjusted_height
+
+
+def parse_resolution(resolution):
+    """Parse a "WIDTHxHEIGHT" string into an integer tuple"""
+    width, height = resolution.lower().split('x')
+    return int(width), int(height)
+
+
+def read_prompts(filename):
+    """Read the prompts of a text, JSONL or CSV prompt file, skipping blank lines
+
+    Plain prompts are returned as strings, prompts with their own settings
+    as dicts (see ``z_image.prompts``).
+    """
+    return read_prompt_file(filename)
+
+
+def bucket_settings(prompt, width, height, steps, guidance):
+    """Pipeline (width, height, steps, guidance) for a prompt of a batch"""
+    width, height, steps, guidance = prompt_settings(prompt, width, height, steps, guidance)
+    return adjust_dimensions_for_model(width, height) + (steps, guidance)
+
+
+def bucket_prompts(items, width, height, steps, guidance):
+    """Group (index, prompt) items into buckets that can share pipeline calls
+
+    Buckets are ordered by their first item and keep the items' order.
+    """
+    return bucket_by(items, lambda item: bucket_settings(item[1], width, height, steps, guidance))
+
+
+# torch and diffusers take seconds to import, so they are imported inside the
+# functions that need them. Call warm_imports() from a background thread to pay
+# that cost before the first model load.
+def warm_imports():
+    """Import the heavy generation dependencies (torch, diffusers)"""
+    import torch  # noqa: F401
+    from diffusers import ZImagePipeline  # noqa: F401
+
+
+def is_out_of_memory(error):
+    """Return True if an exception was raised by running out of GPU or host memory"""
+    if isinstance(error, MemoryError):
+        return True
+    # Only torch can raise its own OOM error, so never import it just to check
+    torch = sys.modules.get("torch")
+    oom_error = getattr(getattr(torch, "cuda", None), "OutOfMemoryError", None)
+    if oom_error is not None and isinstance(error, oom_error):
+        return True
+    message = str(error).lower()
+    return isinstance(error, RuntimeError) and (
+        "out of memory" in message or "can't allocate memory" in message
+    )
+
+
+def make_generator(seed):
+    """Create a seeded CPU generator, or None for a random seed"""
+    if seed is None or seed == "":
+        return None
+    import torch
+    return torch.Generator().manual_seed(int(seed))
+
+
+def step_end_kwargs(step_callback, total_steps):
+    """Pipeline keyword arguments that call step_callback after each denoising step
+
+    The callback receives ``(step, total_steps, latents)`` with 1-based steps.
+    An exception raised by the callback (e.g. a cancelled job) stops the
+    pipeline at that step.
+    """
+    if step_callback is None:
+        return {}
+
+    def on_step_end(pipeline, step, timestep, callback_kwargs):
+        step_callback(step + 1, total_steps, callback_kwargs.get("latents"))
+        return callback_kwargs
+
+    return {"callback_on_step_end": on_step_end}
+
+
+def configure_vae_decode(vae, tiled, sliced, tile_overlap=DEFAULT_TILE_OVERLAP):
+    """Switch a diffusers VAE between whole, tiled and per-image (sliced) decoding
+
+    Tiled decoding bounds the decoder's activations by the tile size instead
+    of the image size. Neighbouring tiles overlap by ``tile_overlap`` of a
+    tile and diffusers blends the overlap linearly, so no seams show.
+    Slicing decodes a batch one image at a time.
+    """
+    if tiled:
+        vae.tile_overlap_factor = tile_overlap
+        vae.enable_tiling()
+    else:
+        vae.disable_tiling()
+    if sliced:
+        vae.enable_slicing()
+    else:
+        vae.disable_slicing()
+
+
+def describe_decode(tiled, sliced):
+    if tiled and sliced:
+        return "tiled+sliced"
+    return "tiled" if tiled else "sliced" if sliced else "full"
+
+
+def describe_device():
+    """Describe the device a freshly loaded model would run on"""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            # Test CUDA by attempting to get device info
+            return f"CUDA ({torch.cuda.get_device_name(0)})"
+        raise RuntimeError("CUDA not available")
+    except Exception:
+        return "CPU (CUDA unavailable)"
+
+
+class ZImageEngine:
+    """Model loading, generation and saving shared by the GUI and the CLI"""
+
+    def __init__(self, model_name=DEFAULT_MODEL, output_dir="outputs", status_callback=None, pipeline=None,
+                 embedding_cache=None, placement=DEFAULT_PLACEMENT, metrics=None, result_cache=None,
+                 tiled_decode="auto", tiled_decode_pixels=DEFAULT_TILED_DECODE_PIXELS, memory_estimator=None,
+                 offload_on_low_memory=True, compile_mode="off", compile_cache=None, output_format=DEFAULT_OUTPUT_FORMAT):
+        self.model_name = model_name
+        self.output_dir = output_dir
+        self.status_callback = status_callback
+        self.pipeline = pipeline
+        self.device_description = "Unknown"
+        self.placement = placement
+        self.active_placement = None
+        self.memory_description = ""
+        # Pass embedding_cache=False to always run the text encoder
+        if embedding_cache is None:
+            embedding_cache = PromptEmbeddingCache()
+        self.embedding_cache = embedding_cache if embedding_cache is not False else None
+        # Optional MetricsRecorder that receives one record per pipeline call
+        self.metrics = metrics
+        # Optional ResultCache for seeded generate() calls; last_result_cached
+        # tells callers whether the last image came from it (None: not looked up)
+        self.result_cache = result_cache
+        self.last_result_cached = None
+        # VAE decode mode (see TILED_DECODE_MODES) and the pixel count above which "auto" tiles
+        self.tiled_decode = tiled_decode
+        self.tiled_decode_pixels = tiled_decode_pixels
+        self._decode_state = None
+        # Pre-flight GPU memory check of every pipeline call; pass memory_estimator=False to skip it
+        if memory_estimator is None:
+            memory_estimator = MemoryEstimator()
+        self.memory_estimator = memory_estimator if memory_estimator is not False else None
+        # Whether the check may move the weights to a lighter placement when nothing else fits
+        self.offload_on_low_memory = offload_on_low_memory
+        # Placement the weights had before the memory check moved them to a lighter one for a call
+        self._offloaded_from = None
+        # Predicted and measured GPU bytes of the last pipeline call (None: not checked)
+        self.last_memory = None
+        self._component_bytes = None
+        # torch.compile mode of the denoiser (see COMPILE_MODES), applied on load, and an
+        # optional CompileCache keeping compiled graphs on disk across sessions
+        self.compile_mode = compile_mode or "off"
+        self.compile_cache = compile_cache
+        # Compile time, step time and graph counts once the denoiser is compiled
+        self.compile_stats = None
+        self._compile_key = None
+        self._warming_up = False
+        # Format of saved images unless a batch or save asks for another (see z_image.encoders)
+        self.output_format = OutputFormat.parse(output_format)
+
+    @property
+    def is_loaded(self):
+        return self.pipeline is not None
+
+    def set_status(self, message):
+        """Report a status message to the GUI status bar or the console"""
+        if self.status_callback:
+            self.status_callback(message)
+
+    def load_model(self, model_name=None, placement=None, low_cpu_mem_usage=True):
+        """Load the pipeline and place it according to the placement strategy
+
+        ``placement`` is one of ``z_image.placement.PLACEMENTS``; strategies that
+        need CUDA fall back to CPU. Weights are loaded with
+        ``low_cpu_mem_usage`` by default, which avoids holding a second full
+        copy of the model in host RAM while loading.
+        """
+        if model_name:
+            self.model_name = model_name
+        if placement:
+            self.placement = placement
+
+        self.set_status("Loading model...")
+        import torch
+        from diffusers import ZImagePipeline
+
+        # Drop the previous pipeline first so two models are never resident at once
+        self.pipeline = None
+        self._offloaded_from = None
+        self._release_memory()
+
+        # Load Z-Image pipeline
+        self._decode_state = None
+        self._component_bytes = None
+        self.compile_stats = None
+        pipeline = ZImagePipeline.from_pretrained(
+            self.model_name,
+            torch_dtype=torch.bfloat16,
+            low_cpu_mem_usage=low_cpu_mem_usage,
+        )
+
+        pipeline, self.device_description, self.active_placement = apply_placement(
+            pipeline, self.placement, status_callback=self.set_status)
+        self.pipeline = pipeline
+        if self.compile_mode != "off":
+            self._compile_denoiser()
+
+        self.memory_description = describe_memory()
+        self.set_status(f"Model loaded on {self.device_description} "
+                        f"[{PLACEMENTS[self.active_placement]}]: {self.memory_description}")
+        return self.device_description
+
+    def _compile_denoiser(self):
+        """Compile the transformer in place, loading graphs cached by earlier sessions first"""
+        transformer = getattr(self.pipeline, "transformer", None)
+        if transformer is None or not hasattr(transformer, "compile"):
+            self.set_status("The pipeline has no transformer to compile, running eagerly")
+            return
+        if self.active_placement == PLACEMENT_SEQUENTIAL_OFFLOAD:
+            # Per-layer offload hooks break the compiled graph at every layer
+            self.set_status("Sequential CPU offload is not compiled, running eagerly")
+            return
+        device = "cpu" if self.active_placement == PLACEMENT_CPU else "cuda"
+        mode = compile_mode_for(self.compile_mode, device)
+        raise_recompile_limit()
+        cached = []
+        if self.compile_cache is not None:
+            self.compile_cache.enable()
+            self._compile_key = self.compile_cache.make_key(self.model_name, self.device_description,
+                                                            transformer.dtype, mode)
+            cached = self.compile_cache.load(self._compile_key)
+        transformer.compile(mode=mode, dynamic=False)
+        # shapes: timings of warmed up sizes; seen: every size run since compiling
+        self.compile_stats = {"mode": mode, "shapes": {}, "seen": set(), "cached_shapes": cached,
+                              "graphs_before": compiled_graphs(), "recompiles": 0}
+        text = f"Transformer compiled ({mode}); each new size compiles on its first run"
+        if cached:
+            text += f", {len(cached)} sizes cached on disk"
+        self.set_status(text)
+
+    def warm_up(self, width, height, batch_size=1, steps=WARMUP_STEPS, step_callback=None):
+        """Run a short generation at a size so its compiled graph is ready; returns its timings
+
+        The first denoising step includes compilation (or loading it from the
+        cache), the later ones time the compiled graph. A pipeline that reports
+        fewer than two steps leaves only the whole call to time, so
+        ``step_seconds`` and ``compile_seconds`` are None. With a CompileCache
+        the compiled artefacts are saved afterwards.
+        """
+        self._require_pipeline()
+        width, height = adjust_dimensions_for_model(width, height)
+        shape = shape_name(width, height, batch_size)
+        step_times = []
+
+        def on_step(step, total_steps, latents=None):
+            step_times.append(time.perf_counter())
+            if step_callback:
+                step_callback(step, total_steps, latents)
+
+        self.set_status(f"Warming up {width}x{height} (batch of {batch_size})...")
+        prompt_kwargs = self.prompt_kwargs(["warm-up"] * batch_size, DEFAULT_GUIDANCE)
+        self._prepare_decode(width, height, batch_size)
+        self.last_memory = None
+        graphs = compiled_graphs()
+        self._warming_up = True
+        try:
+            started = time.perf_counter()
+            self._call_pipeline(prompt_kwargs, width, height, max(2, steps), DEFAULT_GUIDANCE, None, batch_size,
+                                on_step)
+        finally:
+            self._warming_up = False
+        call_seconds = time.perf_counter() - started
+
+        if len(step_times) < 2:
+            first_step = step_times[0] - started if step_times else call_seconds
+            step_seconds = compile_seconds = None
+        else:
+            first_step = step_times[0] - started
+            step_seconds = statistics.median(b - a for a, b in zip(step_times, step_times[1:]))
+            compile_seconds = max(0.0, first_step - step_seconds)
+        stats = {
+            "first_step_seconds": first_step,
+            "step_seconds": step_seconds,
+            "compile_seconds": compile_seconds,
+            "call_seconds": call_seconds,
+            "graphs": compiled_graphs() - graphs,
+        }
+        if self.compile_stats is not None:
+            self.compile_stats["shapes"][shape] = stats
+            if self.compile_cache is not None and self._compile_key is not None and stats["graphs"]:
+                try:
+                    self.compile_cache.save(self._compile_key, shape)
+                except OSError as e:
+                    self.set_status(f"Could not save compiled graphs: {e}")
+        if step_seconds is None:
+            self.set_status(f"Warmed up {width}x{height} in {call_seconds:.1f} s (the pipeline reported "
+                            f"{len(step_times)} of {max(2, steps)} steps, so steps and compilation are not timed)")
+        else:
+            self.set_status(f"Warmed up {width}x{height}: first step {first_step:.1f} s "
+                            f"(compile {compile_seconds:.1f} s), then {step_seconds:.2f} s per step")
+        return stats
+
+    def is_warm(self, width, height, batch_size=1):
+        """True if the compiled denoiser has run at this size, or it is not compiled"""
+        if self.compile_stats is None:
+            return True
+        width, height = adjust_dimensions_for_model(width, height)
+        return shape_name(width, height, batch_size) in self.compile_stats["seen"]
+
+    def describe_compile(self):
+        """One line summary of compilation, or None when the denoiser runs eagerly"""
+        stats = self.compile_stats
+        if stats is None:
+            return None
+        graphs = compiled_graphs() - stats["graphs_before"]
+        text = (f"Compiled ({stats['mode']}): {len(stats['shapes'])} sizes warmed up, {graphs} graphs, "
+                f"{stats['recompiles']} recompiles after warm-up")
+        if stats["shapes"]:
+            text += "; " + ", ".join(describe_warm_up(shape, shape_stats)
+                                     for shape, shape_stats in stats["shapes"].items())
+        return text
+
+    def _require_pipeline(self):
+        if not self.is_loaded:
+            raise RuntimeError("Please load a model first")
+
+    def generate(self, prompt, width, height, steps=DEFAULT_STEPS, guidance=DEFAULT_GUIDANCE, seed=None,
+                 step_callback=None, queue_wait=None):
+        """Generate a single image and return it as a PIL image
+
+        ``step_callback(step, total_steps, latents)`` runs after every
+        denoising step; raising from it aborts the generation. ``queue_wait``
+        is the time the caller's job spent queued, for the metrics record.
+
+        Seeded generations are looked up in the result cache first, if there
+        is one; unseeded ones always run the pipeline.
+        """
+        self._require_pipeline()
+
+        # Adjust dimensions to be divisible by 16
+        adjusted_width, adjusted_height = adjust_dimensions_for_model(width, height)
+
+        # Show if dimensions were adjusted
+        if (width, height) != (adjusted_width, adjusted_height):
+            self.set_status(f"Adjusted dimensions: {width}x{height} → {adjusted_width}x{adjusted_height}")
+
+        timer = self._timer()
+        settings = (adjusted_width, adjusted_height, steps, guidance, seed, 1, None)
+
+        self.last_result_cached = None
+        cache_key = None
+        if self.result_cache is not None and seed is not None and seed != "":
+            cache_key = self.result_cache.make_key(self.model_name, prompt, adjusted_width, adjusted_height,
+                                                   steps, guidance, seed)
+            image = self.result_cache.get(cache_key)
+            self.last_result_cached = image is not None
+            if image is not None:
+                timer.mark("cache")
+                self.set_status(f"Result cache hit ({self.result_cache.describe()})")
+                self._record("generate", timer, settings, images=1, queue_wait=queue_wait, cache="hit")
+                return image
+            self.set_status(f"Result cache miss ({self.result_cache.describe()})")
+
+        generator = self.make_generator(seed)
+
+        try:
+            _, plan = self.admit(adjusted_width, adjusted_height, 1)
+            settings = settings[:-1] + (self._prepare_decode(adjusted_width, adjusted_height, 1, plan),)
+            prompt_kwargs = self.prompt_kwargs([prompt], guidance)
+            timer.mark("encode")
+            if self.embedding_cache is not None:
+                self.set_status(f"Generating image... ({self.embedding_cache.describe()})")
+            else:
+                self.set_status("Generating image...")
+            result = self._call_pipeline(prompt_kwargs, adjusted_width, adjusted_height, steps, guidance,
+                                         generator, 1, step_callback, timer)
+
+            if not hasattr(result, 'images') or len(result.images) == 0:
+                raise RuntimeError("Generation completed but no image was produced")
+        except Exception as e:
+            self._record("generate", timer, settings, queue_wait=queue_wait, error=e, memory=self.last_memory)
+            raise
+        finally:
+            # A call that only fit on a lighter placement does not slow down the ones after it
+            self._restore_placement()
+        image = result.images[0]
+        if cache_key is not None:
+            try:
+                self.result_cache.put(cache_key, image, prompt=prompt, seed=seed)
+            except Exception as e:
+                # A full or read-only disk must not fail the generation
+                self.set_status(f"Could not cache result: {e}")
+        self._record("generate", timer, settings, images=1, queue_wait=queue_wait,
+                     cache="miss" if cache_key is not None else None, memory=self.last_memory)
+        return image
+
+    def batch_generate(self, prompts, width, height, steps=DEFAULT_STEPS, guidance=DEFAULT_GUIDANCE,
+                       output_dir=None, progress_callback=None, batch_size=1, seed=None, writer=None,
+                       step_callback=None, start_index=0, total=None, queue_wait=None, manifest=None,
+                       indexes=None, output_format=None, final=None):
+        """Generate one image per prompt and save each to the output directory
+
+        A prompt is plain text or a dict from ``z_image.prompts`` whose own
+        resolution, steps, guidance, seed and output name override the batch
+        settings. Prompts with the same (adjusted) shape and settings form a
+        bucket and run together; buckets run in order of their first prompt,
+        while filenames and seeds still follow each prompt's position, so the
+        output does not depend on how the work was grouped. ``prompts`` may be
+        a ``PromptFile``: it is read ``PROMPT_WINDOW`` prompts at a time and
+        buckets form within each window.
+
+        Each bucket is sent to the pipeline in micro-batches of
+        ``batch_size``. If a micro-batch runs out of memory it is retried at
+        half the size, and the smaller size is kept for the rest of the
+        batch. A memory check before each micro-batch may shrink it the same
+        way, tile its decode or offload the weights first (see ``admit``).
+        When ``seed`` is given, prompt ``i`` is generated with seed
+        ``seed + i`` regardless of batching, unless it has its own seed.
+
+        Images are encoded and written by an ``ImageWriter`` while the next
+        micro-batch is denoising. A writer created here is flushed before this
+        returns, even when generation fails; a writer passed in is left for the
+        caller to flush, so it can keep writing while the next chunk of a
+        larger batch runs. Images are saved in ``output_format`` (a spec or
+        ``OutputFormat``), by default the engine's.
+
+        ``start_index`` numbers the prompts (filenames and seeds) and ``total``
+        is the size of the whole batch when a large batch is submitted in
+        several chunks; ``indexes`` gives the positions of prompts that are
+        not one contiguous run, such as one bucket of a larger batch.
+        ``final`` tells whether this call ends the batch, so it reports the
+        batch complete and moves weights offloaded for it back (by default,
+        once its last index reaches ``total``); a caller whose chunks do not
+        finish in index order passes False and calls ``finish_batch`` after
+        the last one. ``step_callback`` and ``queue_wait`` are used as in ``generate``; with
+        metrics enabled each micro-batch is recorded once all of its images
+        are written.
+
+        With a ``BatchManifest`` the images go next to the manifest under
+        stable names, the manifest's seed and output format are used, prompts
+        it already lists as done are skipped, and each prompt's outcome is
+        appended to it.
+
+        Returns the saved paths in prompt order.
+        """
+        self._require_pipeline()
+
+        if manifest is not None:
+            output_dir = manifest.output_dir
+            seed = manifest.seed
+            output_format = manifest.output_format
+        output_dir = output_dir or self.output_dir
+        output_format = OutputFormat.parse(output_format or self.output_format)
+        os.makedirs(output_dir, exist_ok=True)
+
+        batch_size = max(1, int(batch_size))
+        if indexes is None:
+            indexes = range(start_index, start_index + len(prompts))
+        last = indexes[-1] + 1 if len(indexes) else start_index
+        total = total or last
+        if final is None:
+            final = last >= total
+        # The manifest's own prompts need no check against themselves
+        check = manifest is not None and prompts is not manifest.prompts
+        saved = {}
+        owns_writer = writer is None
+        if owns_writer:
+            writer = ImageWriter()
+        finished = False
+        try:
+            # Prompts are read a window at a time, so a streamed PromptFile is never held in memory
+            for window in windows(zip(indexes, prompts)):
+                if manifest is not None:
+                    if check:
+                        for index, prompt in window:
+                            manifest.check_prompt(index, prompt)
+                    window = [(index, prompt) for index, prompt in window if not manifest.is_done(index)]
+                for bucket in bucket_prompts(window, width, height, steps, guidance):
+                    batch_size = self._batch_loop(bucket, width, height, steps, guidance, output_dir,
+                                                  progress_callback, batch_size, seed, writer, saved,
+                                                  step_callback, total, queue_wait, manifest, output_format)
+                    queue_wait = None
+            finished = True
+        finally:
+            if owns_writer:
+                writer.close()
+            # Chunks of a larger batch keep a lighter placement until the last chunk (or a failure)
+            if final or not finished:
+                self._restore_placement()
+
+        # Chunks of a larger batch only report completion for the last chunk
+        if final:
+            summary = f"Batch complete: {total} images saved ({writer.describe()}"
+            if self.embedding_cache is not None:
+                summary += f", {self.embedding_cache.describe()}"
+            self.set_status(summary + ")")
+        return [saved[index] for index in sorted(saved)]
+
+    def finish_batch(self):
+        """End a batch sent as calls with final=False: move weights offloaded for it back"""
+        self._restore_placement()
+
+    def _batch_loop(self, items, width, height, steps, guidance, output_dir, progress_callback,
+                    batch_size, seed, writer, saved, step_callback, total, queue_wait=None, manifest=None,
+                    output_format=None):
+        """Run the (index, prompt) items of one bucket; returns the batch size still in use"""
+        width, height, steps, guidance = bucket_settings(items[0][1], width, height, steps, guidance)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        position = 0
+        while position < len(items):
+            timer = self._timer()
+            requested = min(batch_size, len(items) - position)
+            try:
+                admitted, plan = self.admit(width, height, requested)
+            except InsufficientMemory as e:
+                self._record("batch", timer, (width, height, steps, guidance, None, batch_size, None),
+                             queue_wait=queue_wait, error=e, memory=self.last_memory)
+                if manifest is not None:
+                    for index, _ in items[position:position + batch_size]:
+                        manifest.record(index, error=e)
+                raise
+            if admitted < requested:
+                # Like an out-of-memory retry, the smaller size is kept for the rest of the batch
+                batch_size = admitted
+            chunk_items = items[position:position + batch_size]
+            indexes = [index for index, _ in chunk_items]
+            chunk = [prompt_text(prompt) for _, prompt in chunk_items]
+            seeds = [prompt_seed(prompt, index, seed) for index, prompt in chunk_items]
+            number = indexes[0]
+            if len(chunk) == 1:
+                self.set_status(f"Generating {number+1}/{total}: {chunk[0][:50]}...")
+            elif indexes[-1] - number == len(chunk) - 1:
+                self.set_status(f"Generating {number+1}-{indexes[-1]+1}/{total} (batch of {len(chunk)})...")
+            else:
+                self.set_status(f"Generating {len(chunk)} prompts from {number+1}/{total} (batch of {len(chunk)})...")
+
+            decode = self._prepare_decode(width, height, len(chunk), plan)
+            settings = (width, height, steps, guidance, seeds[0], len(chunk), decode)
+            try:
+                images = self._run_batch(chunk, width, height, steps, guidance, seeds, step_callback, timer)
+            except Exception as e:
+                self._record("batch", timer, settings, queue_wait=queue_wait, error=e, memory=self.last_memory)
+                if batch_size == 1 or not is_out_of_memory(e):
+                    # A cancelled prompt is simply still pending; anything else is retried on resume
+                    if manifest is not None and not isinstance(e, JobCancelled):
+                        for index in indexes:
+                            manifest.record(index, error=e)
+                    raise
+                batch_size = max(1, batch_size // 2)
+                self._release_memory()
+                self.set_status(f"Out of memory, retrying with batch size {batch_size}")
+                continue
+
+            # Queue each image for saving while the next micro-batch runs
+            on_saved = None
+            if self.metrics is not None:
+                on_saved = self._record_when_saved(timer, settings, len(images), queue_wait, self.last_memory)
+            queue_wait = None
+            for (index, prompt), image in zip(chunk_items, images):
+                if manifest is not None:
+                    filename = manifest.filename(index)
+                    callback = self._manifest_callback(manifest, index, on_saved)
+                else:
+                    name = prompt_name(prompt) or f"batch_{timestamp}_{index+1:03d}"
+                    filename = os.path.join(output_dir, output_format.filename(name))
+                    callback = on_saved
+                writer.submit(image, filename, callback=callback, output_format=output_format)
+                saved[index] = filename
+
+                if progress_callback:
+                    progress_callback(index + 1, total, filename)
+
+            position += len(chunk)
+        return batch_size
+
+    def _manifest_callback(self, manifest, index, on_saved=None):
+        """Writer callback that appends the prompt's outcome to the manifest once written"""
+        def on_written(filepath, error):
+            manifest.record(index, error=error)
+            if on_saved:
+                on_saved(filepath, error)
+        return on_written
+
+    def resume_batch(self, manifest, **kwargs):
+        """Generate the prompts of a manifest (or manifest path) that are not done yet
+
+        Accepts the keyword arguments of ``batch_generate``.
+        """
+        if not isinstance(manifest, BatchManifest):
+            manifest = BatchManifest.load(manifest)
+        header = manifest.header
+        return self.batch_generate(manifest.prompts, header["width"], header["height"], header["steps"],
+                                   header["guidance"], manifest=manifest, **kwargs)
+
+    def make_generator(self, seed):
+        """Seeded generator for the pipeline; a pipeline may provide its own (the stub needs no torch)"""
+        factory = getattr(self.pipeline, "make_generator", None)
+        return (factory or make_generator)(seed)
+
+    def _run_batch(self, prompts, width, height, steps, guidance, seeds, step_callback=None, timer=NULL_TIMER):
+        """Run one pipeline call for a list of prompts and return its images
+
+        ``seeds`` holds one seed per prompt; None draws a random one.
+        """
+        if any(seed is not None for seed in seeds):
+            # One generator per image keeps each image's seed independent of batching
+            generator = [self.make_generator(seed if seed is not None else random.randrange(2 ** 31))
+                         for seed in seeds]
+        else:
+            generator = None
+
+        prompt_kwargs = self.prompt_kwargs(prompts, guidance)
+        timer.mark("encode")
+        result = self._call_pipeline(prompt_kwargs, width, height, steps, guidance, generator, len(prompts),
+                                     step_callback, timer)
+
+        if len(result.images) != len(prompts):
+            raise RuntimeError(f"Pipeline returned {len(result.images)} images for {len(prompts)} prompts")
+        return result.images
+
+    def _call_pipeline(self, prompt_kwargs, width, height, steps, guidance, generator, batch_size,
+                       step_callback=None, timer=NULL_TIMER):
+        """Run the pipeline, measuring its GPU memory when the memory check predicted it"""
+        step_callback = timer.step_callback(step_callback)
+        probe = PeakProbe() if self.last_memory is not None else None
+        if probe is not None:
+            step_callback = probe.step_callback(step_callback)
+        graphs = compiled_graphs() if self.compile_stats is not None and not self._warming_up else None
+        result = self.pipeline(
+            **prompt_kwargs,
+            width=width,
+            height=height,
+            num_inference_steps=steps,
+            guidance_scale=guidance,
+            generator=generator,
+            **step_end_kwargs(step_callback, steps)
+        )
+        timer.pipeline_done()
+        if probe is not None:
+            probe.done()
+            self._observe_memory(probe, width, height, batch_size)
+        if self.compile_stats is not None:
+            self.compile_stats["seen"].add(shape_name(width, height, batch_size))
+        if graphs is not None:
+            recompiles = compiled_graphs() - graphs
+            if recompiles:
+                # A size that was not warmed up paid for its compilation during this call
+                self.compile_stats["recompiles"] += recompiles
+                self.set_status(f"{width}x{height} (batch of {batch_size}) compiled during generation "
+                                f"({self.compile_stats['recompiles']} recompiles since warm-up); warm it up to avoid this")
+        return result
+
+    def _memory_model(self):
+        """MemoryModel of the loaded model, GPU and placement"""
+        extra_base = 0
+        if self.active_placement == PLACEMENT_MODEL_OFFLOAD:
+            # The running component is moved onto the GPU for the call
+            if self._component_bytes is None:
+                self._component_bytes = largest_component_bytes(self.pipeline)
+            extra_base = self._component_bytes
+        key = f"{self.model_name}|{self.device_description}|{self.active_placement}"
+        return self.memory_estimator.model(key, extra_base)
+
+    def _tile_pixels(self):
+        size = getattr(getattr(self.pipeline, "vae", None), "tile_sample_min_size", None)
+        if isinstance(size, (list, tuple)):
+            size = size[0]
+        return size * size if size else None
+
+    def _predict_memory(self, width, height, batch_size, plan, memory):
+        """Predicted peak GPU bytes of a call above resident memory, noted in last_memory"""
+        resident, available = memory
+        prediction = self._memory_model().predict(width, height, batch_size, *plan, tile_pixels=self._tile_pixels())
+        self.last_memory = {"resident": resident, "available": available,
+                            "predicted_peak": resident + prediction["peak"], "peak": None}
+        return prediction["peak"]
+
+    def admit(self, width, height, batch_size=1):
+        """Pre-flight GPU memory check of a pipeline call; returns (batch_size, decode plan)
+
+        A call predicted to fit runs as asked. Otherwise the first of these
+        that fits is used: tiled VAE decoding (unless tiled_decode is "off"),
+        half the batch size (repeatedly), and with ``offload_on_low_memory``
+        model and then sequential CPU offload. Raises InsufficientMemory when
+        nothing fits. Without CUDA or a memory estimator every call fits.
+        An offload only lasts until the ``generate`` or batch that needed it is
+        done, then the weights move back to their requested placement.
+        """
+        plan = self.decode_plan(width, height, batch_size)
+        self.last_memory = None
+        if self.memory_estimator is None or self.active_placement in (None, PLACEMENT_CPU):
+            return batch_size, plan
+        memory = gpu_memory()
+        if memory is None:
+            return batch_size, plan
+
+        while True:
+            budget = memory[1] * self.memory_estimator.margin
+            candidates = []
+            size = batch_size
+            while True:
+                candidates.append((size, self.decode_plan(width, height, size)))
+                if self.tiled_decode != "off":
+                    candidates.append((size, (True, size > 1)))
+                if size == 1:
+                    break
+                size = max(1, size // 2)
+
+            needed = None
+            for size, candidate in dict.fromkeys(candidates):
+                peak = self._predict_memory(width, height, size, candidate, memory)
+                if needed is None:
+                    needed = peak
+                if peak <= budget:
+                    if size < batch_size:
+                        self.set_status(f"A batch of {batch_size} at {width}x{height} would need about "
+                                        f"{format_bytes(needed)} of GPU memory, running {size} at a time")
+                    elif candidate[0] and not plan[0]:
+                        self.set_status(f"Tiling the decode of {width}x{height} to fit in GPU memory")
+                    return size, candidate
+
+            lighter = LIGHTER_PLACEMENT.get(self.active_placement) if self.offload_on_low_memory else None
+            if lighter is None:
+                raise InsufficientMemory(
+                    f"{width}x{height} needs about {format_bytes(needed)} of GPU memory during generation, "
+                    f"but only {format_bytes(int(budget))} is free; lower the resolution or use a lighter placement")
+            self.set_status(f"{width}x{height} would need about {format_bytes(needed)} of GPU memory, "
+                            f"switching to {PLACEMENTS[lighter]} until it is done")
+            if self._offloaded_from is None:
+                self._offloaded_from = self.active_placement
+            self._switch_placement(lighter)
+            memory = gpu_memory()
+            if self.active_placement == PLACEMENT_CPU or memory is None:
+                self.last_memory = None
+                return batch_size, plan
+
+    def estimate_memory(self, width, height, batch_size=1):
+        """Predicted peak GPU bytes of a call as it would run now, or None without a GPU check"""
+        memory = gpu_memory() if self.memory_estimator is not None else None
+        if memory is None or self.active_placement in (None, PLACEMENT_CPU):
+            return None
+        plan = self.decode_plan(width, height, batch_size)
+        prediction = self._memory_model().predict(width, height, batch_size, *plan, tile_pixels=self._tile_pixels())
+        return memory[0] + prediction["peak"]
+
+    def _restore_placement(self):
+        """Move the weights back to the placement a memory check switched away from, if it did"""
+        placement, self._offloaded_from = self._offloaded_from, None
+        if placement is None or self.pipeline is None or placement == self.active_placement:
+            return
+        self.set_status(f"Switching back to {PLACEMENTS[placement]}")
+        self._switch_placement(placement)
+        self.set_status(f"Back on {PLACEMENTS[placement]}: {self.memory_description}")
+
+    def _switch_placement(self, placement):
+        """Re-place the loaded pipeline, e.g. offload it after a failed memory check"""
+        self.pipeline, self.device_description, self.active_placement = apply_placement(
+            self.pipeline, placement, status_callback=self.set_status)
+        self._release_memory()
+        self.memory_description = describe_memory()
+
+    def _observe_memory(self, probe, width, height, batch_size):
+        """Compare a call's measured peak with its prediction and refine the memory model"""
+        memory = self.last_memory
+        memory["peak"] = probe.resident + probe.peak
+        if probe.decode is not None:
+            tiled, sliced = self._decode_state or (False, False)
+            self._memory_model().observe(width, height, batch_size, probe.denoise, probe.decode, tiled, sliced,
+                                         self._tile_pixels())
+            try:
+                self.memory_estimator.save()
+            except OSError as e:
+                self.set_status(f"Could not save the memory profile: {e}")
+        if memory["peak"] > memory["predicted_peak"] * 1.1:
+            self.set_status(f"GPU memory peaked at {format_bytes(memory['peak'])}, estimated "
+                            f"{format_bytes(memory['predicted_peak'])}; the estimate has been updated")
+
+    def calibrate_memory(self, runs=CALIBRATION_RUNS):
+        """Fit the memory model of the loaded model, GPU and placement with one-step generations
+
+        Returns the fitted MemoryModel; an estimator with a file keeps it for
+        later sessions.
+        """
+        self._require_pipeline()
+        if self.memory_estimator is None or self.active_placement == PLACEMENT_CPU or gpu_memory() is None:
+            raise RuntimeError("Memory calibration needs a CUDA GPU and the memory check enabled")
+        for width, height, batch_size in runs:
+            self.set_status(f"Calibrating GPU memory: {width}x{height}, batch of {batch_size}...")
+            # Whole-batch decoding spreads the decode measurements over the most pixels
+            plan = (False, False)
+            self._prepare_decode(width, height, batch_size, plan)
+            self._predict_memory(width, height, batch_size, plan, gpu_memory())
+            self._run_batch(["A calibration image"] * batch_size, width, height, 1, 0.0, [0] * batch_size)
+            self._release_memory()
+        self.last_memory = None
+        model = self._memory_model()
+        self.set_status(f"GPU memory model: {model.describe()}")
+        return model
+
+    def decode_plan(self, width, height, batch_size=1):
+        """(tiled, sliced) VAE decoding for a pipeline call of batch_size images
+
+        In "auto" mode images above ``tiled_decode_pixels`` are tiled, and a
+        batch whose pixels together exceed it is decoded one image at a time.
+        """
+        pixels = width * height
+        if self.tiled_decode == "off":
+            return False, False
+        tiled = self.tiled_decode == "on" or pixels > self.tiled_decode_pixels
+        sliced = batch_size > 1 and (tiled or pixels * batch_size > self.tiled_decode_pixels)
+        return tiled, sliced
+
+    def _prepare_decode(self, width, height, batch_size, plan=None):
+        """Set up the VAE for the next pipeline call; returns a label for the metrics record"""
+        if plan is None:
+            plan = self.decode_plan(width, height, batch_size)
+        vae = getattr(self.pipeline, "vae", None)
+        if vae is None or not hasattr(vae, "enable_tiling"):
+            return None
+        if plan != self._decode_state:
+            configure_vae_decode(vae, *plan)
+            self._decode_state = plan
+            if plan[0]:
+                self.set_status(f"Decoding {width}x{height} in tiles to limit memory")
+        return describe_decode(*plan)
+
+    def _timer(self):
+        return self.metrics.timer() if self.metrics is not None else NULL_TIMER
+
+    def _record(self, event, timer, settings, images=0, queue_wait=None, error=None, output_bytes=None, cache=None,
+                memory=None):
+        """Send one record to the metrics recorder, if there is one"""
+        if self.metrics is None:
+            return
+        width, height, steps, guidance, seed, batch_size, decode = settings
+        if error is None:
+            status = "ok"
+        elif isinstance(error, JobCancelled):
+            status = "cancelled"
+        elif isinstance(error, InsufficientMemory):
+            status = "rejected"
+        elif is_out_of_memory(error):
+            status = "out_of_memory"
+        else:
+            status = "error"
+        self.metrics.record({
+            "event": event,
+            "status": status,
+            "error": str(error) if error is not None else None,
+            "model": self.model_name,
+            "device": self.device_description,
+            "placement": self.active_placement,
+            "width": width,
+            "height": height,
+            "steps": steps,
+            "guidance": guidance,
+            "seed": seed,
+            "batch_size": batch_size,
+            "vae_decode": decode,
+            "images": images,
+            "seconds": timer.elapsed,
+            "stages": dict(timer.stages),
+            "queue_wait": queue_wait,
+            "output_bytes": output_bytes,
+            "result_cache": cache,
+            # Predicted and measured peak GPU bytes from the memory check
+            "gpu_memory": memory,
+        })
+
+    def _record_when_saved(self, timer, settings, count, queue_wait, memory=None):
+        """Writer callback that records a micro-batch once all its images are written"""
+        lock = threading.Lock()
+        state = {"pending": count, "bytes": 0, "error": None}
+
+        def on_saved(filepath, error):
+            with lock:
+                if error is None:
+                    state["bytes"] += os.path.getsize(filepath)
+                elif state["error"] is None:
+                    state["error"] = error
+                state["pending"] -= 1
+                if state["pending"]:
+                    return
+            timer.mark("save")
+            self._record("batch", timer, settings, images=count, queue_wait=queue_wait,
+                         error=state["error"], output_bytes=state["bytes"], memory=memory)
+
+        return on_saved
+
+    def prompt_kwargs(self, prompts, guidance):
+        """Pipeline keyword arguments for a list of prompts
+
+        With an embedding cache the prompts are encoded here (cache hits skip
+        the text encoder) and passed as ``prompt_embeds``; otherwise the raw
+        prompt text is handed to the pipeline.
+        """
+        if self.embedding_cache is None or not hasattr(self.pipeline, "encode_prompt"):
+            return {"prompt": list(prompts)}
+
+        kwargs = {"prompt_embeds": self.encode_prompts(prompts)}
+        # Pipelines run classifier-free guidance from guidance > 0 (older ones from > 1) and then need
+        # negative embeddings; one that does not run it ignores them
+        if guidance > 0:
+            kwargs["negative_prompt_embeds"] = self.encode_prompts([""] * len(prompts))
+        return kwargs
+
+    def encode_prompts(self, prompts):
+        """Return one prompt embedding per prompt, encoding only cache misses"""
+        device = getattr(self.pipeline, "_execution_device", None)
+        text_encoder = getattr(self.pipeline, "text_encoder", None)
+        settings = {
+            "max_sequence_length": MAX_SEQUENCE_LENGTH,
+            "dtype": getattr(text_encoder, "dtype", None),
+        }
+
+        # Look up each distinct prompt once, then encode all misses in one call
+        found = {}
+        for prompt in dict.fromkeys(prompts):
+            key = self.embedding_cache.make_key(self.model_name, prompt, **settings)
+            cached = self.embedding_cache.get(key, device=device)
+            if cached is not None:
+                found[prompt] = cached
+
+        missing = [prompt for prompt in dict.fromkeys(prompts) if prompt not in found]
+        if missing:
+            import torch
+            with torch.no_grad():
+                # The pipeline applies its chat template by rewriting the list it is given
+                encoded, _ = self.pipeline.encode_prompt(
+                    prompt=list(missing),
+                    device=device,
+                    do_classifier_free_guidance=False,
+                    max_sequence_length=MAX_SEQUENCE_LENGTH,
+                )
+            for prompt, embedding in zip(missing, encoded):
+                self.embedding_cache.put(self.embedding_cache.make_key(self.model_name, prompt, **settings), embedding)
+                found[prompt] = embedding
+
+        return [found[prompt] for prompt in prompts]
+
+    def _release_memory(self):
+        """Free cached GPU memory after an out-of-memory error"""
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def save_image(self, image, filepath, output_format=None):
+        """Save an image in output_format (default: the engine's), creating the parent directory if needed"""
+        timer = self._timer()
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        save_image(image, filepath, output_format or self.output_format)
+        if self.metrics is not None:
+            timer.mark("save")
+            self._record("save", timer, (image.size[0], image.size[1], None, None, None, 1, None),
+                         output_bytes=os.path.getsize(filepath))
+        return filepath
@@ -0,0 +1,212 @@
+"""Recent results for the GUI's history strip: thumbnails plus a memory-capped store of full images.
+
+Every entry keeps a small thumbnail, made when it is added. Full-resolution
+images stay in memory up to ``max_memory_bytes``, least recently viewed
+evicted first. An evicted image that was already saved (a batch output) is
+simply dropped and reloaded from its file when it is viewed again; one that
+exists nowhere else (an interactive generation) is first spilled to
+``directory``. Entries beyond ``max_entries`` are forgotten along with their
+spill files, so browsing hundreds of 4K results keeps memory and disk use
+bounded.
+
+Every method is thread-safe. Adding, spilling and reloading resample, encode
+and decode images, so the GUI calls them from worker threads only.
+"""
+
+import atexit
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .encoders import OutputFormat, load_image
+from .placement import format_bytes
+from .pyramid import image_nbytes
+
+DEFAULT_MAX_MEMORY_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 500
+THUMBNAIL_SIZE = (96, 96)
+# Spilled images are written quickly rather than small: they only live for the session
+SPILL_FORMAT = "png:1"
+SPILL_PREFIX = "history_"
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    """A copy of image scaled to fit size"""
+    thumbnail = image.copy() if image.mode == "RGB" else image.convert("RGB")
+    # reducing_gap shrinks by whole factors first, so a 4K image costs a few milliseconds
+    thumbnail.thumbnail(size, reducing_gap=2.0)
+    return thumbnail
+
+
+class HistoryEntry:
+    """One result: its label, size and thumbnail, and the file its full image can be reloaded from"""
+
+    def __init__(self, entry_id, label, size, thumbnail, path=None, info=None):
+        self.id = entry_id
+        self.label = label
+        self.size = size
+        self.thumbnail = thumbnail
+        # Saved output or spill file; None while the image only exists in memory
+        self.path = path
+        # True if path is a spill file owned (and deleted) by the history
+        self.spilled = False
+        self.info = info or {}
+        self.created = time.time()
+
+    def describe(self):
+        return f"{self.label} ({self.size[0]}x{self.size[1]})"
+
+
+class ImageHistory:
+    """Recent results, oldest first, with their full images in a RAM-capped LRU that spills to disk"""
+
+    def __init__(self, directory, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES, max_entries=DEFAULT_MAX_ENTRIES,
+                 thumbnail_size=THUMBNAIL_SIZE, spill_format=SPILL_FORMAT):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_entries = max_entries
+        self.thumbnail_size = thumbnail_size
+        self.spill_format = OutputFormat.parse(spill_format)
+        self._entries = OrderedDict()
+        # entry id -> full image, least recently used first
+        self._images = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # One spill at a time, so two threads never write the same image
+        self._spill_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.spills = 0
+        self.reloads = 0
+        os.makedirs(directory, exist_ok=True)
+        # Spill files of an earlier session are never referenced again
+        self._remove_spills(name for name in os.listdir(directory) if name.startswith(SPILL_PREFIX))
+        atexit.register(self.clear)
+
+    def add(self, image, label="", path=None, **info):
+        """Add a result; path is the file it was saved to, if any. Returns the new entry"""
+        entry = HistoryEntry(next(self._ids), label, image.size, make_thumbnail(image, self.thumbnail_size),
+                             path, info)
+        with self._lock:
+            self._entries[entry.id] = entry
+            self._keep(entry.id, image)
+            dropped = []
+            while len(self._entries) > self.max_entries:
+                dropped.append(self._forget(next(iter(self._entries))))
+        self._remove_spills(os.path.basename(old.path) for old in dropped if old.spilled)
+        self.trim()
+        return entry
+
+    def entries(self):
+        """Every entry, oldest first"""
+        with self._lock:
+            return list(self._entries.values())
+
+    def get(self, entry_id):
+        with self._lock:
+            return self._entries.get(entry_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def image(self, entry_id, trim=True):
+        """The full image of an entry, reloaded from disk if it was evicted; None if it is gone
+
+        A reload may push other images over the memory cap. ``trim=False``
+        leaves evicting them to a later ``trim()``, so the caller can show the
+        image before older ones are spilled.
+        """
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return None
+            image = self._images.get(entry_id)
+            if image is not None:
+                self._images.move_to_end(entry_id)
+                return image
+            path = entry.path
+        try:
+            image = load_image(path)
+        except (OSError, ValueError):
+            # A saved output that was moved or deleted since
+            return None
+        with self._lock:
+            self.reloads += 1
+            if entry_id in self._entries and entry_id not in self._images:
+                self._keep(entry_id, image)
+        if trim:
+            self.trim()
+        return image
+
+    def _keep(self, entry_id, image):
+        """Hold an entry's image in memory as the most recently used (lock held)"""
+        self._images[entry_id] = image
+        self._memory_bytes += image_nbytes(image)
+
+    def _forget(self, entry_id):
+        """Drop an entry and its image (lock held); returns the entry"""
+        image = self._images.pop(entry_id, None)
+        if image is not None:
+            self._memory_bytes -= image_nbytes(image)
+        return self._entries.pop(entry_id)
+
+    def trim(self):
+        """Evict least recently used images until the rest fit in memory, writing unsaved ones to disk
+
+        The most recently used image always stays, however large it is.
+        """
+        with self._spill_lock:
+            while True:
+                with self._lock:
+                    if self._memory_bytes <= self.max_memory_bytes or len(self._images) <= 1:
+                        return
+                    entry_id, image = next(iter(self._images.items()))
+                    entry = self._entries[entry_id]
+                    path = entry.path
+                if path is None:
+                    # Written while the image stays readable in memory; a failed write keeps it there
+                    path = os.path.join(self.directory, self.spill_format.filename(f"{SPILL_PREFIX}{entry_id}"))
+                    try:
+                        self.spill_format.save(image, path)
+                    except OSError as e:
+                        print(f"Could not spill history image {entry_id}: {e}")
+                        return
+                with self._lock:
+                    forgotten = self._entries.get(entry_id) is not entry
+                    if not forgotten:
+                        if entry.path is None:
+                            entry.path = path
+                            entry.spilled = True
+                            self.spills += 1
+                        self._images.pop(entry_id)
+                        self._memory_bytes -= image_nbytes(image)
+                if forgotten and entry.path is None:
+                    # Dropped from the history while it was written
+                    self._remove_spills([os.path.basename(path)])
+
+    def _remove_spills(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    @property
+    def memory_bytes(self):
+        """Bytes of full images held in memory"""
+        return self._memory_bytes
+
+    def clear(self):
+        """Forget every entry and delete the spill files"""
+        with self._lock:
+            dropped = [self._forget(entry_id) for entry_id in list(self._entries)]
+        self._remove_spills(os.path.basename(entry.path) for entry in dropped if entry.spilled)
+
+    def describe(self):
+        with self._lock:
+            in_memory = len(self._images)
+            count = len(self._entries)
+        return (f"{count} results, {in_memory} in memory ({format_bytes(self._memory_bytes)}), "
+                f"{self.spills} spilled, {self.reloads} reloaded")
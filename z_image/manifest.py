@@ -0,0 +1,251 @@
+"""Append-only batch manifests so interrupted batches can be resumed.
+
+A manifest is a JSON lines file next to the batch's images. The first line
+is a header with the batch settings and every prompt (plain text, or a dict
+with its own settings as read by ``z_image.prompts``); each following line
+records one finished (or failed) prompt::
+
+    {"type": "header", "batch_id": "20250101_120000", "width": 1024, ..., "prompts": [...]}
+    {"type": "entry", "index": 0, "prompt_hash": "...", "seed": 42, "status": "done", "path": "..."}
+
+Entries are only appended after the image is on disk and each append is
+fsynced, so a crash at worst loses the entry of the image being written and
+that prompt is generated again on resume.
+
+A batch read from a streamed ``PromptFile`` stores the file's path, size and
+SHA-256 under ``"prompt_file"`` instead of the prompts themselves; the file
+must be unchanged to resume such a batch.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+from datetime import datetime
+
+from .encoders import OutputFormat
+from .prompts import PromptFile, prompt_name, prompt_seed
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.jsonl"
+
+DONE = "done"
+FAILED = "failed"
+
+
+def prompt_hash(prompt):
+    if not isinstance(prompt, str):
+        prompt = json.dumps(prompt, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class BatchManifest:
+    """Settings, prompts and per-prompt outcomes of one batch
+
+    Create a new manifest with ``BatchManifest.create`` and reopen an
+    existing one with ``BatchManifest.load``. Image filenames derive from the
+    batch id and the prompt index (or the prompt's own output name), so they
+    stay the same across resumes.
+    """
+
+    def __init__(self, path, header, entries=None):
+        self.path = path
+        self.header = header
+        # index -> latest entry for that prompt
+        self.entries = entries or {}
+        self._lock = threading.Lock()
+        # Set when the file ends in a line cut short by a crash
+        self._needs_newline = False
+        self._prompts = header.get("prompts")
+        # Manifests from before output formats were configurable hold PNG images
+        self.output_format = OutputFormat.parse(header.get("output_format"))
+
+    @classmethod
+    def create(cls, output_dir, prompts, width, height, steps, guidance, seed=None, model=None, batch_id=None,
+               output_format=None):
+        """Write the header of a new manifest in output_dir and return it
+
+        Without a seed a random base seed is drawn, so every prompt's seed is
+        known and a resumed batch produces the same images. ``output_format``
+        (a spec, see ``z_image.encoders``) is kept for resumes too.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        if batch_id is None:
+            # Two batches started within the same second get distinct ids
+            batch_id = timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            number = 1
+            while os.path.exists(os.path.join(output_dir, f"batch_{batch_id}{MANIFEST_SUFFIX}")):
+                number += 1
+                batch_id = f"{timestamp}-{number}"
+        if seed is None or seed == "":
+            seed = random.randrange(2 ** 31)
+        header = {
+            "type": "header",
+            "version": MANIFEST_VERSION,
+            "batch_id": batch_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "model": model,
+            "width": width,
+            "height": height,
+            "steps": steps,
+            "guidance": guidance,
+            "seed": int(seed),
+            "output_format": OutputFormat.parse(output_format).spec,
+        }
+        if isinstance(prompts, PromptFile):
+            header["prompt_file"] = {"path": prompts.path, "size": prompts.size, "sha256": prompts.sha256,
+                                     "count": len(prompts)}
+        else:
+            header["prompts"] = list(prompts)
+        path = os.path.join(output_dir, f"batch_{batch_id}{MANIFEST_SUFFIX}")
+        if os.path.exists(path):
+            raise FileExistsError(f"Manifest already exists: {path}")
+        manifest = cls(path, header)
+        if isinstance(prompts, PromptFile):
+            manifest._prompts = prompts
+
+        # Write the header atomically; a half-written header cannot be resumed
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        """Read a manifest, ignoring a final line cut short by a crash"""
+        header = None
+        records = []
+        line = ""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "header":
+                    header = record
+                elif record.get("type") == "entry":
+                    records.append(record)
+        if header is None:
+            raise ValueError(f"Not a batch manifest: {path}")
+        if header.get("version", 1) > MANIFEST_VERSION:
+            raise ValueError(f"Manifest {path} was written by a newer version")
+
+        if "prompt_file" in header:
+            # The file is checked as a whole, so its entries need no per-prompt check
+            prompts = open_prompt_file(header["prompt_file"])
+            entries = {}
+            for record in records:
+                index = record.get("index")
+                if isinstance(index, int) and 0 <= index < len(prompts):
+                    entries[index] = record
+        else:
+            # Entries whose prompt hash disagrees with the header do not count
+            prompts = header["prompts"]
+            hashes = [prompt_hash(prompt) for prompt in prompts]
+            entries = {}
+            for record in records:
+                index = record.get("index")
+                if isinstance(index, int) and 0 <= index < len(hashes) and record.get("prompt_hash") == hashes[index]:
+                    entries[index] = record
+
+        manifest = cls(path, header, entries)
+        manifest._prompts = prompts
+        manifest._needs_newline = bool(line) and not line.endswith("\n")
+        return manifest
+
+    @property
+    def batch_id(self):
+        return self.header["batch_id"]
+
+    @property
+    def prompts(self):
+        """The batch's prompts: a list, or a PromptFile for a streamed batch"""
+        return self._prompts
+
+    @property
+    def seed(self):
+        return self.header["seed"]
+
+    @property
+    def output_dir(self):
+        # Images live next to the manifest, so a moved batch folder still resumes
+        return os.path.dirname(os.path.abspath(self.path))
+
+    def filename(self, index):
+        name = prompt_name(self.prompts[index]) or f"batch_{self.batch_id}_{index+1:03d}"
+        return os.path.join(self.output_dir, self.output_format.filename(name))
+
+    def seed_for(self, index):
+        return prompt_seed(self.prompts[index], index, self.seed)
+
+    def is_done(self, index):
+        """True if the prompt finished and its image still exists"""
+        with self._lock:
+            entry = self.entries.get(index)
+        return entry is not None and entry["status"] == DONE and os.path.exists(self.filename(index))
+
+    def iter_pending(self, start=0):
+        """Yield the indexes from start on that still need generating (missing or failed)"""
+        for index in range(start, len(self.prompts)):
+            if not self.is_done(index):
+                yield index
+
+    def pending(self):
+        return list(self.iter_pending())
+
+    def check_prompt(self, index, prompt):
+        if self.prompts[index] != prompt:
+            raise ValueError(f"Prompt {index + 1} does not match manifest {self.path}")
+
+    def record(self, index, error=None):
+        """Append the outcome of one prompt and fsync it"""
+        entry = {
+            "type": "entry",
+            "index": index,
+            "prompt_hash": prompt_hash(self.prompts[index]),
+            "seed": self.seed_for(index),
+            "status": DONE if error is None else FAILED,
+            "path": os.path.basename(self.filename(index)),
+            "error": str(error) if error is not None else None,
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            if self._needs_newline:
+                line = "\n" + line
+                self._needs_newline = False
+            # One O_APPEND write per entry, so worker processes sharing the
+            # manifest never interleave their lines
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, line.encode("utf-8"))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.entries[index] = entry
+
+    def describe(self):
+        done = len(self.prompts) - len(self.pending())
+        failed = sum(1 for entry in self.entries.values() if entry["status"] == FAILED)
+        text = f"{done}/{len(self.prompts)} done"
+        if failed:
+            text += f", {failed} failed"
+        return text
+
+
+def open_prompt_file(reference):
+    """Open the PromptFile a manifest header refers to, checking it did not change"""
+    path = reference["path"]
+    if not os.path.exists(path):
+        raise ValueError(f"Prompt file of the batch is missing: {path}")
+    if os.path.getsize(path) != reference["size"]:
+        raise ValueError(f"Prompt file changed since the batch started: {path}")
+    prompts = PromptFile.open(path)
+    if prompts.sha256 != reference["sha256"] or len(prompts) != reference["count"]:
+        raise ValueError(f"Prompt file changed since the batch started: {path}")
+    return prompts
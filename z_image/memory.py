@@ -0,0 +1,239 @@
+"""Peak GPU memory model of a pipeline call, for checking a job fits before it runs.
+
+The peak of a call is the memory resident before it plus the larger of its
+two stages, each linear in the pixels involved::
+
+    denoise = denoise_base + denoise_per_pixel * width * height * batch_size
+    decode  = decode_base + decode_per_pixel * decoded_pixels + OUTPUT_BYTES_PER_PIXEL * width * height * batch_size
+
+``decoded_pixels`` is what the VAE decodes at once: the whole batch, one
+image when sliced, or one tile when tiled. The transformer's attention is
+memory efficient, so denoising has no term quadratic in the token count.
+
+The coefficients start from rough defaults and are fitted to measurements:
+``ZImageEngine.calibrate_memory`` runs a few one-step generations, and
+every pipeline call on a GPU adds its observed peaks. Each combination of
+model, GPU and placement has its own model, kept in a JSON file when the
+estimator has a path.
+"""
+
+import json
+import os
+import sys
+import threading
+
+# Share of the free GPU memory a job may plan to use
+DEFAULT_MEMORY_MARGIN = 0.9
+# Measurements kept per stage; older ones give way so the fit follows driver and library updates
+MAX_SAMPLES = 64
+
+# (base bytes, bytes per pixel) before any measurement, for bfloat16 weights on a CUDA GPU
+DEFAULT_COEFFICIENTS = {
+    "denoise": (512 * 1024 * 1024, 384),
+    "decode": (256 * 1024 * 1024, 2560),
+}
+# The decoded images of a batch, as float32 RGB until they are converted to PIL
+OUTPUT_BYTES_PER_PIXEL = 12
+STAGES = ("denoise", "decode")
+
+
+class InsufficientMemory(RuntimeError):
+    """Raised before a pipeline call that is predicted not to fit in GPU memory"""
+
+
+def gpu_memory():
+    """(resident, available) GPU bytes of this process, or None without CUDA
+
+    Available memory counts memory the driver reports free plus memory
+    torch has reserved but is not using.
+    """
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    free, _ = torch.cuda.mem_get_info()
+    allocated = torch.cuda.memory_allocated()
+    return allocated, free + torch.cuda.memory_reserved() - allocated
+
+
+def module_bytes(module):
+    """Bytes of a torch module's parameters and buffers"""
+    total = 0
+    for tensors in (module.parameters(), module.buffers()):
+        for tensor in tensors:
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def largest_component_bytes(pipeline):
+    """Size of the pipeline's largest model: what model CPU offload keeps on the GPU while it runs"""
+    sizes = [module_bytes(component) for component in getattr(pipeline, "components", {}).values()
+             if hasattr(component, "parameters")]
+    return max(sizes, default=0)
+
+
+def decoded_pixels(width, height, batch_size, tiled=False, sliced=False, tile_pixels=None):
+    """Pixels the VAE decodes at once"""
+    pixels = width * height
+    if tiled and tile_pixels:
+        pixels = min(pixels, tile_pixels)
+    return pixels if sliced else pixels * batch_size
+
+
+def fit_line(samples, default_slope):
+    """Least squares (base, slope) through (x, y) samples, neither below zero
+
+    With fewer than two distinct x the default slope is kept and only the
+    base is fitted.
+    """
+    count = len(samples)
+    mean_x = sum(x for x, _ in samples) / count
+    mean_y = sum(y for _, y in samples) / count
+    variance = sum((x - mean_x) ** 2 for x, _ in samples)
+    if variance > 0:
+        slope = max(0.0, sum((x - mean_x) * (y - mean_y) for x, y in samples) / variance)
+    else:
+        slope = default_slope
+    return max(0.0, mean_y - slope * mean_x), slope
+
+
+class MemoryModel:
+    """Predicts the peak GPU memory of a pipeline call above what is resident before it"""
+
+    def __init__(self, defaults=None, samples=None):
+        self.defaults = dict(defaults or DEFAULT_COEFFICIENTS)
+        # stage -> [(pixels, bytes above resident)]
+        self.samples = {stage: [tuple(sample) for sample in (samples or {}).get(stage, [])] for stage in STAGES}
+        self.coefficients = {}
+        self.fit()
+
+    @property
+    def calibrated(self):
+        return all(self.samples[stage] for stage in STAGES)
+
+    def fit(self):
+        for stage in STAGES:
+            base, slope = self.defaults[stage]
+            if self.samples[stage]:
+                base, slope = fit_line(self.samples[stage], slope)
+            self.coefficients[stage] = (base, slope)
+
+    def predict(self, width, height, batch_size=1, tiled=False, sliced=False, tile_pixels=None):
+        """Predicted bytes of each stage and of the call's peak, above resident memory"""
+        denoise_base, denoise_slope = self.coefficients["denoise"]
+        decode_base, decode_slope = self.coefficients["decode"]
+        pixels = width * height * batch_size
+        denoise = denoise_base + denoise_slope * pixels
+        decode = (decode_base + decode_slope * decoded_pixels(width, height, batch_size, tiled, sliced, tile_pixels)
+                  + OUTPUT_BYTES_PER_PIXEL * pixels)
+        return {"denoise": int(denoise), "decode": int(decode), "peak": int(max(denoise, decode))}
+
+    def observe(self, width, height, batch_size, denoise, decode, tiled=False, sliced=False, tile_pixels=None):
+        """Add the measured stage peaks (bytes above resident) of one call and refit"""
+        if denoise is not None:
+            self._add("denoise", width * height * batch_size, denoise)
+        if decode is not None:
+            pixels = decoded_pixels(width, height, batch_size, tiled, sliced, tile_pixels)
+            self._add("decode", pixels, decode - OUTPUT_BYTES_PER_PIXEL * width * height * batch_size)
+        self.fit()
+
+    def _add(self, stage, pixels, size):
+        samples = self.samples[stage]
+        samples.append((pixels, max(0, size)))
+        del samples[:-MAX_SAMPLES]
+
+    def describe(self):
+        parts = []
+        for stage in STAGES:
+            base, slope = self.coefficients[stage]
+            parts.append(f"{stage} {base / (1024 * 1024):.0f} MB + {slope:.0f} B/pixel")
+        source = f"{sum(len(self.samples[stage]) for stage in STAGES)} measurements" if self.calibrated else "defaults"
+        return ", ".join(parts) + f" ({source})"
+
+    def to_dict(self):
+        return {"defaults": self.defaults, "samples": self.samples}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({stage: tuple(value) for stage, value in data.get("defaults", DEFAULT_COEFFICIENTS).items()},
+                   data.get("samples"))
+
+
+class MemoryEstimator:
+    """One MemoryModel per model, GPU and placement, optionally kept in a JSON file"""
+
+    def __init__(self, path=None, margin=DEFAULT_MEMORY_MARGIN):
+        self.path = path
+        self.margin = margin
+        self._models = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._models = {key: MemoryModel.from_dict(value) for key, value in data.get("models", {}).items()}
+            except (OSError, ValueError, AttributeError, TypeError):
+                # A damaged profile only costs the calibration
+                self._models = {}
+
+    def __reduce__(self):
+        # Worker processes reopen the file instead of sharing the lock
+        return type(self), (self.path, self.margin)
+
+    def model(self, key, extra_base=0):
+        """The model for key, created from the defaults plus extra_base bytes per stage"""
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                defaults = {stage: (base + extra_base, slope) for stage, (base, slope) in DEFAULT_COEFFICIENTS.items()}
+                model = self._models[key] = MemoryModel(defaults)
+            return model
+
+    def save(self):
+        """Write every model to the estimator's file, if it has one"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {"models": {key: model.to_dict() for key, model in self._models.items()}}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+
+class PeakProbe:
+    """Measures the resident memory and the denoise and decode peaks of one pipeline call
+
+    The peak counter is read and reset at the last denoising step, so what
+    follows it (the VAE decode) is measured on its own.
+    """
+
+    def __init__(self):
+        self.torch = sys.modules["torch"]
+        self.torch.cuda.reset_peak_memory_stats()
+        self.resident = self.torch.cuda.memory_allocated()
+        self.denoise = None
+        self.decode = None
+
+    def step_callback(self, step_callback):
+        def on_step(step, total_steps, latents=None):
+            if step == total_steps:
+                self.denoise = self.torch.cuda.max_memory_allocated() - self.resident
+                self.torch.cuda.reset_peak_memory_stats()
+            if step_callback:
+                step_callback(step, total_steps, latents)
+        return on_step
+
+    def done(self):
+        peak = self.torch.cuda.max_memory_allocated() - self.resident
+        if self.denoise is None:
+            # The pipeline did not report its steps, so the stages cannot be told apart
+            self.denoise = peak
+        else:
+            self.decode = peak
+
+    @property
+    def peak(self):
+        return max(size for size in (self.denoise, self.decode, 0) if size is not None)
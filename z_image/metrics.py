@@ -0,0 +1,279 @@
+"""Per-generation metrics: a JSONL log plus counters and histograms for Prometheus.
+
+Pass a ``MetricsRecorder`` to ``ZImageEngine(metrics=...)``. Without one the
+engine only swaps in ``NULL_TIMER``, so disabled metrics cost nothing but a
+few attribute lookups per pipeline call.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_PORT = 9464
+# Environment overrides for the GUI: log file ("" disables it) and metrics port
+METRICS_LOG_ENV = "Z_IMAGE_METRICS_LOG"
+METRICS_PORT_ENV = "Z_IMAGE_METRICS_PORT"
+
+# Histogram bucket upper bounds in seconds
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class GenerationTimer:
+    """Splits one pipeline call into encode, denoise and decode time
+
+    The denoising loop ends at the last step callback; everything after it
+    (VAE decode and conversion to PIL) is counted as decode.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self._last_step = None
+        self.stages = {}
+
+    def mark(self, stage):
+        """Attribute the time since the previous mark to ``stage``"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def step_callback(self, step_callback):
+        """Wrap an engine step callback to note when the last step ended"""
+        def on_step(step, total_steps, latents=None):
+            self._last_step = time.perf_counter()
+            if step_callback:
+                step_callback(step, total_steps, latents)
+        return on_step
+
+    def pipeline_done(self):
+        if self._last_step is None:
+            self.mark("pipeline")
+            return
+        now = time.perf_counter()
+        self.stages["denoise"] = self.stages.get("denoise", 0.0) + self._last_step - self._last
+        self.stages["decode"] = self.stages.get("decode", 0.0) + now - self._last_step
+        self._last = now
+        self._last_step = None
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class NullTimer:
+    """Timer used while metrics are disabled; every method is a no-op"""
+
+    stages = {}
+    elapsed = None
+
+    def mark(self, stage):
+        pass
+
+    def step_callback(self, step_callback):
+        return step_callback
+
+    def pipeline_done(self):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in sorted(labels)) + "}"
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(value, buckets=list(value["buckets"])))
+                                for key, value in self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRecorder:
+    """Writes one JSON line per generation and feeds the registry
+
+    Either part is optional: ``log_path=None`` keeps only the in-memory
+    counters, ``registry=None`` only writes the log.
+    """
+
+    def __init__(self, log_path=None, registry=None):
+        self.log_path = log_path
+        self.registry = registry
+        self._lock = threading.Lock()
+        if log_path:
+            directory = os.path.dirname(log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        if registry is not None:
+            registry.describe("z_image_jobs_total", "Pipeline calls by kind and outcome")
+            registry.describe("z_image_images_total", "Images generated")
+            registry.describe("z_image_output_bytes_total", "Bytes of images written")
+            registry.describe("z_image_job_seconds", "Wall time of a pipeline call including encoding")
+            registry.describe("z_image_stage_seconds", "Wall time per generation stage")
+            registry.describe("z_image_queue_wait_seconds", "Time a job waited in the queue")
+            registry.describe("z_image_result_cache_total", "Result cache lookups by outcome")
+            registry.describe("z_image_first_pixel_seconds", "Time from a finished image to its first pixels on screen")
+
+    def timer(self):
+        return GenerationTimer()
+
+    def _write(self, record):
+        record = dict(record, time=datetime.now().isoformat(timespec="milliseconds"))
+        if self.log_path:
+            line = json.dumps(record, default=str)
+            with self._lock:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        return record
+
+    def record(self, record):
+        """Log a record (a dict) and update the counters from it"""
+        record = self._write(record)
+        registry = self.registry
+        if registry is None:
+            return
+        event = record.get("event", "generate")
+        registry.inc("z_image_jobs_total", event=event, status=record.get("status", "ok"))
+        if record.get("images"):
+            registry.inc("z_image_images_total", record["images"])
+        if record.get("output_bytes"):
+            registry.inc("z_image_output_bytes_total", record["output_bytes"])
+        if record.get("seconds") is not None:
+            registry.observe("z_image_job_seconds", record["seconds"], event=event)
+        for stage, seconds in (record.get("stages") or {}).items():
+            registry.observe("z_image_stage_seconds", seconds, stage=stage)
+        if record.get("result_cache"):
+            registry.inc("z_image_result_cache_total", result=record["result_cache"])
+        if record.get("queue_wait") is not None:
+            registry.observe("z_image_queue_wait_seconds", record["queue_wait"])
+
+    def record_display(self, first_pixel, width, height, prepare_seconds=None):
+        """Log how long a finished image took to reach the screen; not counted as a job"""
+        self._write({"event": "display", "width": width, "height": height, "first_pixel": first_pixel,
+                     "prepare_seconds": prepare_seconds})
+        if self.registry is not None:
+            self.registry.observe("z_image_first_pixel_seconds", first_pixel)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves ``GET /metrics`` for a registry from a background thread"""
+
+    daemon_threads = True
+
+    def __init__(self, registry, host="127.0.0.1", port=DEFAULT_METRICS_PORT):
+        self.registry = registry
+        super().__init__((host, port), MetricsRequestHandler)
+        self._thread = threading.Thread(target=self.serve_forever, name="z-image-metrics", daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def metrics_from_environment(default_log=None, status_callback=None):
+    """MetricsRecorder configured from Z_IMAGE_METRICS_LOG and Z_IMAGE_METRICS_PORT
+
+    Returns None when neither a log file nor a port is configured.
+    """
+    log_path = os.environ.get(METRICS_LOG_ENV, default_log) or None
+    port = os.environ.get(METRICS_PORT_ENV, "")
+    registry = None
+    if port:
+        registry = MetricsRegistry()
+        try:
+            server = MetricsServer(registry, port=int(port)).start()
+        except (OSError, ValueError) as e:
+            registry = None
+            if status_callback:
+                status_callback(f"Metrics endpoint disabled: {e}")
+        else:
+            if status_callback:
+                status_callback(f"Metrics available at {server.url}")
+    if log_path is None and registry is None:
+        return None
+    return MetricsRecorder(log_path, registry)
@@ -0,0 +1,132 @@
+"""Where the pipeline's weights live: fully on the GPU, offloaded to the CPU, or CPU only."""
+
+import os
+import sys
+
+PLACEMENT_FULL = "full"
+PLACEMENT_MODEL_OFFLOAD = "model_offload"
+PLACEMENT_SEQUENTIAL_OFFLOAD = "sequential_offload"
+PLACEMENT_CPU = "cpu"
+
+# Strategy name -> label shown in the GUI, ordered from fastest to most memory frugal
+PLACEMENTS = {
+    PLACEMENT_FULL: "Full GPU",
+    PLACEMENT_MODEL_OFFLOAD: "Model CPU offload",
+    PLACEMENT_SEQUENTIAL_OFFLOAD: "Sequential CPU offload",
+    PLACEMENT_CPU: "CPU only",
+}
+
+DEFAULT_PLACEMENT = PLACEMENT_FULL
+
+
+def placement_from_label(label):
+    """Map a GUI label (or a strategy name) back to its strategy name"""
+    for name, text in PLACEMENTS.items():
+        if label in (name, text):
+            return name
+    raise ValueError(f"Unknown placement strategy: {label}")
+
+
+def remove_offload(pipeline):
+    """Take a pipeline off model or sequential CPU offload, so it can be moved or offloaded anew
+
+    ``pipeline.to`` refuses a sequentially offloaded pipeline and leaves the
+    hooks of a model offloaded one in place, so they are removed first.
+    """
+    remove_all_hooks = getattr(pipeline, "remove_all_hooks", None)
+    if remove_all_hooks is None:
+        return
+    remove_all_hooks()
+    # Set by enable_*_cpu_offload; without them the next offload picks its device afresh
+    for name in ("_offload_device", "_offload_gpu_id"):
+        vars(pipeline).pop(name, None)
+
+
+def apply_placement(pipeline, strategy, status_callback=None):
+    """Move or hook the pipeline according to strategy
+
+    Returns ``(pipeline, device_description, effective_strategy)``. Strategies
+    that need CUDA fall back to CPU when it is unavailable or fails.
+    """
+    import torch
+
+    def report(message):
+        if status_callback:
+            status_callback(message)
+
+    if strategy not in PLACEMENTS:
+        raise ValueError(f"Unknown placement strategy: {strategy}")
+
+    if strategy != PLACEMENT_CPU:
+        try:
+            if not torch.cuda.is_available():
+                raise RuntimeError("CUDA not available")
+            device_name = torch.cuda.get_device_name(0)
+
+            if strategy == PLACEMENT_FULL:
+                report("Attempting to load model on CUDA...")
+                remove_offload(pipeline)
+                pipeline = pipeline.to("cuda")
+            elif strategy == PLACEMENT_MODEL_OFFLOAD:
+                # Whole components move to the GPU only while they run
+                report("Enabling model CPU offload...")
+                remove_offload(pipeline)
+                pipeline.enable_model_cpu_offload()
+            else:
+                # Individual layers stream to the GPU; slowest, smallest footprint
+                report("Enabling sequential CPU offload...")
+                pipeline.enable_sequential_cpu_offload()
+
+            return pipeline, f"CUDA ({device_name})", strategy
+        except Exception as e:
+            # Fallback to CPU
+            report(f"CUDA failed ({e}), falling back to CPU...")
+            return pipeline, "CPU (CUDA fallback)", PLACEMENT_CPU
+
+    return pipeline, "CPU", PLACEMENT_CPU
+
+
+def host_resident_bytes():
+    """Resident set size of this process in bytes, or None if unknown"""
+    try:
+        # psutil is a dependency of accelerate, so it is normally available
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def resident_memory():
+    """Current GPU and host memory use of this process, in bytes"""
+    memory = {"host_rss": host_resident_bytes(), "gpu_allocated": None, "gpu_reserved": None}
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        memory["gpu_allocated"] = torch.cuda.memory_allocated()
+        memory["gpu_reserved"] = torch.cuda.memory_reserved()
+    return memory
+
+
+def format_bytes(size):
+    """Human readable byte count"""
+    if size is None:
+        return "n/a"
+    if size < 1024:
+        return f"{size} B"
+    for unit in ("KB", "MB", "GB"):
+        size /= 1024
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+
+
+def describe_memory(memory=None):
+    """One line summary of resident GPU and host memory"""
+    memory = memory or resident_memory()
+    text = f"RAM {format_bytes(memory['host_rss'])}"
+    if memory["gpu_allocated"] is not None:
+        text = f"GPU {format_bytes(memory['gpu_allocated'])} (reserved {format_bytes(memory['gpu_reserved'])}), " + text
+    return text
@@ -0,0 +1,294 @@
+"""Worker processes that split one batch across several GPUs or CPU sets.
+
+Every worker is a separate process pinned to one device (``cuda:1``) or a
+set of CPU cores (``cpu:0-7``) and loads its own pipeline. The batch's
+manifest is the shared record: workers write their images next to it under
+the manifest's stable names and append their entries to it, so a pooled
+batch resumes exactly like a single-process one.
+
+The parent groups the pending prompts into buckets of identical shape and
+settings, cuts each bucket into micro-batch tasks and gives each worker a
+contiguous shard. A worker that finishes its shard steals tasks
+from the back of the longest remaining shard, so a slow device never holds
+up the end of the batch.
+"""
+
+import multiprocessing
+import os
+import queue
+from collections import deque
+from functools import partial
+
+from .engine import DEFAULT_MODEL, ZImageEngine, bucket_prompts
+from .manifest import BatchManifest
+from .placement import DEFAULT_PLACEMENT, PLACEMENT_CPU
+
+
+def parse_cpu_list(spec):
+    """Parse "0-3,8" into {0, 1, 2, 3, 8}"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def pin_device(device):
+    """Restrict this process to one device spec; returns the placement override, if any
+
+    Must run before torch is imported: ``cuda:N`` hides every other GPU and
+    ``cpu:0-7`` sets the CPU affinity and the number of math threads.
+    """
+    kind, _, spec = device.partition(":")
+    if kind == "cuda":
+        os.environ["CUDA_VISIBLE_DEVICES"] = spec or "0"
+        return None
+    if kind == "cpu":
+        if spec:
+            cpus = parse_cpu_list(spec)
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, cpus)
+            os.environ["OMP_NUM_THREADS"] = str(len(cpus))
+        return PLACEMENT_CPU
+    raise ValueError(f"Unknown device: {device} (use cuda:N, cpu or cpu:LIST)")
+
+
+def load_worker_engine(model_name, placement, status_callback=None, low_cpu_mem_usage=True, **engine_options):
+    """Default engine factory for workers: load the real model
+
+    ``engine_options`` are further ``ZImageEngine`` arguments, e.g. ``tiled_decode``.
+    """
+    engine = ZImageEngine(model_name=model_name, placement=placement, status_callback=status_callback,
+                          **engine_options)
+    engine.load_model(low_cpu_mem_usage=low_cpu_mem_usage)
+    return engine
+
+
+def worker_main(worker_id, device, model_name, placement, engine_factory, tasks, results):
+    """Entry point of a worker process"""
+    def report(message):
+        results.put(("status", worker_id, message))
+
+    try:
+        placement = pin_device(device) or placement
+        engine = engine_factory(model_name, placement, status_callback=report)
+    except Exception as e:
+        results.put(("error", worker_id, str(e)))
+        return
+    results.put(("ready", worker_id, engine.device_description))
+
+    manifest = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        manifest_path, indexes, batch_size = task
+        if manifest is None or manifest.path != manifest_path:
+            manifest = BatchManifest.load(manifest_path)
+        header = manifest.header
+        try:
+            saved = engine.batch_generate(
+                [manifest.prompts[index] for index in indexes], header["width"], header["height"],
+                header["steps"], header["guidance"], batch_size=batch_size, indexes=indexes,
+                total=len(manifest.prompts), manifest=manifest)
+        except Exception as e:
+            results.put(("failed", worker_id, indexes, str(e)))
+        else:
+            results.put(("done", worker_id, indexes, saved))
+
+
+def make_tasks(manifest, indexes, batch_size):
+    """Group prompt indexes into tasks (index tuples) of at most batch_size
+
+    Each task holds prompts of one bucket, so it runs as full pipeline calls.
+    """
+    header = manifest.header
+    items = [(index, manifest.prompts[index]) for index in indexes]
+    tasks = []
+    for bucket in bucket_prompts(items, header["width"], header["height"], header["steps"], header["guidance"]):
+        bucket_indexes = [index for index, _ in bucket]
+        for start in range(0, len(bucket_indexes), batch_size):
+            tasks.append(tuple(bucket_indexes[start:start + batch_size]))
+    return tasks
+
+
+class WorkerPool:
+    """One worker process per device spec, each holding its own pipeline
+
+    ``engine_factory(model_name, placement, status_callback=...)`` runs in
+    the worker and must be picklable (a module level function or a
+    ``functools.partial`` of one); ``z_image.stub.stub_engine`` gives a
+    CPU-only pool without model weights.
+    """
+
+    def __init__(self, devices, model_name=DEFAULT_MODEL, placement=DEFAULT_PLACEMENT, engine_factory=None,
+                 status_callback=None, start_timeout=600):
+        if not devices:
+            raise ValueError("A worker pool needs at least one device")
+        self.devices = list(devices)
+        self.model_name = model_name
+        self.placement = placement
+        self.engine_factory = engine_factory or load_worker_engine
+        self.status_callback = status_callback
+        self.start_timeout = start_timeout
+        # spawn: CUDA cannot be used in forked children, and workers must pin before importing torch
+        self._context = multiprocessing.get_context("spawn")
+        self._results = None
+        self._tasks = []
+        self._processes = []
+        self.device_descriptions = {}
+
+    def set_status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    def start(self):
+        """Start the workers and wait until each has loaded its pipeline"""
+        if self._processes:
+            return self
+        self._results = self._context.Queue()
+        for worker_id, device in enumerate(self.devices):
+            tasks = self._context.Queue()
+            process = self._context.Process(
+                target=worker_main, name=f"z-image-worker-{worker_id}",
+                args=(worker_id, device, self.model_name, self.placement, self.engine_factory, tasks, self._results),
+                daemon=True)
+            process.start()
+            self._tasks.append(tasks)
+            self._processes.append(process)
+
+        self.set_status(f"Starting {len(self.devices)} workers...")
+        waiting = set(range(len(self.devices)))
+        while waiting:
+            try:
+                kind, worker_id, payload = self._results.get(timeout=self.start_timeout)
+            except queue.Empty:
+                self.close()
+                raise RuntimeError("Timed out waiting for workers to load") from None
+            if kind == "status":
+                self.set_status(f"[worker {worker_id}] {payload}")
+            elif kind == "ready":
+                self.device_descriptions[worker_id] = payload
+                waiting.discard(worker_id)
+            elif kind == "error":
+                self.close()
+                raise RuntimeError(f"Worker {worker_id} ({self.devices[worker_id]}) failed to start: {payload}")
+        self.set_status("Workers ready: " + ", ".join(
+            f"{self.devices[i]} = {self.device_descriptions[i]}" for i in sorted(self.device_descriptions)))
+        return self
+
+    def run(self, manifest, batch_size=1, progress_callback=None):
+        """Generate every pending prompt of a manifest; returns the saved paths
+
+        Failed tasks are recorded in the manifest by the worker and reported
+        in a RuntimeError once the rest of the batch has finished.
+        """
+        self.start()
+        if not isinstance(manifest, BatchManifest):
+            manifest = BatchManifest.load(manifest)
+        manifest_path = os.path.abspath(manifest.path)
+        total = len(manifest.prompts)
+        pending = manifest.pending()
+        done_count = total - len(pending)
+
+        # Contiguous shards keep each worker on neighbouring prompts of the same bucket
+        tasks = make_tasks(manifest, pending, max(1, int(batch_size)))
+        workers = len(self._processes)
+        shard_size = -(-len(tasks) // workers) if tasks else 0
+        shards = [deque(tasks[i * shard_size:(i + 1) * shard_size]) for i in range(workers)]
+
+        running = {}
+        idle = set(range(workers))
+        saved = []
+        failures = []
+
+        def next_task(worker_id):
+            if shards[worker_id]:
+                return shards[worker_id].popleft()
+            victim = max(range(workers), key=lambda i: len(shards[i]))
+            if shards[victim]:
+                # Steal from the far end, away from where the owner is working
+                return shards[victim].pop()
+            return None
+
+        def dispatch():
+            for worker_id in sorted(idle):
+                if not self._processes[worker_id].is_alive():
+                    continue
+                task = next_task(worker_id)
+                if task is None:
+                    continue
+                idle.discard(worker_id)
+                running[worker_id] = task
+                self._tasks[worker_id].put((manifest_path, list(task), batch_size))
+
+        def requeue_dead():
+            # Hand the task of a crashed worker to the others
+            for worker_id, task in list(running.items()):
+                if self._processes[worker_id].is_alive():
+                    continue
+                del running[worker_id]
+                self.set_status(f"Worker {worker_id} ({self.devices[worker_id]}) died, requeueing its task")
+                alive = [i for i in range(workers) if self._processes[i].is_alive()]
+                if not alive:
+                    raise RuntimeError(f"All workers died; resume with {manifest_path}")
+                shards[alive[0]].appendleft(task)
+            dispatch()
+
+        dispatch()
+        while running:
+            try:
+                kind, worker_id, *payload = self._results.get(timeout=1.0)
+            except queue.Empty:
+                requeue_dead()
+                continue
+
+            if kind == "status":
+                self.set_status(f"[worker {worker_id}] {payload[0]}")
+                continue
+            task, result = payload
+            running.pop(worker_id, None)
+            idle.add(worker_id)
+            if kind == "done":
+                saved.extend(result)
+                done_count += len(result)
+                if progress_callback:
+                    progress_callback(done_count, total, result[-1] if result else None)
+            else:
+                failures.append((task, result))
+                self.set_status(f"Worker {worker_id} failed {len(task)} prompts from {task[0] + 1}: {result}")
+            requeue_dead()
+
+        if failures:
+            failed = sum(len(task) for task, _ in failures)
+            raise RuntimeError(f"{failed} prompts failed ({failures[0][1]}); resume with {manifest_path}")
+        self.set_status(f"Batch complete: {done_count}/{total} images saved by {workers} workers")
+        return saved
+
+    def close(self):
+        """Stop the workers after their current task"""
+        for tasks in self._tasks:
+            try:
+                tasks.put(None)
+            except (OSError, ValueError):
+                pass
+        for process in self._processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self._tasks = []
+        self._processes = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def pool_engine_factory(low_cpu_mem_usage=True, **engine_options):
+    """Picklable factory for the real model with the given loading and engine options"""
+    return partial(load_worker_engine, low_cpu_mem_usage=low_cpu_mem_usage, **engine_options)
@@ -0,0 +1,45 @@
+"""Cheap RGB previews of in-progress latents without running the VAE."""
+
+# Linear map from the 16 latent channels of the Flux-family VAE used by
+# Z-Image to RGB in [-1, 1] (the same approximation ComfyUI uses for Flux
+# previews). One small matrix multiply instead of a full VAE decode.
+LATENT_RGB_FACTORS = [
+    [-0.0346, 0.0244, 0.0681],
+    [0.0034, 0.0210, 0.0687],
+    [0.0275, -0.0668, -0.0433],
+    [-0.0174, 0.0160, 0.0617],
+    [0.0859, 0.0721, 0.0329],
+    [0.0004, 0.0383, 0.0115],
+    [0.0405, 0.0861, 0.0915],
+    [-0.0236, -0.0185, -0.0259],
+    [-0.0245, 0.0250, 0.1180],
+    [0.1008, 0.0755, -0.0421],
+    [-0.0515, 0.0201, 0.0011],
+    [0.0428, -0.0012, -0.0036],
+    [0.0817, 0.0765, 0.0749],
+    [-0.1264, -0.0522, -0.1103],
+    [-0.0280, -0.0881, -0.0499],
+    [-0.1262, -0.0982, -0.0778],
+]
+LATENT_RGB_BIAS = [-0.0329, -0.0718, -0.0851]
+
+
+def latents_to_preview(latents, index=0):
+    """Approximate RGB PIL image of one latent in a (batch, 16, h, w) tensor
+
+    The preview has the latent's resolution (1/8 of the output). Returns None
+    for latents of any other layout.
+    """
+    import torch
+    from PIL import Image
+
+    if latents is None or latents.ndim != 4 or latents.shape[1] != len(LATENT_RGB_FACTORS):
+        return None
+
+    with torch.no_grad():
+        latent = latents[index].float()
+        factors = torch.tensor(LATENT_RGB_FACTORS, device=latent.device)
+        bias = torch.tensor(LATENT_RGB_BIAS, device=latent.device)
+        rgb = torch.einsum("chw,cr->hwr", latent, factors) + bias
+        rgb = ((rgb + 1.0) / 2.0).clamp(0, 1).mul(255).to(torch.uint8).cpu().numpy()
+    return Image.fromarray(rgb, "RGB")
@@ -0,0 +1,78 @@
+"""Per-step timing, ETA and throttled live previews for pipeline calls."""
+
+import time
+
+from .preview import latents_to_preview
+
+
+class StepProgress:
+    """Per-step timing, ETA and optional live previews for one pipeline call
+
+    Pass an instance as the engine's ``step_callback``. After every step
+    ``on_progress(step, total_steps, seconds_per_step, eta_seconds)`` is
+    called. With ``on_preview`` set, a latent preview is produced every
+    ``preview_every`` steps and handed to ``on_preview(image, step)``; if
+    making previews costs more than ``max_preview_share`` of the step time,
+    the interval is doubled so previews never dominate generation time.
+    """
+
+    def __init__(self, on_progress=None, on_preview=None, preview_every=1, max_preview_share=0.1):
+        self.on_progress = on_progress
+        self.on_preview = on_preview
+        self.preview_every = max(1, preview_every)
+        self.max_preview_share = max_preview_share
+        self.step_times = []
+        self.preview_times = []
+        self._last = None
+        self.restart()
+
+    def restart(self):
+        """Reset the clock before a new pipeline call"""
+        self._last = time.perf_counter()
+        self.step_times = []
+
+    @property
+    def seconds_per_step(self):
+        if not self.step_times:
+            return None
+        # Skip the first step (warm-up) once there are others to average
+        times = self.step_times[1:] or self.step_times
+        return sum(times) / len(times)
+
+    @property
+    def preview_share(self):
+        """Preview cost as a fraction of denoising time so far"""
+        denoise = sum(self.step_times)
+        return sum(self.preview_times) / denoise if denoise else 0.0
+
+    def __call__(self, step, total_steps, latents=None):
+        now = time.perf_counter()
+        # A new pipeline call (e.g. the next micro-batch) starts again at step 1
+        if step == 1 and self.step_times:
+            self.step_times = []
+        self.step_times.append(now - self._last)
+
+        per_step = self.seconds_per_step
+        eta = per_step * (total_steps - step)
+        if self.on_progress:
+            self.on_progress(step, total_steps, per_step, eta)
+
+        if self.on_preview and latents is not None and step < total_steps and step % self.preview_every == 0:
+            started = time.perf_counter()
+            image = latents_to_preview(latents)
+            if image is not None:
+                self.on_preview(image, step)
+            elapsed = time.perf_counter() - started
+            self.preview_times.append(elapsed)
+
+            # Back off when previews cost more than their share of a step
+            if elapsed > self.max_preview_share * per_step:
+                self.preview_every *= 2
+
+        # Exclude preview time from the next step's measurement
+        self._last = time.perf_counter()
+
+
+def format_progress(step, total_steps, seconds_per_step, eta):
+    """Status text such as "Step 3/8 - 0.42 s/step - ETA 2.1 s" """
+    return f"Step {step}/{total_steps} - {seconds_per_step:.2f} s/step - ETA {eta:.1f} s"
@@ -0,0 +1,364 @@
+"""Prompt files with optional per-prompt settings.
+
+A prompt is either plain text or a dict with a ``"prompt"`` key and any of
+``width``, ``height`` (or ``resolution`` as "WIDTHxHEIGHT"), ``steps``,
+``guidance``, ``seed`` and ``name`` (the output filename). Missing settings
+fall back to the batch's own. Three file formats are read:
+
+- ``.txt``: one prompt per line; a line holding a JSON object is a dict prompt
+- ``.jsonl``: one JSON object (or JSON string) per line
+- ``.csv``: a header row naming the columns above, ``prompt`` required
+
+Files over ``STREAM_THRESHOLD_BYTES`` are opened as a ``PromptFile``, which
+parses prompts on demand instead of holding them all in memory.
+"""
+
+import csv
+import hashlib
+import itertools
+import json
+import os
+import threading
+from array import array
+
+# Prompt files larger than this are streamed instead of read into a list
+STREAM_THRESHOLD_BYTES = 1024 * 1024
+# Prompts read ahead of the pipeline when streaming; buckets form within this window
+PROMPT_WINDOW = 1024
+
+SETTING_KEYS = ("width", "height", "steps", "guidance", "seed", "name")
+INT_KEYS = ("width", "height", "steps", "seed")
+
+
+def normalize_prompt(prompt):
+    """Validate a prompt; a dict without any settings becomes plain text"""
+    if isinstance(prompt, str):
+        prompt = prompt.strip()
+        if not prompt:
+            raise ValueError("Empty prompt")
+        return prompt
+    if not isinstance(prompt, dict):
+        raise ValueError(f"Expected a prompt string or object, got {type(prompt).__name__}")
+
+    # Blank CSV cells and nulls mean "use the batch setting"
+    spec = {key: value for key, value in prompt.items()
+            if value is not None and not (isinstance(value, str) and not value.strip())}
+    text = str(spec.pop("prompt", "")).strip()
+    if not text:
+        raise ValueError("Missing prompt")
+    resolution = spec.pop("resolution", None)
+    if resolution is not None:
+        if "width" in spec or "height" in spec:
+            raise ValueError("Give either resolution or width/height, not both")
+        from .engine import parse_resolution
+        spec["width"], spec["height"] = parse_resolution(str(resolution).strip())
+    unknown = sorted(set(spec) - set(SETTING_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown field {unknown[0]!r}")
+
+    for key in INT_KEYS:
+        if key in spec:
+            spec[key] = int(spec[key])
+    if "guidance" in spec:
+        spec["guidance"] = float(spec["guidance"])
+    if "name" in spec:
+        # Output names stay inside the batch's output directory
+        name = os.path.basename(str(spec["name"]).strip())
+        if not name or name in (".", ".."):
+            raise ValueError(f"Invalid output name {spec['name']!r}")
+        # A name without an extension is saved in the batch's output format
+        spec["name"] = name
+
+    if not spec:
+        return text
+    return dict(prompt=text, **spec)
+
+
+def parse_prompt_line(line):
+    """Parse one line of a text or JSONL prompt file; None for a blank line"""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("{") or line.startswith('"'):
+        try:
+            value = json.loads(line)
+        except ValueError:
+            # Plain text that happens to start with a brace or quote
+            return line
+        return normalize_prompt(value)
+    return line
+
+
+def parse_prompt_lines(lines, source="prompts"):
+    """Parse the lines of a text or JSONL prompt file, skipping blank lines"""
+    prompts = []
+    for line_number, line in enumerate(lines, 1):
+        try:
+            prompt = parse_prompt_line(line)
+        except ValueError as e:
+            raise ValueError(f"{source}:{line_number}: {e}") from None
+        if prompt is not None:
+            prompts.append(prompt)
+    check_names(prompts, source)
+    return prompts
+
+
+def read_csv_prompts(f, source="prompts"):
+    """Parse a CSV prompt file whose header row names the prompt's fields"""
+    reader = csv.DictReader(f)
+    if reader.fieldnames is None or "prompt" not in [name.strip().lower() for name in reader.fieldnames]:
+        raise ValueError(f"{source}: a CSV prompt file needs a 'prompt' column")
+    prompts = []
+    for row in reader:
+        row = {(key or "").strip().lower(): value for key, value in row.items()}
+        if not any((value or "").strip() for value in row.values() if isinstance(value, str)):
+            continue
+        try:
+            prompts.append(normalize_prompt(row))
+        except ValueError as e:
+            raise ValueError(f"{source}:{reader.line_num}: {e}") from None
+    check_names(prompts, source)
+    return prompts
+
+
+def check_names(prompts, source="prompts"):
+    """Reject two prompts writing to the same output name"""
+    names = set()
+    for prompt in prompts:
+        name = prompt_name(prompt)
+        if name is not None:
+            if name in names:
+                raise ValueError(f"{source}: output name {name!r} is used more than once")
+            names.add(name)
+
+
+def read_prompt_file(filename):
+    """Read the prompts of a .txt, .jsonl or .csv file, skipping blank lines"""
+    with open(filename, "r", encoding="utf-8", newline="") as f:
+        if os.path.splitext(filename)[1].lower() == ".csv":
+            return read_csv_prompts(f, filename)
+        return parse_prompt_lines(f, filename)
+
+
+def format_prompt_line(prompt):
+    """Inverse of parse_prompt_line: plain text, or a JSON object for a dict prompt"""
+    if isinstance(prompt, str):
+        return prompt
+    return json.dumps(prompt, ensure_ascii=False)
+
+
+def prompt_text(prompt):
+    return prompt if isinstance(prompt, str) else prompt["prompt"]
+
+
+def prompt_settings(prompt, width, height, steps, guidance):
+    """(width, height, steps, guidance) of a prompt, its own values overriding the batch's"""
+    if isinstance(prompt, str):
+        return width, height, steps, guidance
+    return (prompt.get("width", width), prompt.get("height", height),
+            prompt.get("steps", steps), prompt.get("guidance", guidance))
+
+
+def prompt_seed(prompt, index, seed=None):
+    """Seed of the prompt at index: its own seed, else ``seed + index``, else None (random)"""
+    if not isinstance(prompt, str) and "seed" in prompt:
+        return prompt["seed"]
+    if seed is None or seed == "":
+        return None
+    return int(seed) + index
+
+
+def prompt_name(prompt):
+    return None if isinstance(prompt, str) else prompt.get("name")
+
+
+def bucket_by(items, key):
+    """Group items by key(item), ordering groups by their first item
+
+    Items keep their relative order inside a group, so a batch reordered
+    into buckets still visits each bucket's prompts in file order.
+    """
+    buckets = {}
+    for item in items:
+        buckets.setdefault(key(item), []).append(item)
+    return list(buckets.values())
+
+
+def windows(iterable, size=PROMPT_WINDOW):
+    """Yield lists of up to size consecutive items of an iterable"""
+    iterator = iter(iterable)
+    while True:
+        window = list(itertools.islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+
+def csv_row(fieldnames, values):
+    """Row dict of a CSV record, or None for a blank record"""
+    row = {(key or "").strip().lower(): value for key, value in zip(fieldnames, values)}
+    if not any(value.strip() for value in row.values()):
+        return None
+    return row
+
+
+class PromptFile:
+    """A prompt file that is read lazily, usable as a read-only sequence of prompts
+
+    ``scan`` reads the file once to validate it, count its prompts and note
+    the byte offset where each one starts (8 bytes per prompt). Prompts are
+    only parsed when indexed or iterated, so a million-line file costs a few
+    megabytes however long its prompts are. The file must not change while
+    a batch uses it; ``sha256`` lets a manifest detect that it did.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.is_csv = os.path.splitext(path)[1].lower() == ".csv"
+        self.offsets = array("q")
+        self.size = 0
+        self.sha256 = None
+        self.fieldnames = None
+        self._handle = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, progress_callback=None):
+        """Scan a prompt file and return it; progress_callback(bytes_read, size) reports the scan"""
+        prompts = cls(path)
+        prompts.scan(progress_callback)
+        return prompts
+
+    def scan(self, progress_callback=None):
+        size = os.path.getsize(self.path)
+        digest = hashlib.sha256()
+        offsets = array("q")
+        names = set()
+        reported = 0
+
+        def add(prompt, offset, line_number):
+            name = prompt_name(prompt)
+            if name is not None:
+                if name in names:
+                    raise ValueError(f"{self.path}:{line_number}: output name {name!r} is used more than once")
+                names.add(name)
+            offsets.append(offset)
+
+        position = 0
+
+        def lines(f):
+            # Raw lines of the file, hashed and counted as the parser consumes them
+            nonlocal position
+            for raw in f:
+                digest.update(raw)
+                position += len(raw)
+                yield raw
+
+        with open(self.path, "rb") as f:
+            if self.is_csv:
+                reader = csv.reader(raw.decode("utf-8") for raw in lines(f))
+                fieldnames = next(reader, None)
+                if fieldnames is None or "prompt" not in [name.strip().lower() for name in fieldnames]:
+                    raise ValueError(f"{self.path}: a CSV prompt file needs a 'prompt' column")
+                self.fieldnames = [name.strip().lower() for name in fieldnames]
+                while True:
+                    offset = position
+                    values = next(reader, None)
+                    if values is None:
+                        break
+                    row = csv_row(self.fieldnames, values)
+                    if row is not None:
+                        try:
+                            add(normalize_prompt(row), offset, reader.line_num)
+                        except ValueError as e:
+                            raise ValueError(f"{self.path}:{reader.line_num}: {e}") from None
+                    if progress_callback and position - reported >= STREAM_THRESHOLD_BYTES:
+                        reported = position
+                        progress_callback(reported, size)
+            else:
+                for line_number, raw in enumerate(lines(f), 1):
+                    try:
+                        prompt = parse_prompt_line(raw.decode("utf-8"))
+                    except ValueError as e:
+                        raise ValueError(f"{self.path}:{line_number}: {e}") from None
+                    if prompt is not None:
+                        add(prompt, position - len(raw), line_number)
+                    if progress_callback and position - reported >= STREAM_THRESHOLD_BYTES:
+                        reported = position
+                        progress_callback(reported, size)
+        self.offsets = offsets
+        self.size = size
+        self.sha256 = digest.hexdigest()
+        if progress_callback:
+            progress_callback(size, size)
+        return self
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        offset = self.offsets[index]
+        with self._lock:
+            if self._handle is None:
+                self._handle = open(self.path, "rb")
+            self._handle.seek(offset)
+            if self.is_csv:
+                return self._parse_record(self._handle)
+            return parse_prompt_line(self._handle.readline().decode("utf-8"))
+
+    def _parse_record(self, f):
+        values = next(csv.reader(raw.decode("utf-8") for raw in f))
+        return normalize_prompt(csv_row(self.fieldnames, values))
+
+    def __iter__(self):
+        return self.iterate()
+
+    def iterate(self, start=0):
+        """Yield the prompts from index start on, reading the file sequentially"""
+        if start >= len(self):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[start])
+            if self.is_csv:
+                reader = csv.reader(raw.decode("utf-8") for raw in f)
+                for values in reader:
+                    row = csv_row(self.fieldnames, values)
+                    if row is not None:
+                        yield normalize_prompt(row)
+            else:
+                for raw in f:
+                    prompt = parse_prompt_line(raw.decode("utf-8"))
+                    if prompt is not None:
+                        yield prompt
+
+    def offset(self, index):
+        """Byte offset where prompt index starts (the file size past the last prompt)"""
+        return self.offsets[index] if index < len(self) else self.size
+
+    def fraction(self, index):
+        """Share of the file before prompt index, for progress by byte offset"""
+        return self.offset(index) / self.size if self.size else 1.0
+
+    def preview(self, count=20):
+        """The first count prompts"""
+        return list(itertools.islice(self.iterate(), count))
+
+    def describe(self):
+        return f"{os.path.basename(self.path)}: {len(self):,} prompts, {self.size / (1024 * 1024):.1f} MB"
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+def open_prompts(filename, progress_callback=None):
+    """Read a small prompt file into a list, or open a large one as a PromptFile"""
+    if os.path.getsize(filename) > STREAM_THRESHOLD_BYTES:
+        return PromptFile.open(filename, progress_callback)
+    return read_prompt_file(filename)
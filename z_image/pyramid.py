@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_RENDER_BYTES = 64 * 1024 * 1024
+
+
+def image_nbytes(image):
+    """Approximate memory used by a PIL image's pixel data"""
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class ImagePyramid:
+    """Lazily built mipmap levels of one image plus an LRU of recent zoom renders
+
+    Level 0 is the full-resolution image and each further level halves both
+    dimensions (built with ``Image.reduce(2)`` the first time it is needed).
+    A render at a given zoom resamples from the smallest level that is still
+    at least as large as the requested zoom, so zooming out of a 5120x2160
+    image never touches all of its pixels. The extra levels cost at most a
+    third of the original image; the render cache is capped at
+    ``max_render_bytes``.
+    """
+
+    def __init__(self, image, max_render_bytes=DEFAULT_MAX_RENDER_BYTES, min_level_size=64):
+        self.max_render_bytes = max_render_bytes
+        self.min_level_size = min_level_size
+        self._levels = [image]
+        self._renders = OrderedDict()
+        self._render_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size(self):
+        return self._levels[0].size
+
+    @property
+    def image(self):
+        return self._levels[0]
+
+    def level(self, index):
+        """Return pyramid level ``index``, building the missing levels on demand"""
+        with self._lock:
+            while len(self._levels) <= index:
+                previous = self._levels[-1]
+                if min(previous.size) // 2 < self.min_level_size:
+                    break
+                self._levels.append(previous.reduce(2))
+            return self._levels[min(index, len(self._levels) - 1)]
+
+    def level_for_zoom(self, zoom):
+        """Pick the smallest level whose resolution is still at least ``zoom``"""
+        index = 0
+        scale = 1.0
+        while scale / 2 >= zoom:
+            index += 1
+            scale /= 2
+        return self.level(index)
+
+    def render(self, zoom, source_box, dest_size, resample):
+        """Resample ``source_box`` (full-resolution coordinates) to ``dest_size`` at ``zoom``"""
+        key = (round(zoom, 6), tuple(round(v, 3) for v in source_box), tuple(dest_size), resample)
+        with self._lock:
+            cached = self._renders.get(key)
+            if cached is not None:
+                self._renders.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        if zoom == 1.0:
+            rendered = self._levels[0].crop(tuple(round(v) for v in source_box))
+        else:
+            level = self.level_for_zoom(zoom)
+            # Levels are floor-halved, so map coordinates with the real size ratio
+            ratio_x = level.size[0] / self.size[0]
+            ratio_y = level.size[1] / self.size[1]
+            level_box = (
+                source_box[0] * ratio_x,
+                source_box[1] * ratio_y,
+                source_box[2] * ratio_x,
+                source_box[3] * ratio_y,
+            )
+            rendered = level.resize(tuple(dest_size), resample, box=level_box)
+
+        self._remember(key, rendered)
+        return rendered
+
+    def _remember(self, key, rendered):
+        size = image_nbytes(rendered)
+        if size > self.max_render_bytes:
+            return
+        with self._lock:
+            self._renders[key] = rendered
+            self._render_bytes += size
+            while self._render_bytes > self.max_render_bytes and self._renders:
+                _, evicted = self._renders.popitem(last=False)
+                self._render_bytes -= image_nbytes(evicted)
+
+    @property
+    def memory_bytes(self):
+        """Bytes held by the extra levels and cached renders (excluding level 0)"""
+        with self._lock:
+            return sum(image_nbytes(level) for level in self._levels[1:]) + self._render_bytes
+
+    def release(self):
+        """Drop every derived level and cached render"""
+        with self._lock:
+            del self._levels[1:]
+            self._renders.clear()
+            self._render_bytes = 0
@@ -0,0 +1,138 @@
+"""On-disk cache of finished images addressed by a hash of everything that determines them."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+class ResultCache:
+    """Seeded generations stored as PNG files with an LRU size cap
+
+    A seeded generation is deterministic, so the image is addressed by a
+    SHA-256 of (model, prompt, width, height, steps, guidance, seed). Files
+    live in ``directory`` under two-character subdirectories. A SQLite index
+    records each entry's size and last use, so lookups and LRU eviction
+    stay fast with hundreds of thousands of entries.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL, params TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name, prompt, width, height, steps, guidance, seed):
+        """Hash of the inputs that fully determine a seeded image"""
+        params = [model_name, prompt, int(width), int(height), int(steps), float(guidance), int(seed)]
+        return hashlib.sha256(json.dumps(params, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def get(self, key):
+        """Return the cached PIL image for key, or None on a miss"""
+        from PIL import Image
+
+        path = self._path(key)
+        image = None
+        if os.path.exists(path):
+            try:
+                with Image.open(path) as f:
+                    f.load()
+                    image = f.copy()
+            except (OSError, ValueError):
+                image = None
+
+        with self._lock:
+            if image is None:
+                self.misses += 1
+                # Drop an index entry whose file vanished or is unreadable
+                self._delete(key)
+                return None
+            self.hits += 1
+            with self._db:
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return image
+
+    def put(self, key, image, **params):
+        """Store an image under key, evicting least recently used entries over the cap"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.save(temp_path, format="PNG")
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            with self._db:
+                previous = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                if previous:
+                    self._bytes -= previous[0]
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, size, last_used, params) VALUES (?, ?, ?, ?)",
+                    (key, size, time.time(), json.dumps(params, ensure_ascii=False) if params else None))
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits (lock held)"""
+        while self._bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._bytes <= self.max_bytes:
+                    break
+                self._delete(key)
+
+    def _delete(self, key):
+        """Remove one entry and its file (lock held)"""
+        with self._db:
+            row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._bytes -= row[0]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            keys = [row[0] for row in self._db.execute("SELECT key FROM entries").fetchall()]
+            for key in keys:
+                self._delete(key)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def describe(self):
+        """Short hit/miss summary for status messages"""
+        return f"result cache {self.hits} hits / {self.misses} misses"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
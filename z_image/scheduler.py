@@ -0,0 +1,241 @@
+"""Single worker that owns the pipeline and runs queued jobs by priority."""
+
+import heapq
+import itertools
+import threading
+import time
+
+# Lower numbers run first
+PRIORITY_LOAD = 0
+PRIORITY_INTERACTIVE = 10
+PRIORITY_BATCH = 20
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job (usually from the step callback) once it is cancelled"""
+
+
+class Job:
+    """A unit of work for the scheduler
+
+    ``func(job)`` runs on the scheduler thread. Long running work should pass
+    ``job.step_callback`` to the engine so cancellation takes effect at the
+    next denoising step instead of when the pipeline call returns. Set
+    ``job.progress`` (e.g. a ``StepProgress``) to also receive every step.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, func, priority, description, group=None, on_done=None):
+        self.id = next(self._ids)
+        self.func = func
+        self.priority = priority
+        self.description = description
+        self.group = group
+        self.on_done = on_done
+        self.progress = None
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self._done_event.is_set()
+
+    @property
+    def queue_wait(self):
+        """Seconds between submission and start (so far, if still queued)"""
+        end = self.started_at if self.started_at is not None else time.perf_counter()
+        return end - self.submitted_at
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} cancelled")
+
+    def step_callback(self, step, total_steps, latents=None):
+        """Engine step callback that stops the pipeline once the job is cancelled"""
+        self.check_cancelled()
+        if self.progress is not None:
+            self.progress(step, total_steps, latents)
+
+    def wait(self, timeout=None):
+        """Block until the job finished; returns its result or raises its error"""
+        if not self._done_event.wait(timeout):
+            raise TimeoutError(f"Job {self.id} still {self.status}")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.status} p{self.priority} {self.description!r}>"
+
+
+class Scheduler:
+    """Runs jobs one at a time, highest priority first, FIFO within a priority"""
+
+    def __init__(self, name="z-image-scheduler"):
+        self._heap = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._stopping = False
+        # Jobs dropped from the queue whose on_done the worker thread still has to run
+        self._dropped = []
+        self.current = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, func, priority=PRIORITY_INTERACTIVE, description="", group=None, on_done=None):
+        """Queue ``func(job)`` and return its Job
+
+        ``on_done(job)`` runs on the scheduler thread after the job finished,
+        failed or was cancelled.
+        """
+        job = Job(func, priority, description, group=group, on_done=on_done)
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError("Scheduler is shut down")
+            heapq.heappush(self._heap, (priority, next(self._order), job))
+            self._condition.notify()
+        return job
+
+    def jobs(self):
+        """Snapshot of the running job followed by queued jobs in run order"""
+        with self._condition:
+            queued = [job for _, _, job in sorted(self._heap)]
+            current = self.current
+        return ([current] if current is not None else []) + queued
+
+    def find(self, job_id):
+        for job in self.jobs():
+            if job.id == job_id:
+                return job
+        return None
+
+    def cancel(self, job_id):
+        """Cancel one queued or running job; returns False if it is unknown"""
+        job = self.find(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        self._drop_cancelled()
+        return True
+
+    def cancel_group(self, group):
+        """Cancel every queued or running job of a group (e.g. a whole batch)"""
+        count = 0
+        for job in self.jobs():
+            if job.group == group:
+                job.cancel()
+                count += 1
+        self._drop_cancelled()
+        return count
+
+    def cancel_all(self):
+        for job in self.jobs():
+            job.cancel()
+        self._drop_cancelled()
+
+    @property
+    def busy(self):
+        with self._condition:
+            return self.current is not None or bool(self._heap)
+
+    def _drop_cancelled(self):
+        """Remove cancelled jobs from the queue right away so the view updates
+
+        Their on_done still runs on the scheduler thread, whichever thread
+        cancelled them.
+        """
+        with self._condition:
+            dropped = [job for _, _, job in self._heap if job.cancelled]
+            if not dropped:
+                return
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            for job in dropped:
+                self._settle(job, CANCELLED)
+            self._dropped.extend(dropped)
+            self._condition.notify()
+
+    def _finish(self, job, status, result=None, error=None):
+        self._settle(job, status, result, error)
+        self._call_on_done(job)
+
+    def _settle(self, job, status, result=None, error=None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.perf_counter()
+        job._done_event.set()
+
+    def _call_on_done(self, job):
+        if job.on_done:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                print(f"Job callback error: {e}")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap and not self._dropped and not self._stopping:
+                    self._condition.wait()
+                dropped, self._dropped = self._dropped, []
+                job = job_to_run = None
+                if not dropped:
+                    if self._stopping and not self._heap:
+                        return
+                    _, _, job = heapq.heappop(self._heap)
+                    if not job.cancelled:
+                        job_to_run = job
+                        self.current = job
+                        job.status = RUNNING
+                        job.started_at = time.perf_counter()
+
+            # Jobs cancelled while queued finish here, on this thread like every other job
+            for dropped_job in dropped:
+                self._call_on_done(dropped_job)
+            if job is None:
+                continue
+            if job_to_run is None:
+                self._finish(job, CANCELLED)
+                continue
+
+            try:
+                result = job.func(job)
+            except JobCancelled as e:
+                self._finish(job, CANCELLED, error=e)
+            except Exception as e:
+                self._finish(job, CANCELLED if job.cancelled else FAILED, error=e)
+            else:
+                self._finish(job, DONE, result=result)
+            finally:
+                with self._condition:
+                    self.current = None
+
+    def shutdown(self, cancel=True, timeout=None):
+        """Stop the worker, cancelling outstanding jobs unless cancel=False"""
+        if cancel:
+            self.cancel_all()
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
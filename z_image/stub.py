@@ -0,0 +1,55 @@
+"""Tiny stand-in for ZImagePipeline, for exercising the engine without torch or weights."""
+
+import hashlib
+import time
+
+from .placement import PLACEMENT_CPU
+
+
+class StubOutput:
+    def __init__(self, images):
+        self.images = images
+
+
+class StubPipeline:
+    """Draws one flat-coloured image per prompt, derived from the prompt text
+
+    Accepts the keyword arguments ``ZImageEngine`` passes to the real
+    pipeline, calls ``callback_on_step_end`` after every step and sleeps
+    ``seconds_per_step`` per step to imitate denoising time.
+    """
+
+    def __init__(self, seconds_per_step=0.0):
+        self.seconds_per_step = seconds_per_step
+
+    @staticmethod
+    def make_generator(seed):
+        """Stands in for a torch generator: the seed itself, since the stub's images do not depend on it"""
+        return None if seed is None or seed == "" else int(seed)
+
+    def __call__(self, prompt=None, width=1024, height=1024, num_inference_steps=4, callback_on_step_end=None,
+                 **kwargs):
+        from PIL import Image
+
+        prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+        callback_kwargs = {}
+        for step in range(num_inference_steps):
+            if self.seconds_per_step:
+                time.sleep(self.seconds_per_step)
+            if callback_on_step_end:
+                callback_kwargs = callback_on_step_end(self, step, num_inference_steps - step, callback_kwargs)
+        images = [Image.new("RGB", (width, height), tuple(hashlib.sha256(p.encode("utf-8")).digest()[:3]))
+                  for p in prompts]
+        return StubOutput(images)
+
+
+def stub_engine(model_name=None, placement=None, seconds_per_step=0.0, status_callback=None):
+    """Engine factory returning a ready ZImageEngine around a StubPipeline"""
+    from .engine import DEFAULT_MODEL, ZImageEngine
+
+    engine = ZImageEngine(model_name=model_name or DEFAULT_MODEL, pipeline=StubPipeline(seconds_per_step),
+                          embedding_cache=False, status_callback=status_callback)
+    engine.device_description = "CPU (stub pipeline)"
+    engine.active_placement = PLACEMENT_CPU
+    engine.memory_description = "stub"
+    return engine
@@ -0,0 +1,132 @@
+"""Thread-safe queue of UI updates, applied by the GUI thread at a fixed maximum rate.
+
+Tk widgets may only be touched from the thread running the main loop.
+Worker threads post updates instead, and the GUI drains the queue from a
+``root.after`` timer::
+
+    updates = UIUpdates(max_rate=30)
+    updates.latest("status", status_var.set, "Generating...")   # from any thread
+    updates.call(messagebox.showerror, "Error", "Failed")        # from any thread
+    updates.drain()                                              # GUI thread, every updates.interval_ms
+
+Updates posted with ``latest`` under the same key coalesce: only the newest
+one waiting is applied, so a fast batch reporting every step costs at most
+one status change per frame. Updates posted with ``call`` always run, in
+the order they were posted relative to everything else.
+
+The queue records how long updates wait before they are applied (from the
+moment a key first had an update waiting) and how long each drain takes,
+see ``stats``.
+"""
+
+import itertools
+import statistics
+import threading
+import time
+from collections import OrderedDict
+
+# Frames per second the GUI applies updates at
+DEFAULT_UPDATE_RATE = 30
+# Latency and drain time samples kept for stats
+MAX_SAMPLES = 4096
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of samples (0 when there are none)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class UIUpdates:
+    """Updates posted by any thread, applied in post order by the thread that calls drain"""
+
+    def __init__(self, max_rate=DEFAULT_UPDATE_RATE, clock=time.perf_counter):
+        self.max_rate = max_rate
+        self.clock = clock
+        # key -> (func, args, kwargs, time the key first had an update waiting); one-shot calls get unique keys
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._calls = itertools.count()
+        self.posted = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.failed = 0
+        self.latencies = []
+        self.drain_times = []
+
+    @property
+    def interval_ms(self):
+        return max(1, int(1000 / self.max_rate))
+
+    def latest(self, key, func, *args, **kwargs):
+        """Post func(*args, **kwargs), replacing an update under the same key that is still waiting"""
+        with self._lock:
+            self.posted += 1
+            previous = self._pending.pop(key, None)
+            if previous is None:
+                posted_at = self.clock()
+            else:
+                # The replaced update's wait counts: the UI has been behind since then
+                posted_at = previous[3]
+                self.coalesced += 1
+            self._pending[key] = (func, args, kwargs, posted_at)
+
+    def call(self, func, *args, **kwargs):
+        """Post func(*args, **kwargs) to run once, never coalesced"""
+        with self._lock:
+            self.posted += 1
+            self._pending[("call", next(self._calls))] = (func, args, kwargs, self.clock())
+
+    def poster(self, key, func):
+        """A callable for worker threads that posts func(*args) under key, e.g. a status callback"""
+        return lambda *args: self.latest(key, func, *args)
+
+    @property
+    def waiting(self):
+        with self._lock:
+            return len(self._pending)
+
+    def drain(self):
+        """Apply every waiting update; call from the GUI thread. Returns the number applied
+
+        An update that raises is counted and skipped, so one failure never
+        stops the updates behind it (or the timer that drains them).
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = OrderedDict()
+        if not pending:
+            return 0
+        started = self.clock()
+        failed = self.failed
+        for func, args, kwargs, posted_at in pending.values():
+            self.latencies.append(started - posted_at)
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self.failed += 1
+                print(f"UI update failed: {e}")
+        self.applied += len(pending) - (self.failed - failed)
+        self.drain_times.append(self.clock() - started)
+        del self.latencies[:-MAX_SAMPLES]
+        del self.drain_times[:-MAX_SAMPLES]
+        return len(pending)
+
+    def stats(self):
+        """Counts, plus latency and drain time summaries in seconds (with a 95th percentile)"""
+        stats = {"posted": self.posted, "coalesced": self.coalesced, "applied": self.applied, "failed": self.failed}
+        for name, samples in (("latency", self.latencies), ("drain", self.drain_times)):
+            if samples:
+                stats[name] = {"median": statistics.median(samples), "p95": percentile(samples, 0.95),
+                               "max": max(samples), "count": len(samples)}
+        return stats
+
+    def describe(self):
+        stats = self.stats()
+        text = f"{stats['applied']} UI updates applied, {stats['coalesced']} coalesced"
+        if "latency" in stats:
+            text += (f", latency median {stats['latency']['median'] * 1000:.1f} ms, "
+                     f"p95 {stats['latency']['p95'] * 1000:.1f} ms")
+        return text
@@ -0,0 +1,59 @@
+"""Geometry for rendering only the visible part of a zoomed image."""
+
+import math
+
+
+def visible_region(image_size, zoom, offset, canvas_size, margin=0):
+    """Work out which part of a zoomed image is visible on the canvas
+
+    ``offset`` is the canvas position of the zoomed image's top-left corner.
+    Returns ``(source_box, dest_box)`` where ``source_box`` is the float
+    (left, top, right, bottom) region of the full-resolution image and
+    ``dest_box`` the integer canvas rectangle it should be drawn into, or
+    None when the image is entirely off screen. ``margin`` extends the
+    visible area on every side so small pans stay inside the rendered part.
+    """
+    img_width, img_height = image_size
+    canvas_width, canvas_height = canvas_size
+    offset_x, offset_y = offset
+    if zoom <= 0 or img_width <= 0 or img_height <= 0:
+        return None
+
+    # Canvas rectangle covered by the whole zoomed image
+    image_left = offset_x
+    image_top = offset_y
+    image_right = offset_x + img_width * zoom
+    image_bottom = offset_y + img_height * zoom
+
+    # Clip to the canvas (plus margin) on whole pixels
+    left = max(math.floor(image_left), -margin)
+    top = max(math.floor(image_top), -margin)
+    right = min(math.ceil(image_right), canvas_width + margin)
+    bottom = min(math.ceil(image_bottom), canvas_height + margin)
+    if right <= left or bottom <= top:
+        return None
+
+    source_box = (
+        max(0.0, (left - offset_x) / zoom),
+        max(0.0, (top - offset_y) / zoom),
+        min(float(img_width), (right - offset_x) / zoom),
+        min(float(img_height), (bottom - offset_y) / zoom),
+    )
+    return source_box, (left, top, right, bottom)
+
+
+def covers(outer, inner):
+    """Return True if rectangle ``outer`` fully contains rectangle ``inner``"""
+    if outer is None:
+        return inner is None
+    if inner is None:
+        return True
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and outer[2] >= inner[2] and outer[3] >= inner[3])
+
+
+def shift_box(box, dx, dy):
+    """Translate a rectangle by (dx, dy)"""
+    if box is None:
+        return None
+    return (box[0] + dx, box[1] + dy, box[2] + dx, box[3] + dy)
@@ -0,0 +1,142 @@
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .encoders import save_image
+
+
+class ImageWriter:
+    """Bounded pool of background threads that encode and save images
+
+    ``submit`` blocks once ``max_pending`` images are queued or being written,
+    so a fast generator cannot pile up full-resolution images in memory.
+    PIL releases the GIL while compressing, so encoding overlaps with the
+    next pipeline call without the pickling cost of a process pool.
+    Pending writes are flushed by ``close`` and again at interpreter exit.
+    ``on_written(image, filepath)`` runs on the writer thread after each
+    successful write, while the image is still at hand (e.g. to thumbnail it);
+    its failures are reported through ``status_callback``.
+    """
+
+    def __init__(self, max_workers=2, max_pending=4, on_written=None, status_callback=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        # Notified whenever a write leaves _pending
+        self._settled = threading.Condition(self._lock)
+        self._closed = False
+        self.on_written = on_written
+        self.status_callback = status_callback
+        self.errors = []
+        # (path, seconds waiting in the queue, seconds encoding and writing)
+        self.latencies = []
+        atexit.register(self.close)
+
+    def submit(self, image, filepath, callback=None, output_format=None, **save_kwargs):
+        """Queue an image for saving, blocking while the queue is full
+
+        ``output_format`` is an ``OutputFormat`` or spec (see
+        ``z_image.encoders``); by default the file's extension decides.
+        ``callback(filepath, error)`` runs on the writer thread once the write
+        finished; ``error`` is None on success.
+        """
+        if self._closed:
+            raise RuntimeError("ImageWriter is closed")
+
+        self._slots.acquire()
+        queued_at = time.perf_counter()
+        try:
+            future = self._executor.submit(self._write, image, filepath, queued_at, output_format, save_kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending.add(future)
+
+        def done(f):
+            # The future stays pending until its error is recorded and the callback ran,
+            # so flush() cannot return before either
+            try:
+                error = f.exception()
+                if error is not None:
+                    with self._lock:
+                        self.errors.append((filepath, error))
+                if callback:
+                    callback(filepath, error)
+            finally:
+                with self._lock:
+                    self._pending.discard(f)
+                    self._settled.notify_all()
+                self._slots.release()
+
+        future.add_done_callback(done)
+        return future
+
+    def _write(self, image, filepath, queued_at, output_format, save_kwargs):
+        started = time.perf_counter()
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        save_image(image, filepath, output_format, **save_kwargs)
+        finished = time.perf_counter()
+        with self._lock:
+            self.latencies.append((filepath, started - queued_at, finished - started))
+        if self.on_written is not None:
+            try:
+                self.on_written(image, filepath)
+            except Exception as e:
+                # The image is written; a failing observer must not turn that into a write error
+                self.set_status(f"Written image callback failed for {filepath}: {e}")
+        return filepath
+
+    def set_status(self, message):
+        if self.status_callback:
+            self.status_callback(message)
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Wait for every queued write and raise the first write error, if any"""
+        with self._lock:
+            # A write counts as finished once its done-callback ran, not when its result is set
+            self._settled.wait_for(lambda: not self._pending)
+            errors, self.errors = self.errors, []
+        if errors:
+            filepath, error = errors[0]
+            raise RuntimeError(f"Failed to write {filepath}: {error}") from error
+
+    def close(self):
+        """Flush pending writes and stop the worker threads"""
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._executor.shutdown(wait=True)
+            atexit.unregister(self.close)
+
+    def describe(self):
+        """Short human readable write latency summary"""
+        with self._lock:
+            latencies = list(self.latencies)
+        if not latencies:
+            return "no images written"
+        write_times = [write for _, _, write in latencies]
+        waits = [wait for _, wait, _ in latencies]
+        return (f"writes avg {1000 * sum(write_times) / len(write_times):.0f} ms, "
+                f"max {1000 * max(write_times):.0f} ms, "
+                f"queue wait avg {1000 * sum(waits) / len(waits):.0f} ms")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -2,13 +2,30 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
-import torch
-from diffusers import ZImagePipeline
-import numpy as np
-import cv2
 from datetime import datetime
-import json
+
+# z_image defers torch and diffusers until they are needed, so the window
+# appears before the heavy imports; they are warmed in a background thread.
+from z_image import MODELS, DEFAULT_MODEL, RESOLUTION_OPTIONS, ImageWriter, ZImageEngine, describe_device, warm_imports
+from z_image.engine import bucket_prompts
+from z_image.compiled import CompileCache
+from z_image.daemon import DaemonClient
+from z_image.display import DEFAULT_CANVAS_SIZE, prepare_display, prepare_preview
+from z_image.encoders import FORMAT_PRESETS, OutputFormat, save_image
+from z_image.history import THUMBNAIL_SIZE, ImageHistory
+from z_image.manifest import MANIFEST_SUFFIX, BatchManifest
+from z_image.memory import InsufficientMemory, MemoryEstimator
+from z_image.metrics import metrics_from_environment
+from z_image.placement import DEFAULT_PLACEMENT, PLACEMENTS, placement_from_label
+from z_image.progress import StepProgress, format_progress
+from z_image.prompts import STREAM_THRESHOLD_BYTES, PromptFile, format_prompt_line, parse_prompt_lines, read_prompt_file, windows
+from z_image.result_cache import ResultCache
+from z_image.scheduler import Scheduler, JobCancelled, CANCELLED, PRIORITY_LOAD, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from z_image.ui_updates import UIUpdates
+from z_image.viewport import visible_region, covers, shift_box
 
 class ZImageGUI:
     def __init__(self, root):
@@ -17,9 +34,31 @@ class ZImageGUI:
         self.root.geometry("1200x800")
         
         # Variables
-        self.pipeline = None
         self.current_image = None
         self.output_dir = "outputs"
+        # Per-generation metrics go to logs/metrics.jsonl (see z_image.metrics for overrides)
+        self.metrics = metrics_from_environment(default_log=os.path.join("logs", "metrics.jsonl"))
+        # Seeded generations are reused from cache/results when their settings repeat
+        self.result_cache = ResultCache(os.path.join("cache", "results"))
+        # Fitted GPU memory model used to check each job fits before it runs
+        self.memory_estimator = MemoryEstimator(os.path.join("cache", "memory_profile.json"))
+        # Compiled transformer graphs, reused by later sessions
+        self.compile_cache = CompileCache(os.path.join("cache", "compiled"))
+        # Worker threads never touch widgets; they post here and the Tk loop applies the updates
+        self.ui = UIUpdates()
+        self.engine = ZImageEngine(output_dir=self.output_dir, status_callback=self.set_status, metrics=self.metrics,
+                                   result_cache=self.result_cache, memory_estimator=self.memory_estimator)
+        
+        # One scheduler owns the pipeline; every load/generate/batch job goes through it
+        self.scheduler = Scheduler()
+        self.batch_counter = 0
+        self.queue_job_ids = []
+        self.progress_mode = None  # None (idle), "indeterminate" or "determinate"
+        self.step_state = None  # (step, total_steps) of the running pipeline call
+        self.live_preview = True  # Mirrors the live preview checkbox for worker threads
+        self.prompt_file = None  # Large prompt file that batches stream from instead of the prompt box
+        self.preview_prompts = 20  # Prompts of a streamed file shown in the prompt box
+        self.batch_window = 256  # Prompts of a batch queued as jobs at a time
         self.device_status = tk.StringVar(value="Device: Unknown")
         self.dark_mode = tk.BooleanVar(value=True)
         
@@ -34,6 +73,25 @@ class ZImageGUI:
         self.drag_start_x = None
         self.drag_start_y = None
         
+        # Viewport rendering - only the visible part of the zoomed image is rendered
+        self.render_margin = 128  # Extra pixels rendered around the view so small pans need no re-render
+        self.render_delay_ms = 16  # Coalesce interaction renders to at most one per frame
+        self.idle_render_delay_ms = 150  # Re-render in high quality after this much idle time
+        self.rendered_box = None  # Canvas rectangle covered by the current canvas image
+        self.rendered_quality = False
+        self._render_job = None
+        self._idle_render_job = None
+        self.pyramid = None  # Mipmap levels and recent zoom renders of the displayed image
+        self.canvas_size = DEFAULT_CANVAS_SIZE  # Last drawn canvas size, read by workers preparing frames
+        
+        # Recent results; full images beyond the history's memory cap are dropped or spilled to cache/history
+        self.history = ImageHistory(os.path.join("cache", "history"))
+        # Thumbnails, spills and reloads run here, never on the Tk thread or ahead of the pipeline
+        self.history_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history")
+        self.history_slot = THUMBNAIL_SIZE[0] + 8  # Width of one thumbnail in the history strip
+        self.history_selected = None  # Entry id of the history result on the canvas
+        self.history_photos = {}  # PhotoImages of the thumbnails in view only
+        
         # Create output directory
         os.makedirs(self.output_dir, exist_ok=True)
         
@@ -111,17 +169,34 @@ class ZImageGUI:
         model_frame = ttk.LabelFrame(control_frame, text="Model", padding="5")
         model_frame.pack(fill=tk.X, pady=(0, 10))
         
-        self.model_var = tk.StringVar(value="Tongyi-MAI/Z-Image-Turbo")
-        models = [
-            "Tongyi-MAI/Z-Image-Turbo"
-        ]
-        self.model_combo = ttk.Combobox(model_frame, textvariable=self.model_var, values=models, width=35)
+        self.model_var = tk.StringVar(value=DEFAULT_MODEL)
+        self.model_combo = ttk.Combobox(model_frame, textvariable=self.model_var, values=MODELS, width=35)
         self.model_combo.pack(fill=tk.X)
         
+        # Memory placement strategy
+        placement_frame = ttk.Frame(model_frame)
+        placement_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(placement_frame, text="Placement:").pack(side=tk.LEFT)
+        self.placement_var = tk.StringVar(value=PLACEMENTS[DEFAULT_PLACEMENT])
+        ttk.Combobox(placement_frame, textvariable=self.placement_var, values=list(PLACEMENTS.values()),
+                     width=22, state="readonly").pack(side=tk.LEFT, padx=(5, 0))
+        
         # Load Model button
         self.load_button = ttk.Button(model_frame, text="Load Model", command=self.load_model)
         self.load_button.pack(fill=tk.X, pady=(5, 0))
         
+        # Keep encoded prompts on disk so regenerating a prompt skips the text encoder across sessions
+        self.persist_cache_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(model_frame, text="Persist prompt cache", variable=self.persist_cache_var,
+                        command=self.toggle_prompt_cache_persistence).pack(anchor=tk.W, pady=(5, 0))
+        self.result_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(model_frame, text="Reuse cached seeded results", variable=self.result_cache_var,
+                        command=self.toggle_result_cache).pack(anchor=tk.W)
+        # Compile the transformer on load; resolutions warm up in the background as they are picked
+        self.compile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(model_frame, text="Compile model on load (faster after warm-up)",
+                        variable=self.compile_var).pack(anchor=tk.W)
+        
         # Prompt input
         prompt_frame = ttk.LabelFrame(control_frame, text="Prompt", padding="5")
         prompt_frame.pack(fill=tk.X, pady=(0, 10))
@@ -143,42 +218,7 @@ class ZImageGUI:
         
         # Resolution dropdown with more options based on screen sizes
         ttk.Label(image_frame, text="Resolution:").grid(row=0, column=0, sticky=tk.W, pady=2)
-        resolution_options = [
-            # Square formats
-            "256x256",
-            "512x512",
-            "768x768", 
-            "1024x1024",
-            "1536x1536",
-            "2048x2048",
-            
-            # Standard (4:3)
-            "640x480",
-            "800x600",
-            "1024x768",
-            "1280x960",
-            "1600x1200",
-            
-            # Wide (16:9)
-            "854x480",
-            "1280x720",
-            "1366x768",
-            "1600x900",
-            "1920x1080",
-            "2560x1440",
-            "3840x2160",
-            
-            # Ultra-wide (21:9)
-            "2560x1080",
-            "3440x1440",
-            "5120x2160",
-            
-            # Mobile formats
-            "1080x1920",
-            "750x1334",
-            "828x1792",
-            "1242x2688"
-        ]
+        resolution_options = RESOLUTION_OPTIONS
         
         # Set default to current screen resolution or closest match
         default_resolution = f"{screen_width}x{screen_height}"
@@ -198,6 +238,7 @@ class ZImageGUI:
         self.resolution_var = tk.StringVar(value=default_resolution)
         self.resolution_combo = ttk.Combobox(image_frame, textvariable=self.resolution_var, values=resolution_options, width=20, state="readonly")
         self.resolution_combo.grid(row=0, column=1, pady=2, sticky=tk.W)
+        self.resolution_combo.bind("<<ComboboxSelected>>", self.warm_up_selected)
         
         # Steps
         ttk.Label(image_frame, text="Steps:").grid(row=1, column=0, sticky=tk.W, pady=2)
@@ -217,6 +258,22 @@ class ZImageGUI:
         # Random seed button
         ttk.Button(image_frame, text="Random", command=self.random_seed, width=8).grid(row=3, column=2, pady=2, padx=(10, 0), sticky=tk.W)
         
+        # Live latent preview while denoising
+        self.live_preview_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(image_frame, text="Live preview", variable=self.live_preview_var,
+                        command=self.toggle_live_preview).grid(row=4, column=0, columnspan=2, pady=2, sticky=tk.W)
+        
+        # Decode 4K and ultra-wide images in tiles so the VAE does not run out of memory
+        self.tiled_decode_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(image_frame, text="Tiled decode for large images", variable=self.tiled_decode_var,
+                        command=self.toggle_tiled_decode).grid(row=5, column=0, columnspan=3, pady=2, sticky=tk.W)
+        
+        # Format of saved and batch images; PNG (fast) and JPEG encode 4K images far quicker than PNG
+        ttk.Label(image_frame, text="Save as:").grid(row=6, column=0, sticky=tk.W, pady=2)
+        self.output_format_var = tk.StringVar(value="PNG")
+        ttk.Combobox(image_frame, textvariable=self.output_format_var, values=list(FORMAT_PRESETS), width=20,
+                     state="readonly").grid(row=6, column=1, columnspan=2, pady=2, sticky=tk.W)
+        
         # Action buttons
         button_frame = ttk.Frame(control_frame)
         button_frame.pack(fill=tk.X, pady=(0, 10))
@@ -236,7 +293,35 @@ class ZImageGUI:
         batch_frame.pack(fill=tk.X, pady=(0, 10))
         
         ttk.Button(batch_frame, text="Load Prompts from File", command=self.load_prompts_file).pack(fill=tk.X, pady=2)
+        
+        # Shown while batches stream their prompts from a large file
+        self.prompt_file_frame = ttk.Frame(batch_frame)
+        self.prompt_file_var = tk.StringVar(value="")
+        ttk.Label(self.prompt_file_frame, textvariable=self.prompt_file_var, wraplength=260).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(self.prompt_file_frame, text="Clear", command=self.clear_prompt_file, width=6).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # Micro-batch size (prompts per pipeline call)
+        batch_size_frame = ttk.Frame(batch_frame)
+        batch_size_frame.pack(fill=tk.X, pady=2)
+        ttk.Label(batch_size_frame, text="Batch size:").pack(side=tk.LEFT)
+        self.batch_size_var = tk.StringVar(value="1")
+        ttk.Entry(batch_size_frame, textvariable=self.batch_size_var, width=6).pack(side=tk.LEFT, padx=(5, 0))
+        
         ttk.Button(batch_frame, text="Batch Generate", command=self.batch_generate).pack(fill=tk.X, pady=2)
+        ttk.Button(batch_frame, text="Resume Batch...", command=self.resume_batch).pack(fill=tk.X, pady=2)
+        
+        # Job queue
+        queue_frame = ttk.LabelFrame(control_frame, text="Queue", padding="5")
+        queue_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.queue_list = tk.Listbox(queue_frame, height=4, activestyle="none")
+        self.queue_list.pack(fill=tk.X)
+        
+        queue_button_frame = ttk.Frame(queue_frame)
+        queue_button_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(queue_button_frame, text="Cancel", command=self.cancel_selected_job).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 2))
+        ttk.Button(queue_button_frame, text="Cancel Batch", command=self.cancel_batch).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        ttk.Button(queue_button_frame, text="Cancel All", command=self.scheduler.cancel_all).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 0))
         
         # Device status
         device_frame = ttk.LabelFrame(control_frame, text="Device Status", padding="5")
@@ -245,7 +330,13 @@ class ZImageGUI:
         self.device_label = ttk.Label(device_frame, textvariable=self.device_status, font=("Arial", 10, "bold"))
         self.device_label.pack(fill=tk.X)
         
-        # Update device status on startup
+        # Resident memory of the loaded model
+        self.memory_status = tk.StringVar(value="Memory: model not loaded")
+        ttk.Label(device_frame, textvariable=self.memory_status).pack(fill=tk.X)
+        ttk.Button(device_frame, text="Calibrate Memory", command=self.calibrate_memory).pack(fill=tk.X, pady=(5, 0))
+        
+        # Update device status on startup (in the background, it needs torch)
+        self.device_status.set("Device: Detecting...")
         self.update_device_status()
         
         # Right panel - Output
@@ -279,6 +370,7 @@ class ZImageGUI:
         self.canvas.bind("<Button-1>", self.on_drag_start)
         self.canvas.bind("<B1-Motion>", self.on_drag_motion)
         self.canvas.bind("<ButtonRelease-1>", self.on_drag_end)
+        self.canvas.bind("<Configure>", self.on_canvas_configure)
         
         # Bind keyboard events for image movement (only when canvas has focus)
         self.canvas.bind("<Left>", self.move_image_left)
@@ -287,6 +379,19 @@ class ZImageGUI:
         self.canvas.bind("<Down>", self.move_image_down)
         self.canvas.bind("<space>", self.fit_to_window)
         
+        # History strip of recent results, newest first
+        self.history_canvas = tk.Canvas(output_frame, bg="white", height=self.history_slot, highlightthickness=0,
+                                        xscrollincrement=self.history_slot)
+        self.history_canvas.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(5, 0))
+        history_scroll = ttk.Scrollbar(output_frame, orient=tk.HORIZONTAL, command=self.scroll_history)
+        history_scroll.grid(row=3, column=0, sticky=(tk.W, tk.E))
+        self.history_canvas.config(xscrollcommand=history_scroll.set)
+        self.history_canvas.bind("<Configure>", lambda event: self.draw_history())
+        self.history_canvas.bind("<Button-1>", self.on_history_click)
+        self.history_canvas.bind("<MouseWheel>", self.on_history_wheel)
+        self.history_canvas.bind("<Button-4>", self.on_history_wheel)  # Linux scroll up
+        self.history_canvas.bind("<Button-5>", self.on_history_wheel)  # Linux scroll down
+        
         # Make canvas focusable
         self.canvas.focus_set()
         
@@ -302,6 +407,10 @@ class ZImageGUI:
         # Apply initial theme after all widgets are created
         self.toggle_theme()
         
+        # Keep the queue view and progress bar in step with the scheduler
+        self.refresh_queue()
+        self.apply_ui_updates()
+        
     def toggle_theme_click(self, event):
         """Handle toggle button click"""
         self.dark_mode.set(not self.dark_mode.get())
@@ -435,12 +544,18 @@ class ZImageGUI:
         
         # Apply to specific widgets directly
         try:
-            # Canvas (image display)
+            # Canvas (image display) and history strip
             self.canvas.configure(bg=canvas_bg)
+            if hasattr(self, 'history_canvas'):
+                self.history_canvas.configure(bg=canvas_bg)
             
             # Text widget (prompt input)
             self.prompt_text.configure(bg=canvas_bg, fg=fg_color, insertbackground=fg_color, font=('Arial', 10))
             
+            # Job queue list
+            if hasattr(self, 'queue_list'):
+                self.queue_list.configure(bg=canvas_bg, fg=fg_color, font=('Arial', 9))
+            
             # Status bar
             if hasattr(self, 'status_var'):
                 # Status bar is a label, will be styled by ttk
@@ -488,75 +603,153 @@ class ZImageGUI:
     
     def update_device_status(self):
         """Update the device status display - attempt CUDA first"""
+        def detect_in_thread():
+            # Warm the heavy imports so "Load Model" does not pay for them later
+            try:
+                warm_imports()
+            except Exception as e:
+                print(f"Import warm-up error: {e}")
+            device = describe_device()
+            # Loading a model reports the device it actually ended up on
+            if not self.engine.is_loaded:
+                self.ui.latest("device", self.device_status.set, f"Device: {device}")
+        
+        threading.Thread(target=detect_in_thread, daemon=True).start()
+    
+    def set_status(self, message):
+        """Show a status message in the status bar; safe from any thread"""
+        if hasattr(self, 'status_var'):
+            self.ui.latest("status", self.status_var.set, message)
+    
+    def apply_ui_updates(self):
+        """Apply what worker threads posted since the last frame, then schedule the next frame"""
         try:
-            if torch.cuda.is_available():
-                # Test CUDA by attempting to get device info
-                device_name = torch.cuda.get_device_name(0)
-                self.device_status.set(f"Device: CUDA ({device_name})")
-            else:
-                raise RuntimeError("CUDA not available")
-        except Exception:
-            self.device_status.set("Device: CPU (CUDA unavailable)")
+            self.ui.drain()
+        finally:
+            self.root.after(self.ui.interval_ms, self.apply_ui_updates)
         
     def load_model(self):
-        def load_in_thread():
+        model_name = self.model_var.get()
+        placement = placement_from_label(self.placement_var.get())
+        self.load_button.config(state=tk.DISABLED)
+        
+        # Widgets are read here on the Tk thread; the job only sees plain values
+        compile_mode = "default" if self.compile_var.get() else "off"
+        local_engine = self.engine if isinstance(self.engine, ZImageEngine) else self.make_local_engine()
+        
+        def load_job(job):
             try:
-                self.status_var.set("Loading model...")
-                self.progress.start()
-                self.load_button.config(state=tk.DISABLED)
-                
-                model_name = self.model_var.get()
+                # Share the warm model of a running daemon, otherwise load in-process
+                client = DaemonClient(status_callback=self.set_status)
+                self.engine = client if client.is_available() else local_engine
+                if isinstance(self.engine, ZImageEngine):
+                    self.engine.compile_mode = compile_mode
+                    self.engine.compile_cache = self.compile_cache
                 
-                # Load Z-Image pipeline
-                self.pipeline = ZImagePipeline.from_pretrained(
-                    model_name,
-                    torch_dtype=torch.bfloat16,
-                    low_cpu_mem_usage=False,
-                )
+                device = self.engine.load_model(model_name, placement=placement)
+                self.ui.latest("device", self.device_status.set, f"Device: {device}")
+                self.show_memory_status()
+                self.ui.call(self.warm_up_selected)
                 
-                # Attempt CUDA first, fallback to CPU if it fails
-                try:
-                    if torch.cuda.is_available():
-                        self.status_var.set("Attempting to load model on CUDA...")
-                        self.pipeline = self.pipeline.to("cuda")
-                        device_name = torch.cuda.get_device_name(0)
-                        self.device_status.set(f"Device: CUDA ({device_name})")
-                        self.status_var.set(f"Model loaded on GPU: {device_name}")
-                    else:
-                        raise RuntimeError("CUDA not available")
-                except Exception as cuda_error:
-                    # Fallback to CPU
-                    self.status_var.set("CUDA failed, falling back to CPU...")
-                    self.device_status.set("Device: CPU (CUDA fallback)")
-                    self.status_var.set("Model loaded on CPU (CUDA failed)")
-                
-                self.generate_button.config(state=tk.NORMAL)
+                self.ui.call(self.generate_button.config, state=tk.NORMAL)
                 
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to load model: {str(e)}")
-                self.status_var.set("Model loading failed")
+                self.ui.call(messagebox.showerror, "Error", f"Failed to load model: {str(e)}")
+                self.set_status("Model loading failed")
             finally:
-                self.progress.stop()
-                self.load_button.config(state=tk.NORMAL)
+                self.ui.call(self.load_button.config, state=tk.NORMAL)
         
-        threading.Thread(target=load_in_thread, daemon=True).start()
+        self.scheduler.submit(load_job, PRIORITY_LOAD, f"Load {model_name}")
+    
+    def make_local_engine(self):
+        """An in-process engine with the cache and decode settings of the checkboxes"""
+        engine = ZImageEngine(output_dir=self.output_dir, status_callback=self.set_status, metrics=self.metrics,
+                              result_cache=self.result_cache if self.result_cache_var.get() else None,
+                              tiled_decode="auto" if self.tiled_decode_var.get() else "off",
+                              memory_estimator=self.memory_estimator)
+        engine.embedding_cache.set_disk_dir(self.embedding_disk_dir())
+        return engine
+    
+    def show_memory_status(self):
+        """Show the placement and resident memory; the memory check may have switched placement"""
+        if self.engine.active_placement is not None:
+            self.ui.latest("memory", self.memory_status.set,
+                           f"{PLACEMENTS[self.engine.active_placement]}: {self.engine.memory_description}")
+    
+    def calibrate_memory(self):
+        """Measure a few one-step generations to fit the GPU memory model"""
+        if not isinstance(self.engine, ZImageEngine) or not self.engine.is_loaded:
+            messagebox.showwarning("Warning", "Load a model in this window first")
+            return
         
-    def adjust_dimensions_for_model(self, width, height):
-        """Adjust dimensions to be divisible by 16 while preserving aspect ratio"""
-        # Round down to nearest multiple of 16
-        adjusted_width = (width // 16) * 16
-        adjusted_height = (height // 16) * 16
+        def calibrate_job(job):
+            try:
+                model = self.engine.calibrate_memory()
+                self.set_status(f"GPU memory model: {model.describe()}")
+            except Exception as e:
+                self.ui.call(messagebox.showerror, "Error", f"Memory calibration failed: {str(e)}")
+                self.set_status("Memory calibration failed")
         
-        # Ensure minimum dimensions
-        if adjusted_width < 256:
-            adjusted_width = 256
-        if adjusted_height < 256:
-            adjusted_height = 256
+        self.scheduler.submit(calibrate_job, PRIORITY_INTERACTIVE, "Calibrate memory")
+    
+    def warm_up_selected(self, event=None):
+        """Queue a background warm-up of the selected resolution when the model is compiled"""
+        if not isinstance(self.engine, ZImageEngine) or self.engine.compile_stats is None:
+            return
+        width, height = self.get_resolution()
+        if self.engine.is_warm(width, height):
+            return
         
-        return adjusted_width, adjusted_height
+        def warm_up_job(job):
+            if self.engine.compile_stats is None or self.engine.is_warm(width, height):
+                return
+            try:
+                self.engine.warm_up(width, height, step_callback=job.step_callback)
+            except JobCancelled:
+                self.set_status("Warm-up cancelled")
+            except Exception as e:
+                self.set_status(f"Warm-up of {width}x{height} failed: {e}")
+        
+        # Queued behind interactive generations, which would compile the size themselves anyway
+        self.scheduler.submit(warm_up_job, PRIORITY_BATCH, f"Warm up {width}x{height}")
+    
+    def toggle_prompt_cache_persistence(self):
+        """Enable or disable the on-disk prompt embedding cache"""
+        if self.engine.embedding_cache is None:
+            return
+        self.engine.embedding_cache.set_disk_dir(self.embedding_disk_dir())
+    
+    def embedding_disk_dir(self):
+        return os.path.join("cache", "embeddings") if self.persist_cache_var.get() else None
+    
+    def toggle_result_cache(self):
+        """Enable or disable lookups in the seeded result cache"""
+        if isinstance(self.engine, ZImageEngine):
+            self.engine.result_cache = self.result_cache if self.result_cache_var.get() else None
+    
+    def toggle_tiled_decode(self):
+        """Tile the VAE decode above the engine's pixel threshold, or never"""
+        if isinstance(self.engine, ZImageEngine):
+            self.engine.tiled_decode = "auto" if self.tiled_decode_var.get() else "off"
+    
+    def get_output_format(self):
+        return OutputFormat.parse(FORMAT_PRESETS[self.output_format_var.get()])
+    
+    def get_resolution(self):
+        """Return the selected resolution as a (width, height) tuple"""
+        resolution = self.resolution_var.get()
+        return tuple(map(int, resolution.split('x')))
+    
+    def read_image_settings(self):
+        """Read resolution, steps, guidance and seed from the widgets"""
+        width, height = self.get_resolution()
+        steps = int(self.steps_var.get())
+        guidance = float(self.guidance_var.get())
+        seed = self.seed_var.get() or None
+        return width, height, steps, guidance, seed
     
     def generate(self):
-        if not self.pipeline:
+        if not self.engine.is_loaded:
             messagebox.showwarning("Warning", "Please load a model first")
             return
             
@@ -564,87 +757,272 @@ class ZImageGUI:
         if not prompt:
             messagebox.showwarning("Warning", "Please enter a prompt")
             return
+        
+        # Capture settings now; the job may run after the widgets have changed
+        try:
+            width, height, steps, guidance, seed = self.read_image_settings()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid settings: {str(e)}")
+            return
             
-        def generate_in_thread():
+        def generate_job(job):
             try:
-                self.status_var.set("Generating...")
-                self.progress.start()
-                self.generate_button.config(state=tk.DISABLED)
-                
-                # Get parameters and adjust for model requirements
-                resolution = self.resolution_var.get()
-                width, height = map(int, resolution.split('x'))
-                
-                # Adjust dimensions to be divisible by 16
-                adjusted_width, adjusted_height = self.adjust_dimensions_for_model(width, height)
-                
-                # Show if dimensions were adjusted
-                if (width, height) != (adjusted_width, adjusted_height):
-                    self.status_var.set(f"Adjusted dimensions: {width}x{height} → {adjusted_width}x{adjusted_height}")
-                
-                steps = int(self.steps_var.get())
-                guidance = float(self.guidance_var.get())
+                self.set_status("Generating...")
+                job.progress = self.make_step_progress()
                 
-                seed = self.seed_var.get()
-                if seed:
-                    generator = torch.Generator().manual_seed(int(seed))
+                # Generate image, stopping at the next step if the job is cancelled
+                self.current_image = self.engine.generate(prompt, width, height, steps, guidance, seed,
+                                                          step_callback=job.step_callback, queue_wait=job.queue_wait)
+                ready_at = time.perf_counter()
+                if getattr(self.engine, "last_result_cached", None):
+                    message = f"Image loaded from result cache ({self.result_cache.describe()})"
+                elif job.progress.preview_times:
+                    message = f"Image generated successfully (preview overhead {job.progress.preview_share:.0%})"
                 else:
-                    generator = None
+                    message = "Image generated successfully"
                 
-                # Generate image
-                self.status_var.set("Generating image...")
-                result = self.pipeline(
-                    prompt=prompt,
-                    width=adjusted_width,
-                    height=adjusted_height,
-                    num_inference_steps=steps,
-                    guidance_scale=guidance,
-                    generator=generator
-                )
+                # Pyramid and fitted render are built here; the Tk thread only hands the render to the canvas
+                frame = prepare_display(self.current_image, self.canvas_size, margin=self.render_margin,
+                                        ready_at=ready_at)
+                self.ui.call(self.show_frame, frame, message)
+                self.history_pool.submit(self.add_to_history, self.current_image, prompt[:40], select=True,
+                                         prompt=prompt, seed=seed)
                 
-                # Debug: Check if result has images
-                if hasattr(result, 'images') and len(result.images) > 0:
-                    self.current_image = result.images[0]
-                    self.status_var.set(f"Image generated: {self.current_image.size}")
-                    self.display_image(self.current_image)
-                    self.status_var.set("Image generated successfully")
-                else:
-                    self.status_var.set("Error: No image in result")
-                    messagebox.showerror("Error", "Generation completed but no image was produced")
-                
-                self.save_button.config(state=tk.NORMAL)
+                self.ui.call(self.save_button.config, state=tk.NORMAL)
                 
+            except JobCancelled:
+                self.set_status("Generation cancelled")
+            except InsufficientMemory as e:
+                self.ui.call(messagebox.showwarning, "Not Enough GPU Memory", str(e))
+                self.set_status("Generation not started: not enough GPU memory")
             except Exception as e:
-                messagebox.showerror("Error", f"Generation failed: {str(e)}")
-                self.status_var.set("Generation failed")
+                self.ui.call(messagebox.showerror, "Error", f"Generation failed: {str(e)}")
+                self.set_status("Generation failed")
             finally:
-                self.progress.stop()
-                self.generate_button.config(state=tk.NORMAL)
+                self.show_memory_status()
         
-        threading.Thread(target=generate_in_thread, daemon=True).start()
+        # Interactive generations jump ahead of queued batch items
+        self.scheduler.submit(generate_job, PRIORITY_INTERACTIVE, f"Generate: {prompt[:40]}")
+    
+    def make_step_progress(self):
+        """Step progress reporter for the job that is about to run, posting to the Tk thread"""
+        def on_progress(step, total_steps, seconds_per_step, eta):
+            self.step_state = (step, total_steps)
+            self.set_status(format_progress(step, total_steps, seconds_per_step, eta))
+        
+        def on_preview(image, step):
+            # Scaled here, and only the newest preview is drawn when steps outpace the frame rate
+            self.ui.latest("preview", self.show_preview, prepare_preview(image, self.canvas_size), step)
+        
+        self.step_state = None
+        return StepProgress(on_progress=on_progress, on_preview=on_preview if self.live_preview else None)
+    
+    def toggle_live_preview(self):
+        self.live_preview = self.live_preview_var.get()
+    
+    def show_preview(self, image, step=None):
+        """Show a latent preview already scaled to fit the canvas (see prepare_preview)"""
+        canvas_width, canvas_height = self.get_canvas_size()
+        photo = ImageTk.PhotoImage(image)
         
-    def display_image(self, image):
-        if image is None:
-            self.status_var.set("Error: No image to display")
-            return
-            
+        self.canvas.delete("all")
+        self.canvas_image = self.canvas.create_image(canvas_width // 2, canvas_height // 2, anchor=tk.CENTER, image=photo)
+        self.canvas.image = photo
+        # The preview is not part of the zoomed image; the next render replaces it
+        self.rendered_box = None
+    
+    def refresh_queue(self):
+        """Redraw the queue list and drive the progress bar from the scheduler state"""
+        jobs = self.scheduler.jobs()
+        self.queue_job_ids = [job.id for job in jobs]
+        
+        selected = self.queue_list.curselection()
+        selected_id = self.queue_job_ids[selected[0]] if selected and selected[0] < len(self.queue_job_ids) else None
+        
+        self.queue_list.delete(0, tk.END)
+        for i, job in enumerate(jobs):
+            marker = "▶" if job.status == "running" else " "
+            self.queue_list.insert(tk.END, f"{marker} {job.description}")
+            if job.id == selected_id:
+                self.queue_list.selection_set(i)
+        
+        # Determinate per-step progress while a pipeline call reports steps,
+        # indeterminate for other work (e.g. loading), idle when the queue is empty
+        running = jobs[0] if jobs and jobs[0].status == "running" else None
+        step_state = self.step_state if running is not None and running.progress is not None else None
+        if step_state is not None:
+            if self.progress_mode != "determinate":
+                self.progress.stop()
+                self.progress.config(mode="determinate")
+                self.progress_mode = "determinate"
+            step, total_steps = step_state
+            self.progress.config(maximum=total_steps, value=step)
+        elif jobs:
+            if self.progress_mode != "indeterminate":
+                self.progress.config(mode="indeterminate", value=0)
+                self.progress.start()
+                self.progress_mode = "indeterminate"
+        elif self.progress_mode is not None:
+            self.progress.stop()
+            self.progress.config(mode="determinate", value=0)
+            self.progress_mode = None
+        
+        self.root.after(250, self.refresh_queue)
+    
+    def selected_job(self):
+        selection = self.queue_list.curselection()
+        if not selection or selection[0] >= len(self.queue_job_ids):
+            return None
+        return self.scheduler.find(self.queue_job_ids[selection[0]])
+    
+    def cancel_selected_job(self):
+        """Cancel the job selected in the queue list"""
+        job = self.selected_job()
+        if job is not None:
+            self.scheduler.cancel(job.id)
+    
+    def cancel_batch(self):
+        """Cancel every job of the selected batch, or of the oldest batch if none is selected"""
+        job = self.selected_job()
+        group = job.group if job is not None else None
+        if group is None:
+            groups = [j.group for j in self.scheduler.jobs() if j.group is not None]
+            group = groups[0] if groups else None
+        if group is not None:
+            count = self.scheduler.cancel_group(group)
+            self.set_status(f"Cancelled {count} batch jobs")
+        
+    def show_frame(self, frame, message=None):
+        """Show an image prepared off the Tk thread by prepare_display, reporting its time to first pixel"""
         try:
-            # Store original image
-            self.original_image = image
+            if self.pyramid is not None and self.pyramid is not frame.pyramid:
+                self.pyramid.release()
+            self.original_image = frame.pyramid.image
+            self.pyramid = frame.pyramid
             
-            # Fit to window by default
-            self.fit_to_window()
+            if frame.canvas_size != self.get_canvas_size():
+                # The canvas was resized while the frame was prepared; fit to the new size
+                self.fit_to_window()
+            else:
+                # A direct render supersedes any pending coalesced render
+                for job in (self._render_job, self._idle_render_job):
+                    if job is not None:
+                        self.root.after_cancel(job)
+                self._render_job = self._idle_render_job = None
+                
+                self.zoom_level = frame.zoom
+                self.image_x, self.image_y = frame.offset
+                self.canvas.delete("all")
+                self.canvas_image = None
+                self.canvas.image = None
+                self.rendered_box = frame.dest_box
+                self.rendered_quality = True
+                if frame.image is not None:
+                    photo = ImageTk.PhotoImage(frame.image)
+                    self.canvas_image = self.canvas.create_image(frame.dest_box[0], frame.dest_box[1],
+                                                                 anchor=tk.NW, image=photo)
+                    self.canvas.image = photo
+                self.update_zoom_label()
+            
+            first_pixel = frame.shown()
+            if self.metrics is not None:
+                self.metrics.record_display(first_pixel, *self.original_image.size, frame.prepare_seconds)
+            img_width, img_height = self.original_image.size
+            message = message or f"Image displayed: {img_width}x{img_height} at {int(self.zoom_level * 100)}%"
+            self.status_var.set(f"{message} - first pixel after {first_pixel * 1000:.0f} ms")
             
         except Exception as e:
             self.status_var.set(f"Error displaying image: {str(e)}")
             messagebox.showerror("Display Error", f"Failed to display image: {str(e)}")
     
-    def update_canvas_image(self):
-        """Update the canvas with the current zoom level and position"""
-        if not hasattr(self, 'original_image') or self.original_image is None:
+    def add_to_history(self, image, label, path=None, select=False, **info):
+        """Add a result to the history strip; runs in worker threads"""
+        try:
+            entry = self.history.add(image, label, path, **info)
+        except Exception as e:
+            self.set_status(f"Could not add {label} to the history: {e}")
             return
-            
-        # Get canvas dimensions
+        if select:
+            self.history_selected = entry.id
+        self.ui.latest("history", self.draw_history)
+    
+    def draw_history(self):
+        """Draw the history thumbnails in view, newest first"""
+        canvas = self.history_canvas
+        entries = self.history.entries()
+        slot = self.history_slot
+        width = canvas.winfo_width()
+        canvas.delete("all")
+        canvas.config(scrollregion=(0, 0, max(len(entries) * slot, width), slot))
+        
+        left = int(canvas.canvasx(0))
+        photos = {}
+        for position in range(max(0, left // slot), min(len(entries), (left + width) // slot + 1)):
+            entry = entries[len(entries) - 1 - position]
+            photo = self.history_photos.get(entry.id) or ImageTk.PhotoImage(entry.thumbnail)
+            photos[entry.id] = photo
+            x = position * slot + slot // 2
+            canvas.create_image(x, slot // 2, anchor=tk.CENTER, image=photo)
+            if entry.id == self.history_selected:
+                canvas.create_rectangle(x - slot // 2 + 1, 1, x + slot // 2 - 1, slot - 1, outline="#4a90d9", width=2)
+        # Thumbnails scrolled out of view give up their PhotoImage
+        self.history_photos = photos
+    
+    def scroll_history(self, *args):
+        self.history_canvas.xview(*args)
+        self.draw_history()
+    
+    def on_history_wheel(self, event):
+        """Scroll the history strip one thumbnail per wheel step"""
+        if event.num == 4 or (event.delta or 0) > 0:
+            self.history_canvas.xview_scroll(-1, "units")
+        else:
+            self.history_canvas.xview_scroll(1, "units")
+        self.draw_history()
+    
+    def on_history_click(self, event):
+        """Show the clicked history result, reloading it in the background if it was evicted"""
+        entries = self.history.entries()
+        position = int(self.history_canvas.canvasx(event.x)) // self.history_slot
+        if not 0 <= position < len(entries):
+            return
+        entry = entries[len(entries) - 1 - position]
+        self.history_selected = entry.id
+        self.draw_history()
+        self.status_var.set(f"Loading {entry.describe()}...")
+        self.history_pool.submit(self.show_history_entry, entry, time.perf_counter())
+    
+    def show_history_entry(self, entry, clicked_at):
+        """Load an entry's full image and prepare it for display; runs in a worker thread"""
+        # A later click supersedes this one
+        if self.history_selected != entry.id:
+            return
+        try:
+            # Shown first; evicting older images to make room for it comes after
+            image = self.history.image(entry.id, trim=False)
+            if image is None:
+                self.set_status(f"{entry.describe()} is no longer available")
+                return
+            frame = prepare_display(image, self.canvas_size, margin=self.render_margin, ready_at=clicked_at)
+        except Exception as e:
+            self.set_status(f"Failed to load {entry.describe()}: {str(e)}")
+            return
+        if self.history_selected != entry.id:
+            frame.pyramid.release()
+            return
+        self.current_image = image
+        self.ui.call(self.show_frame, frame, f"History: {entry.describe()}")
+        self.ui.call(self.save_button.config, state=tk.NORMAL)
+        self.history.trim()
+    
+    def on_canvas_configure(self, event):
+        """Remember the canvas size for worker threads, then re-render for the new size"""
+        if event.width > 1 and event.height > 1:
+            self.canvas_size = (event.width, event.height)
+        self.request_render()
+    
+    def get_canvas_size(self):
+        """Return the canvas size, falling back to the default before it is rendered"""
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
         
@@ -652,30 +1030,57 @@ class ZImageGUI:
             # Canvas not yet rendered, use default values
             canvas_width = 600
             canvas_height = 600
+        return canvas_width, canvas_height
+    
+    def update_canvas_image(self, fast=False):
+        """Render the visible part of the image at the current zoom level and position"""
+        if not hasattr(self, 'original_image') or self.original_image is None:
+            return
+        
+        # A direct render supersedes any pending coalesced render
+        if self._render_job is not None:
+            self.root.after_cancel(self._render_job)
+            self._render_job = None
+        if not fast and self._idle_render_job is not None:
+            self.root.after_cancel(self._idle_render_job)
+            self._idle_render_job = None
+            
+        canvas_width, canvas_height = self.get_canvas_size()
         
         # Calculate display size with zoom
         img_width, img_height = self.original_image.size
         display_width = int(img_width * self.zoom_level)
         display_height = int(img_height * self.zoom_level)
         
-        # Resize image for display
-        if self.zoom_level != 1.0:
-            display_image = self.original_image.resize((display_width, display_height), Image.Resampling.LANCZOS)
-        else:
-            display_image = self.original_image
-        
-        # Convert to PhotoImage
-        photo = ImageTk.PhotoImage(display_image)
-        
-        # Clear canvas and display image
-        self.canvas.delete("all")
-        
         # Calculate position to center image if at fit-to-window or initial position
         if self.image_x == 0 and self.image_y == 0:
             self.image_x = (canvas_width - display_width) // 2
             self.image_y = (canvas_height - display_height) // 2
         
-        self.canvas_image = self.canvas.create_image(self.image_x, self.image_y, anchor=tk.NW, image=photo)
+        # Clear canvas
+        self.canvas.delete("all")
+        self.canvas_image = None
+        self.canvas.image = None
+        
+        # Only resample the part of the image that is on screen (plus a margin for panning)
+        region = visible_region(self.original_image.size, self.zoom_level, (self.image_x, self.image_y),
+                                (canvas_width, canvas_height), margin=self.render_margin)
+        self.rendered_box = region[1] if region else None
+        self.rendered_quality = not fast
+        if region is None:
+            return
+        source_box, dest_box = region
+        dest_size = (dest_box[2] - dest_box[0], dest_box[3] - dest_box[1])
+        
+        # Use a fast filter while the user is interacting, LANCZOS once idle;
+        # the pyramid resamples from the nearest larger mipmap level
+        resample = Image.Resampling.BILINEAR if fast else Image.Resampling.LANCZOS
+        display_image = self.pyramid.render(self.zoom_level, source_box, dest_size, resample)
+        
+        # Convert to PhotoImage
+        photo = ImageTk.PhotoImage(display_image)
+        
+        self.canvas_image = self.canvas.create_image(dest_box[0], dest_box[1], anchor=tk.NW, image=photo)
         
         # Keep reference to prevent garbage collection
         self.canvas.image = photo
@@ -683,6 +1088,50 @@ class ZImageGUI:
         # Update status
         self.status_var.set(f"Image displayed: {img_width}x{img_height} at {int(self.zoom_level * 100)}%")
     
+    def request_render(self):
+        """Schedule a coalesced fast render followed by a high quality render once idle"""
+        if not hasattr(self, 'original_image') or self.original_image is None:
+            return
+        
+        # At most one interactive render per frame, however many events arrive
+        if self._render_job is None:
+            self._render_job = self.root.after(self.render_delay_ms, self._render_fast)
+        
+        # Restart the idle timer on every interaction
+        if self._idle_render_job is not None:
+            self.root.after_cancel(self._idle_render_job)
+        self._idle_render_job = self.root.after(self.idle_render_delay_ms, self._render_idle)
+    
+    def _render_fast(self):
+        self._render_job = None
+        self.update_canvas_image(fast=True)
+    
+    def _render_idle(self):
+        self._idle_render_job = None
+        if not self.rendered_quality or not self.view_is_rendered():
+            self.update_canvas_image()
+    
+    def view_is_rendered(self):
+        """Return True if the rendered canvas image still covers everything visible"""
+        region = visible_region(self.original_image.size, self.zoom_level, (self.image_x, self.image_y),
+                                self.get_canvas_size())
+        return covers(self.rendered_box, region[1] if region else None)
+    
+    def pan_image(self, dx, dy):
+        """Move the image by shifting the canvas item, re-rendering only if new areas come into view"""
+        if not hasattr(self, 'original_image') or self.original_image is None:
+            return
+        
+        self.image_x += dx
+        self.image_y += dy
+        
+        if self.canvas_image is not None:
+            self.canvas.move(self.canvas_image, dx, dy)
+            self.rendered_box = shift_box(self.rendered_box, dx, dy)
+        
+        if not self.view_is_rendered():
+            self.request_render()
+    
     def zoom_in(self):
         """Zoom in the image"""
         if self.zoom_level < self.max_zoom:
@@ -709,7 +1158,7 @@ class ZImageGUI:
             self.image_x = image_center_x - new_display_width / 2
             self.image_y = image_center_y - new_display_height / 2
             
-            self.update_canvas_image()
+            self.request_render()
             self.update_zoom_label()
     
     def zoom_out(self):
@@ -738,7 +1187,7 @@ class ZImageGUI:
             self.image_x = image_center_x - new_display_width / 2
             self.image_y = image_center_y - new_display_height / 2
             
-            self.update_canvas_image()
+            self.request_render()
             self.update_zoom_label()
     
     def fit_to_window(self, event=None):
@@ -853,7 +1302,7 @@ class ZImageGUI:
         self.image_x = mouse_x - new_mouse_image_x
         self.image_y = mouse_y - new_mouse_image_y
         
-        self.update_canvas_image()
+        self.request_render()
         self.update_zoom_label()
     
     def on_drag_start(self, event):
@@ -868,16 +1317,12 @@ class ZImageGUI:
             dx = event.x - self.drag_start_x
             dy = event.y - self.drag_start_y
             
-            # Update image position
-            self.image_x += dx
-            self.image_y += dy
-            
             # Update drag start position
             self.drag_start_x = event.x
             self.drag_start_y = event.y
             
-            # Update canvas
-            self.update_canvas_image()
+            # Shift the existing canvas image instead of re-rendering
+            self.pan_image(dx, dy)
     
     def on_drag_end(self, event):
         """End dragging"""
@@ -887,23 +1332,19 @@ class ZImageGUI:
     
     def move_image_left(self, event):
         """Move image left using arrow key"""
-        self.image_x -= 20
-        self.update_canvas_image()
+        self.pan_image(-20, 0)
     
     def move_image_right(self, event):
         """Move image right using arrow key"""
-        self.image_x += 20
-        self.update_canvas_image()
+        self.pan_image(20, 0)
     
     def move_image_up(self, event):
         """Move image up using arrow key"""
-        self.image_y -= 20
-        self.update_canvas_image()
+        self.pan_image(0, -20)
     
     def move_image_down(self, event):
         """Move image down using arrow key"""
-        self.image_y += 20
-        self.update_canvas_image()
+        self.pan_image(0, 20)
     
     def on_prompt_focus_in(self, event):
         """Handle prompt text box getting focus"""
@@ -935,21 +1376,25 @@ class ZImageGUI:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             prompt = self.prompt_text.get("1.0", tk.END).strip()
             prompt_short = prompt[:50].replace(" ", "_").replace("/", "_").replace("\\", "_")
-            default_filename = f"zimage_{timestamp}_{prompt_short}.png"
+            output_format = self.get_output_format()
+            default_filename = output_format.filename(f"zimage_{timestamp}_{prompt_short}")
             
-            # Open file dialog to select save location
+            # Open file dialog to select save location; the selected format is offered first
+            filetypes = [("PNG files", "*.png"), ("WebP files", "*.webp"), ("JPEG files", "*.jpg *.jpeg"),
+                         ("NumPy arrays", "*.npy")]
+            filetypes.sort(key=lambda filetype: output_format.extension not in filetype[1])
             filepath = filedialog.asksaveasfilename(
                 title="Save Image",
-                defaultextension=".png",
-                filetypes=[("PNG files", "*.png"), ("JPEG files", "*.jpg"), ("All files", "*.*")],
+                defaultextension=output_format.extension,
+                filetypes=filetypes + [("All files", "*.*")],
                 initialfile=default_filename
             )
             
             if not filepath:
                 return  # User cancelled
             
-            # Save image to selected location
-            self.current_image.save(filepath)
+            # Save image to selected location; a different extension picks its own format
+            save_image(self.current_image, filepath, output_format)
             self.status_var.set(f"Image saved: {os.path.basename(filepath)}")
             messagebox.showinfo("Success", f"Image saved to:\n{filepath}")
             
@@ -960,78 +1405,242 @@ class ZImageGUI:
         try:
             filename = filedialog.askopenfilename(
                 title="Load Prompts File",
-                filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+                filetypes=[("Prompt files", "*.txt *.jsonl *.csv"), ("Text files", "*.txt"),
+                           ("JSON lines", "*.jsonl"), ("CSV files", "*.csv"), ("All files", "*.*")]
             )
             
             if not filename:
                 return
+            
+            # Large files are never pasted into the prompt box; batches read them from disk
+            if os.path.getsize(filename) > STREAM_THRESHOLD_BYTES:
+                self.open_prompt_file(filename)
+                return
                 
-            with open(filename, 'r', encoding='utf-8') as f:
-                prompts = f.read()
+            # Prompts with their own settings are shown as one JSON object per line
+            prompts = read_prompt_file(filename)
                 
             # Clear and set new prompts
+            self.clear_prompt_file()
             self.prompt_text.delete("1.0", tk.END)
-            self.prompt_text.insert("1.0", prompts)
+            self.prompt_text.insert("1.0", "\n".join(format_prompt_line(prompt) for prompt in prompts))
             
-            self.status_var.set(f"Loaded {len(prompts.splitlines())} prompts from {os.path.basename(filename)}")
+            self.status_var.set(f"Loaded {len(prompts)} prompts from {os.path.basename(filename)}")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load prompts: {str(e)}")
+    
+    def open_prompt_file(self, filename):
+        """Scan a large prompt file in the background and use it for the next batches"""
+        name = os.path.basename(filename)
+        self.status_var.set(f"Scanning {name}...")
+        
+        def on_scan_progress(done, size):
+            self.set_status(f"Scanning {name}: {done / size:.0%}")
+        
+        def scan_in_thread():
+            try:
+                prompts = PromptFile.open(filename, progress_callback=on_scan_progress)
+                preview = prompts.preview(self.preview_prompts)
+            except Exception as e:
+                self.ui.call(messagebox.showerror, "Error", f"Failed to load prompts: {str(e)}")
+                self.set_status(f"Could not load {name}")
+                return
+            self.ui.call(self.show_prompt_file, prompts, preview)
+        
+        threading.Thread(target=scan_in_thread, daemon=True).start()
+    
+    def show_prompt_file(self, prompts, preview):
+        """Show a scanned prompt file: a preview in the prompt box and its size below"""
+        self.clear_prompt_file()
+        self.prompt_file = prompts
+        self.prompt_text.delete("1.0", tk.END)
+        self.prompt_text.insert("1.0", "\n".join(format_prompt_line(prompt) for prompt in preview))
+        self.prompt_file_var.set(f"Batch prompts: {prompts.describe()} (first {len(preview)} shown above)")
+        self.prompt_file_frame.pack(fill=tk.X, pady=2)
+        self.status_var.set(f"Loaded {len(prompts):,} prompts from {os.path.basename(prompts.path)}")
+    
+    def clear_prompt_file(self):
+        """Go back to batching the prompts typed in the prompt box"""
+        if self.prompt_file is not None:
+            self.prompt_file.close()
+            self.prompt_file = None
+        self.prompt_file_var.set("")
+        self.prompt_file_frame.pack_forget()
                 
     def batch_generate(self):
-        prompts_text = self.prompt_text.get("1.0", tk.END).strip()
-        prompts = [p.strip() for p in prompts_text.split('\n') if p.strip()]
+        if self.prompt_file is not None:
+            prompts = self.prompt_file
+        else:
+            prompts_text = self.prompt_text.get("1.0", tk.END).strip()
+            try:
+                prompts = parse_prompt_lines(prompts_text.split('\n'))
+            except ValueError as e:
+                messagebox.showerror("Error", f"Invalid prompt: {str(e)}")
+                return
         
         if not prompts:
             messagebox.showwarning("Warning", "No prompts found")
             return
             
-        if not self.pipeline:
+        if not self.engine.is_loaded:
             messagebox.showwarning("Warning", "Please load a model first")
             return
-            
-        def batch_generate_in_thread():
+        
+        try:
+            width, height, steps, guidance, seed = self.read_image_settings()
+            batch_size = max(1, int(self.batch_size_var.get() or 1))
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid settings: {str(e)}")
+            return
+        
+        # The manifest records every finished prompt so the batch can be resumed
+        try:
+            manifest = BatchManifest.create(self.output_dir, prompts, width, height, steps, guidance,
+                                            seed=seed, model=self.engine.model_name,
+                                            output_format=self.get_output_format())
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to create batch manifest: {str(e)}")
+            return
+        self.submit_batch(manifest, batch_size)
+    
+    def resume_batch(self):
+        """Pick a batch manifest and generate the prompts it does not list as done"""
+        if not self.engine.is_loaded:
+            messagebox.showwarning("Warning", "Please load a model first")
+            return
+        
+        filename = filedialog.askopenfilename(
+            title="Select Batch Manifest",
+            initialdir=self.output_dir,
+            filetypes=[("Batch manifests", "*" + MANIFEST_SUFFIX), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        try:
+            batch_size = max(1, int(self.batch_size_var.get() or 1))
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid settings: {str(e)}")
+            return
+        
+        # A streamed batch re-scans its prompt file, so load the manifest off the Tk thread
+        self.status_var.set(f"Opening {os.path.basename(filename)}...")
+        
+        def load_in_thread():
             try:
-                self.status_var.set("Batch generating...")
-                self.progress.start()
-                self.generate_button.config(state=tk.DISABLED)
-                
-                # Get parameters and adjust for model requirements
-                resolution = self.resolution_var.get()
-                width, height = map(int, resolution.split('x'))
-                
-                # Adjust dimensions to be divisible by 16
-                adjusted_width, adjusted_height = self.adjust_dimensions_for_model(width, height)
-                
-                steps = int(self.steps_var.get())
-                guidance = float(self.guidance_var.get())
-                
-                for i, prompt in enumerate(prompts):
-                    self.status_var.set(f"Generating {i+1}/{len(prompts)}: {prompt[:50]}...")
-                    
-                    result = self.pipeline(
-                        prompt=prompt,
-                        width=adjusted_width,
-                        height=adjusted_height,
-                        num_inference_steps=steps,
-                        guidance_scale=guidance
-                    )
-                    
-                    # Save each image
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = os.path.join(self.output_dir, f"batch_{timestamp}_{i+1:03d}.png")
-                    result.images[0].save(filename)
-                
-                self.status_var.set(f"Batch complete: {len(prompts)} images saved")
-                
+                manifest = BatchManifest.load(filename)
+                description = manifest.describe()
+            except (OSError, ValueError) as e:
+                self.ui.call(messagebox.showerror, "Error", f"Cannot resume batch: {str(e)}")
+                self.set_status("Cannot resume batch")
+                return
+            self.ui.call(self.start_resumed_batch, manifest, description, batch_size)
+        
+        threading.Thread(target=load_in_thread, daemon=True).start()
+    
+    def start_resumed_batch(self, manifest, description, batch_size):
+        if next(manifest.iter_pending(), None) is None:
+            messagebox.showinfo("Resume Batch", f"Nothing to resume: {description}")
+            return
+        self.status_var.set(f"Resuming batch {manifest.batch_id}: {description}")
+        self.submit_batch(manifest, batch_size)
+    
+    def submit_batch(self, manifest, batch_size):
+        """Queue the pending prompts of a manifest as one job per micro-batch
+
+        Jobs are queued one window of prompts at a time by a feeder job that
+        runs after them, so the queue (and memory) stays small however many
+        prompts the batch has.
+        """
+        header = manifest.header
+        prompts = manifest.prompts
+        width, height, steps, guidance = header["width"], header["height"], header["steps"], header["guidance"]
+        streamed = isinstance(prompts, PromptFile)
+        
+        # Each micro-batch is its own job so interactive generations can run in between
+        self.batch_counter += 1
+        batch_number = self.batch_counter
+        group = f"batch-{batch_number}"
+        total = len(prompts)
+        prompt_windows = windows(range(total), self.batch_window)
+        # Written images join the history from the writer thread, which has them at hand
+        writer = ImageWriter(on_written=lambda image, filepath: self.add_to_history(
+            image, os.path.basename(filepath), path=filepath), status_callback=self.set_status)
+        state = {"saved": 0, "already_done": 0, "read": 0}
+        
+        def chunk_job(job, indexes):
+            try:
+                job.progress = self.make_step_progress()
+                saved = self.engine.batch_generate(
+                    [prompts[index] for index in indexes], width, height, steps, guidance,
+                    batch_size=batch_size, writer=writer, manifest=manifest, indexes=indexes,
+                    step_callback=job.step_callback, total=total, queue_wait=job.queue_wait,
+                    # Buckets finish out of index order; finish_job ends the batch
+                    final=False)
+                state["saved"] += len(saved)
+                if streamed:
+                    # Progress through a streamed file by byte offset
+                    state["read"] = max(state["read"], max(indexes) + 1)
+                    done = state["already_done"] + state["saved"]
+                    self.set_status(f"Batch {batch_number}: {prompts.fraction(state['read']):.1%} of "
+                                    f"{os.path.basename(prompts.path)} read, {done:,}/{total:,} images")
+            except JobCancelled:
+                raise
             except Exception as e:
-                messagebox.showerror("Error", f"Batch generation failed: {str(e)}")
-                self.status_var.set("Batch generation failed")
-            finally:
-                self.progress.stop()
-                self.generate_button.config(state=tk.NORMAL)
+                self.scheduler.cancel_group(group)
+                self.ui.call(messagebox.showerror, "Error", f"Batch generation failed: {str(e)}")
+                self.set_status("Batch generation failed")
+                raise
+        
+        def feed_job(job):
+            window = None if job.cancelled else next(prompt_windows, None)
+            if window is None:
+                finish_job(job)
+                return
+            # Prompts sharing a shape and settings are queued together so each job is one full pipeline call
+            pending = [(index, prompts[index]) for index in window if not manifest.is_done(index)]
+            state["already_done"] += len(window) - len(pending)
+            for bucket in bucket_prompts(pending, width, height, steps, guidance):
+                for start in range(0, len(bucket), batch_size):
+                    indexes = [index for index, _ in bucket[start:start + batch_size]]
+                    if len(indexes) == 1:
+                        label = f"Batch {batch_number}: {indexes[0] + 1}/{total}"
+                    else:
+                        label = f"Batch {batch_number}: {len(indexes)} prompts from {indexes[0] + 1}/{total}"
+                    self.scheduler.submit(
+                        lambda job, indexes=indexes: chunk_job(job, indexes),
+                        PRIORITY_BATCH, label, group=group)
+            submit_feed()
+        
+        def on_feed_done(job):
+            # A cancelled batch still has to flush what it wrote so far; the
+            # finishing job is not part of the group, so it survives the cancel
+            if job.status == CANCELLED:
+                self.scheduler.submit(finish_job, PRIORITY_BATCH, f"Batch {batch_number}: finish writing")
+        
+        def submit_feed():
+            self.scheduler.submit(feed_job, PRIORITY_BATCH, f"Batch {batch_number}: queue next prompts",
+                                  group=group, on_done=on_feed_done)
+        
+        def finish_job(job):
+            try:
+                writer.close()
+            except Exception as e:
+                self.ui.call(messagebox.showerror, "Error", f"Failed to save batch images: {str(e)}")
+            try:
+                self.engine.finish_batch()
+            except Exception as e:
+                self.set_status(f"Could not restore the model placement: {e}")
+            done = state["already_done"] + state["saved"]
+            if done < total:
+                self.set_status(f"Batch {batch_number} stopped: {done}/{total} images saved "
+                                f"(resume with {os.path.basename(manifest.path)})")
+            else:
+                self.set_status(f"Batch complete: {total} images saved ({writer.describe()})")
+            self.show_memory_status()
         
-        threading.Thread(target=batch_generate_in_thread, daemon=True).start()
+        submit_feed()
 
 def main():
     root = tk.Tk()